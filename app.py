@@ -1,39 +1,85 @@
-from collections import defaultdict
+import argparse
 from datetime import datetime
+import logging
+import multiprocessing
 import os
 import queue
 import re
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from tkinter.scrolledtext import ScrolledText
 
-from crawler import Crawler
+from events import (
+    CANCELLED, FAILED, PAUSED, PROGRESS, RESUMED, TERMINAL_EVENTS)
+from metrics import format_latency
 
 
 class ControlUi(object):
-    """Crawlerコントロール部分における各widget/機能の定義"""
+    """
+    Crawlerコントロール部分における各widget/機能の定義
+
+    attribute:
+        self.crawler_events:
+            crawlerの状態遷移のイベントを受け取るQueue
+            GUIのスレッドで一定間隔(50ミリ秒)ごとに取り出し、イベントに応じて表示内容等を更新
+
+        self.crawler_running:
+            crawlerのスレッドが開始してから、終了/取消/エラーのイベントを受け取るまでTrue
+            (GUIのスレッドからcrawler_statusを参照しないため、GUI側で状態を保持)
+
+    Note
+        crawlerはwindowの表示後にバックグラウンドで準備するため、
+        attach_crawler()で受け取るまでは開始ボタンを無効とする
+    """
+
+    # crawlerのイベントを確認する間隔(ミリ秒)
+    event_interval = 50
 
-    def __init__(self, frame, crawler, master, log_window):
+    def __init__(self, frame, master, log_window):
         # Appクラスで定義したCrawlerコントロール用のラベルフレーム
         self.frame = frame
-        # Appクラスでインスタンス化されたcrawlerモジュールを属性として定義
-        self.crawler = crawler
+        # Appクラスで準備されたcrawlerモジュール(attach_crawler()で受け取る)
+        self.crawler = None
         # Appクラスで定義されたGUI本体(終了ボタンや✕ボタン押下時の処理用)
         self.master = master
         # LogWindowUiクラスで定義されたwidget(ログクリアボタン押下時の処理用)
         self.scrolled_text = log_window.scrolled_text
+        self.crawler_events = None
+        self.crawler_running = False
 
         self.create_output_path()
         self.create_widget()
 
+    def attach_crawler(self, crawler):
+        """準備の完了したcrawlerを受け取り、開始ボタンを有効にする"""
+
+        self.crawler = crawler
+        # crawlerモジュールの状態遷移のイベントを購読
+        self.crawler_events = self.crawler.events.subscribe()
+        self.target_url_var.set(self.crawler.start_url)
+        self.start_btn.config(state='normal')
+        self.message_var.set('Crawler待機中')
+
+        self.frame.after(self.event_interval, self.process_crawler_events)
+
+    def crawler_failed(self, error):
+        """crawlerの準備(importやインスタンス化)に失敗した場合のメッセージ表示"""
+
+        self.message_var.set(f'Crawler準備エラー: {error}')
+        self.message.config(fg='red')
+
     def create_output_path(self):
         """jsonファイル出力時のデフォルトパス作成"""
 
         self.date_time = datetime.strftime(datetime.now(), '%Y%m%d%H%M%S')
-        # environ['USERPROFILE']は、Windowsにおける「C:\Users\(ユーザー名)」
-        # よって以下は、ユーザーのダウンロードディレクトリを指す
-        self.default_output_dir = os.path.join(
-            os.environ['USERPROFILE'], 'Downloads')
+        # expanduser('~')は、Windowsにおける「C:\Users\(ユーザー名)」(環境変数USERPROFILE)、
+        # Linux等ではHOMEのディレクトリ
+        # よって以下は、ユーザーのダウンロードディレクトリを指す(ない場合はホームディレクトリ)
+        home_dir = os.path.expanduser('~')
+        self.default_output_dir = os.path.join(home_dir, 'Downloads')
+        if not os.path.isdir(self.default_output_dir):
+            self.default_output_dir = home_dir
         self.default_output_file = self.date_time + '_scrape.json'
         self.default_output_path = os.path.join(
             self.default_output_dir, self.default_output_file
@@ -52,18 +98,27 @@ class ControlUi(object):
         ).grid(column=0, row=0, sticky='w')
 
         # widgetのstate=readonlyに伴うテキスト表示等のため
-        target_url_var = tk.StringVar()
-        target_url_var.set(self.crawler.start_url)
+        # (開始URLは、crawlerの準備が完了した時点で表示)
+        self.target_url_var = tk.StringVar()
 
         # 「対象のURL」のエントリー
         target_url = tk.Entry(
             frame,
             width=60,
-            textvariable=target_url_var,
+            textvariable=self.target_url_var,
             state='readonly',
         )
         target_url.grid(column=0, row=1, ipady=2, sticky='w')
 
+        # 全カテゴリのチェックボタン(対象のURLのサイドバーから全カテゴリを取得してcrawl)
+        self.all_categories_var = tk.BooleanVar()
+        self.all_categories_check = tk.Checkbutton(
+            frame,
+            text='全カテゴリ',
+            variable=self.all_categories_var,
+        )
+        self.all_categories_check.grid(column=1, row=1)
+
         # 「対象のURL」のスクロールバー
         target_url_xbar = tk.Scrollbar(
             frame, orient=tk.HORIZONTAL, command=target_url.xview)
@@ -122,7 +177,7 @@ class ControlUi(object):
 
         # メッセージ部分のテキスト情報のラベル
         self.message_var = tk.StringVar()
-        self.message_var.set('Crawler待機中')
+        self.message_var.set('Crawler準備中...')
         self.message = tk.Label(
             message_frame,
             textvariable=self.message_var,
@@ -140,6 +195,7 @@ class ControlUi(object):
             text='開始',
             command=self.start,
             width=7,
+            state='disabled',
         )
         self.start_btn.grid(column=0, row=0)
 
@@ -163,6 +219,24 @@ class ControlUi(object):
         )
         self.cancel_btn.grid(column=2, row=0)
 
+        # 再開のチェックボタン(中断したcrawlを続きから処理)
+        self.resume_var = tk.BooleanVar()
+        self.resume_check = tk.Checkbutton(
+            btn_frame,
+            text='続きから',
+            variable=self.resume_var,
+        )
+        self.resume_check.grid(column=3, row=0, padx=(10, 0))
+
+        # 差分のチェックボタン(前回から新規/変更のあったデータだけを出力)
+        self.incremental_var = tk.BooleanVar()
+        self.incremental_check = tk.Checkbutton(
+            btn_frame,
+            text='差分のみ',
+            variable=self.incremental_var,
+        )
+        self.incremental_check.grid(column=4, row=0)
+
         # ログクリアボタン
         self.clear_btn = tk.Button(
             btn_frame,
@@ -170,7 +244,7 @@ class ControlUi(object):
             command=self.clear_log,
             width=7,
         )
-        self.clear_btn.grid(column=4, row=0, padx=(30, 0))
+        self.clear_btn.grid(column=5, row=0, padx=(30, 0))
 
         # 終了ボタン
         tk.Button(
@@ -178,7 +252,7 @@ class ControlUi(object):
             text='終了',
             command=self.quit,
             width=7,
-        ).grid(column=5, row=0, padx=(10, 0))
+        ).grid(column=6, row=0, padx=(10, 0))
 
     def display_file_dialog(self):
         """
@@ -193,7 +267,9 @@ class ControlUi(object):
         # 保存ボタン押下時はそのファイルパス、cancel/✕ボタン押下時はNoneが返る
         user_entry_value = filedialog.asksaveasfilename(
             title='ファイルの名前 / 出力先の設定',
-            filetypes=[("json", ".json"), ],
+            filetypes=[
+                ("json", ".json"), ("ndjson", ".ndjson"), ("csv", ".csv"),
+                ("sqlite", ".sqlite3"), ("parquet", ".parquet"), ],
             # ダイアログの初期表示ディレクトリ
             initialdir=self.default_output_dir,
             # ダイアログの初期表示ファイル名
@@ -232,7 +308,8 @@ class ControlUi(object):
         file_name = os.path.basename(user_entry_value)
 
         # 拡張子と記号(-ハイフンと_アンダースコアのみ)の検証
-        m = re.match(r'[\w-]+\.json$', file_name)
+        m = re.match(
+            r'[\w-]+\.(json|ndjson|csv|sqlite3?|db|parquet)$', file_name)
 
         if m:
             return True
@@ -242,12 +319,19 @@ class ControlUi(object):
     def start(self):
         """開始ボタン押下時の処理"""
 
-        # crawlerモジュールに出力先のファイルパスを渡す
+        # crawlerモジュールに出力先のファイルパスと再開の有無を渡す
         self.crawler.output_path = self.output_path_var.get()
+        # 出力先のエントリーはreadonlyのため、既存のファイルはファイルダイアログで
+        # 上書きを確認済み(sqliteの既存のrecordsテーブルも上書き)
+        self.crawler.overwrite = os.path.exists(self.crawler.output_path)
+        self.crawler.resume = self.resume_var.get()
+        self.crawler.incremental = self.incremental_var.get()
+        self.crawler.discover_categories = self.all_categories_var.get()
 
         # crawlerモジュールにおけるスレッド作成/開始の関数
         # 呼び出すたびに新たなスレッドが作成されるので、GUIを閉じずに連続実行が可能
         self.crawler.start_crawler_thread()
+        self.crawler_running = True
 
         # ボタンの状態とメッセージ更新
         self.start_btn.config(state='disabled')
@@ -255,42 +339,62 @@ class ControlUi(object):
         self.cancel_btn.config(state='normal')
         self.clear_btn.config(state='disabled')
         self.file_dialog_btn.config(state='disabled')
+        self.resume_check.config(state='disabled')
+        self.incremental_check.config(state='disabled')
+        self.all_categories_check.config(state='disabled')
         self.message_var.set('Crawler処理中...')
         self.message.config(fg='black')
 
-        # 開始ボタンが押下された2秒後に指定された関数を呼び出す
-        self.start_btn.after(2000, self.confirm_crawler_status)
-
-    def confirm_crawler_status(self):
+    def process_crawler_events(self):
         """
-        crawlerモジュールにおけるスレッドの状態を一定間隔で監視、
-        その状態に応じてGUI等の初期化処理
+        crawlerモジュールから通知されたイベントを取り出して処理し、
+        GUIが終了するまで一定間隔で繰り返す
+
+        Note
+            crawlerの状態遷移は、最大でevent_interval(50ミリ秒)の遅れでGUIに反映
         """
 
-        # none(正常終了)、cancel(取消終了)を検知したらGUIの初期化関数を呼び出す
-        if self.crawler.crawler_status == self.crawler.status[0] or \
-                self.crawler.crawler_status == self.crawler.status[3]:
+        while True:
+            try:
+                event = self.crawler_events.get(block=False)
+            except queue.Empty:
+                break
+            self.handle_crawler_event(event)
 
-            # GUIの初期化関数
-            self.initialize_gui_and_crawler()
+        self.frame.after(self.event_interval, self.process_crawler_events)
 
-            # 対象の処理が終了しても後述のafter関数により、この関数はループ処理され、
-            # 大きな負荷にはならないが、念のため対象の処理終了に合わせて終了
-            return None
+    def handle_crawler_event(self, event):
+        """crawlerのイベントに応じて、メッセージやボタン等の状態を更新"""
 
-        # 自分自身を指定しているため2秒間隔のループ処理となる
-        self.start_btn.after(2000, self.confirm_crawler_status)
+        if event.kind == PAUSED:
+            self.message_var.set('Crawler停止中')
+        elif event.kind == RESUMED:
+            self.message_var.set('Crawler処理中...')
+        elif event.kind == PROGRESS:
+            self.message_var.set(
+                f'Crawler処理中... page[{event.data["page"]}] '
+                f'({event.data["records"]} items)')
+        elif event.kind in TERMINAL_EVENTS:
+            self.crawler_running = False
+            self.initialize_gui_and_crawler()
+            if event.kind == CANCELLED:
+                self.message_var.set(
+                    f'Crawler処理取消({event.data["records"]} items)')
+            elif event.kind == FAILED:
+                self.message_var.set(f'Crawlerエラー終了: {event.data["error"]}')
+                self.message.config(fg='red')
+            else:
+                self.message_var.set(
+                    f'Crawler処理終了({event.data["records"]} items)')
 
     def initialize_gui_and_crawler(self):
-        """GUIのボタン等の状態とcrawlerモジュールの一部属性を初期化"""
+        """
+        GUIのボタン等の状態を初期化
 
-        # crawlerモジュールの属性を初期化
-        self.crawler.result_counter = {
-            'Request sent count': 0,
-            'Response received count': 0,
-            'Status code count': defaultdict(int),
-            'Scraped content count': 0,
-        }
+        Note
+            crawlerモジュールの属性(result_counter等)は、次回の開始時にcrawler側で初期化
+            (GUIのスレッドから、crawlerのスレッドが参照する属性を変更しない)
+        """
 
         # GUIのボタン等を初期化
         self.file_dialog_btn.config(state='normal')
@@ -300,13 +404,15 @@ class ControlUi(object):
         self.pause_btn.config(state='disabled')
         self.cancel_btn.config(state='disabled')
         self.clear_btn.config(state='normal')
+        self.resume_check.config(state='normal')
+        self.incremental_check.config(state='normal')
+        self.all_categories_check.config(state='normal')
 
         # 出力ファイルパスの新規作成(更新)
         self.create_output_path()
         # 「ファイルの出力先」のエントリーも更新
         # GUIを閉じずに連続実行した場合の同名による上書きを防ぐ
         self.output_path_var.set(self.default_output_path)
-        self.message_var.set('Crawler処理終了')
 
     def pause(self):
         """停止/再開ボタン押下時の処理"""
@@ -334,7 +440,7 @@ class ControlUi(object):
         ask_result = messagebox.askokcancel(
             '確認',
             'Crawlerの処理を取消しますか？\n'
-            '処理の途中で取消す場合、jsonファイルは出力されません。\n '
+            '処理の途中で取消す場合、それまでのデータだけがファイルに出力されます。\n '
         )
 
         # 確認の結果に応じた処理
@@ -371,8 +477,7 @@ class ControlUi(object):
         # crawlerモジュールの対象処理の状態に応じた処理
         # 処理中や処理停止中の場合は、メッセージボックスにより確認、結果が返ってくるまで処理を停止
         # 反対に、初期状態や処理終了後は、確認の必要はないものとしてメッセージボックスを表示せずに終了
-        if self.crawler.crawler_status == self.crawler.status[1] or \
-                self.crawler.crawler_status == self.crawler.status[2]:
+        if self.crawler_running:
 
             # GUIからcrawlerモジュールのthreading.Eventを操作することで対象の処理を制御
             self.crawler.crawler_event.clear()
@@ -381,7 +486,7 @@ class ControlUi(object):
             ask_result = messagebox.askokcancel(
                 '確認',
                 'アプリを終了しますか？\n'
-                '処理の途中で終了する場合、jsonファイルは出力されません。\n '
+                '処理の途中で終了する場合、それまでのデータだけがファイルに出力されます。\n '
             )
 
             # 確認結果に応じた処理
@@ -405,17 +510,31 @@ class ControlUi(object):
 
 
 class LogWindowUi(object):
-    """ログウィンドウ部分における各widget/機能の定義"""
+    """
+    ログウィンドウ部分における各widget/機能の定義
 
-    def __init__(self, frame, crawler):
+    attribute:
+        self.max_lines:
+            scrolledtextに表示するログの上限行数
+            上限を超えた場合は古い行から削除(リングバッファのように動作)
+
+    Note
+        ログは一定間隔でQueueからまとめて取り出し、1回のinsertでscrolledtextに表示
+        (ログ1件ごとのinsert/スクロールによるGUIの処理の遅延を防ぐため)
+        Queueの監視は、attach_crawler()でcrawlerを受け取ってから開始
+    """
+
+    # 表示レベルの選択肢
+    log_levels = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+    def __init__(self, frame, max_lines=2000):
         # Appクラスで定義したログウィンドウ用のラベルフレーム
         self.frame = frame
-        # Appクラスでインスタンス化されたcrawlerモジュールを属性として定義
-        self.crawler = crawler
-        # crawlerモジュールで定義されたログ出力用のQueue(widgetに表示するログを取り出すため)
-        self.log_queue = self.crawler.log_queue
-        # crawlerモジュールで定義されたQueueHandler(取り出したログにフォーマットを適用させるため)
-        self.queue_handler = self.crawler.queue_handler
+        # Appクラスで準備されたcrawlerモジュール(attach_crawler()で受け取る)
+        self.crawler = None
+        self.max_lines = max_lines
+        # 表示済みの破棄されたログの数
+        self.reported_dropped = 0
 
         # ログ表示用のscrolledtextを定義
         self.scrolled_text = ScrolledText(
@@ -428,67 +547,234 @@ class LogWindowUi(object):
         # タグに応じた文字色を設定
         # タグは、scrolledtextにテキスト情報をinsertする際に設定
         self.scrolled_text.tag_config('ERROR', foreground='red')
+        self.scrolled_text.tag_config('WARNING', foreground='darkorange')
+
+        # 表示レベルの選択(DEBUGの場合は、リクエストの詳細やscrapeデータの各項目も表示)
+        level_frame = tk.Frame(self.frame)
+        level_frame.grid(column=0, row=1, sticky='e')
+        tk.Label(level_frame, text='表示レベル').grid(column=0, row=0)
+        self.level_var = tk.StringVar(value=self.log_levels[0])
+        level_combobox = ttk.Combobox(
+            level_frame,
+            textvariable=self.level_var,
+            values=self.log_levels,
+            state='readonly',
+            width=8,
+        )
+        level_combobox.grid(column=1, row=0, padx=(5, 0))
+        level_combobox.bind('<<ComboboxSelected>>', self.change_log_level)
+
+    def attach_crawler(self, crawler):
+        """準備の完了したcrawlerを受け取り、ログの監視を開始"""
+
+        self.crawler = crawler
+        # crawlerモジュールで定義されたログ出力用のQueue(widgetに表示するログを取り出すため)
+        self.log_queue = self.crawler.log_queue
+        # crawlerモジュールで定義されたQueueHandler(破棄されたログの数を確認するため)
+        self.queue_handler = self.crawler.queue_handler
+        # 準備中に選択された表示レベルを反映
+        self.change_log_level()
 
-        # ログウィンドウが読み込まれた0.1秒後に指定された関数を呼び出す
+        # 0.1秒後に指定された関数を呼び出す
         self.frame.after(100, self.get_log_queue)
 
+    def change_log_level(self, event=None):
+        """表示レベルの選択に応じて、crawlerのログの出力レベルを変更"""
+
+        if self.crawler:
+            self.crawler.set_log_level(getattr(logging, self.level_var.get()))
+
     def get_log_queue(self):
         """
         crawlerモジュールにおけるQueueのログ格納状況を監視/取り出し、
         scrolledtextへの表示関数の呼び出し等をGUIが終了するまで一定間隔で実行
+
+        Note
+            1回に取り出すログは上限行数まで(残りは次回に取り出す)
         """
 
-        while True:
-            # crawlerモジュールのQueueからログを取り出せたら変数に格納
+        records = []
+        while len(records) < self.max_lines:
+            # crawlerモジュールのQueueからログを取り出せたらリストに格納
             try:
-                record = self.log_queue.get(block=False)
+                records.append(self.log_queue.get(block=False))
             # 取り出せない場合はwhileループから抜ける
             except queue.Empty:
                 break
-            else:
-                # 取り出せた場合はさらにログを引数に表示処理の関数を呼び出す
-                self.display_log(record)
 
-        # ログがある場合は取り出して関数呼び出し、ログがない場合はwhileループから抜けるが、
-        # 以下のafter関数により再度whileループを実行することで、GUIが終了するまで上記の処理をループ
+        # Queueが上限に達して破棄されたログがある場合は、その数を表示
+        dropped = self.queue_handler.dropped
+        if dropped > self.reported_dropped:
+            records.append((
+                'WARNING',
+                f'({dropped - self.reported_dropped} log records dropped)',
+            ))
+            self.reported_dropped = dropped
+
+        if records:
+            self.display_logs(records)
+
+        # 以下のafter関数により再度呼び出すことで、GUIが終了するまで上記の処理をループ
         self.frame.after(100, self.get_log_queue)
 
-    def display_log(self, record):
-        """crawlerモジュールのQueueから取り出したログをscrolledtextに表示"""
+    def display_logs(self, records):
+        """crawlerモジュールのQueueから取り出したログをまとめてscrolledtextに表示"""
+
+        # insertの引数は(テキスト, タグ)の繰り返しとし、同じレベルが続く行は1つのテキストに連結
+        # タグ情報としてログレベルを渡すことで、ログのレベルに応じたタグを設定
+        chunks = []
+        for levelname, message in records:
+            if chunks and chunks[-1][1] == levelname:
+                chunks[-1][0].append(message)
+            else:
+                chunks.append(([message], levelname))
+        args = []
+        for messages, levelname in chunks:
+            args.extend(('\n'.join(messages) + '\n', levelname))
 
         # テキストをinsertする前に一度normalに変更
         self.scrolled_text.configure(state='normal')
-        # format関数によりQueueから取り出したログに、crawlerモジュールのformatterを適用
-        # また、同関数によりLogRecordオブジェクトからstr型に変換され、scrolledtextへのinsertが可能
-        message = self.queue_handler.format(record)
-        # タグ情報としてログレベルを渡すことで、引数で受け取ったログのレベルに応じたタグを設定
-        self.scrolled_text.insert(tk.END, message + '\n', record.levelname)
+        self.scrolled_text.insert(tk.END, *args)
+
+        # 上限行数を超えた古い行を削除(末尾は空行のため1行分を除く)
+        lines = int(self.scrolled_text.index('end-1c').split('.')[0]) - 1
+        if lines > self.max_lines:
+            self.scrolled_text.delete(
+                '1.0', f'{lines - self.max_lines + 1}.0')
+
         # insertが終わったら再びdisabledに変更
         self.scrolled_text.configure(state='disabled')
-        # 呼び出し元はループ処理で、ログを取り出す度にこの関数を呼び出すため、
-        # ログを表示させるたびに末尾までスクロールして、オートスクロールのように動作
+        # 表示のたびに末尾までスクロールして、オートスクロールのように動作
         self.scrolled_text.yview(tk.END)
 
 
+class StatsUi(object):
+    """
+    crawlの統計(スループット、レイテンシ、キャッシュのヒット率等)を表示するwidgetの定義
+
+    attribute:
+        self.interval:
+            crawlerのMetricsのスナップショットを取得して表示を更新する間隔(ミリ秒)
+    """
+
+    # (表示名, スナップショットから表示する文字列を作成する関数)
+    items = (
+        ('リクエスト/秒', lambda s: f'{s["requests_per_second"]:.2f}'),
+        ('キャッシュ', lambda s: f'{s["cache_hit_ratio"]:.0%}'),
+        ('受信', lambda s: f'{s["bytes_received"] / 1024 / 1024:.1f}MB'),
+        ('ステータス', lambda s: ' '.join(
+            f'{code}[{count}]'
+            for code, count in sorted(s['status_codes'].items())) or '-'),
+        ('fetch', lambda s: format_latency(s['latency']['fetch']) or '-'),
+        ('parse', lambda s: format_latency(s['latency']['parse']) or '-'),
+        ('キュー', lambda s: ' / '.join(
+            f'{name.split("_")[0]} {s["gauges"][name]}'
+            for name in ('listing_queue', 'detail_queue', 'retry_queue')
+            if name in s['gauges']) or '-'),
+        ('同時リクエスト', lambda s: (
+            f'{s["gauges"]["in_flight_requests"]} / '
+            f'上限{s["gauges"]["concurrency_limit"]}')
+            if 'concurrency_limit' in s['gauges'] else '-'),
+    )
+
+    def __init__(self, frame, interval=1000):
+        # Appクラスで定義した統計用のラベルフレーム
+        self.frame = frame
+        # Appクラスで準備されたcrawlerモジュール(attach_crawler()で受け取る)
+        self.crawler = None
+        self.interval = interval
+
+        # 表示名と値のラベルを、4項目ずつ2行に配置
+        self.value_vars = []
+        for n, (name, _) in enumerate(self.items):
+            row, column = divmod(n, 4)
+            tk.Label(self.frame, text=name).grid(
+                column=column * 2, row=row, padx=(10, 0), sticky='w')
+            value_var = tk.StringVar(value='-')
+            tk.Label(self.frame, textvariable=value_var).grid(
+                column=column * 2 + 1, row=row, padx=(5, 0), sticky='w')
+            self.value_vars.append(value_var)
+
+    def attach_crawler(self, crawler):
+        """準備の完了したcrawlerを受け取り、統計の表示を開始"""
+
+        self.crawler = crawler
+        self.frame.after(self.interval, self.update_stats)
+
+    def update_stats(self):
+        """crawlerのMetricsのスナップショットを取得し、GUIが終了するまで一定間隔で表示を更新"""
+
+        snapshot = self.crawler.metrics.snapshot()
+        for value_var, (_, format_value) in zip(self.value_vars, self.items):
+            value_var.set(format_value(snapshot))
+
+        self.frame.after(self.interval, self.update_stats)
+
+
+class CrawlerLoader(object):
+    """
+    crawlerモジュールのimportとインスタンス化を、バックグラウンドのスレッドで実行
+
+    attribute:
+        self.crawler:
+            インスタンス化したcrawler(完了するまではNone)
+
+        self.error:
+            importやインスタンス化で発生した例外(ない場合はNone)
+
+    Note
+        crawlerモジュールはrequests/CacheControl/lxml等を読み込み、インスタンス化の際には
+        キャッシュのSQLiteを開いて(初回は.webcacheを取り込み)、プロファイルのXPathをコンパイルする
+        GUIのスレッドで実行するとwindowの表示が遅れるため、windowの表示後に別スレッドで実行
+        完了の確認(done)とwidgetの操作は、GUIのスレッドから行う
+    """
+
+    def __init__(self, engine='thread', profile=None):
+        self.engine = engine
+        self.profile = profile
+        self.crawler = None
+        self.error = None
+        # アプリの終了時に、準備中でも待機せずに終了させるためdaemonとする
+        self.thread = threading.Thread(target=self.load, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def load(self):
+        try:
+            # asyncioのcrawlerはaiohttpが必要なため、選択された場合に限りimport
+            if self.engine == 'async':
+                from async_crawler import AsyncCrawler as crawler_class
+            else:
+                from crawler import Crawler as crawler_class
+            self.crawler = crawler_class(profile=self.profile)
+        except Exception as e:
+            self.error = e
+
+    def done(self):
+        return self.thread.ident is not None and not self.thread.is_alive()
+
+
 class App(object):
     """
     GUIの全体管理
 
     Note
-        全体のレイアウトイメージとして、上部にCrawlerコントロール、下部にログウィンドウを表示
+        全体のレイアウトイメージとして、上部にCrawlerコントロール、中央に統計、下部にログウィンドウを表示
         縦方向のPanedWindowを土台として、その上にLabelFrameを配置して区切り、その上にそれぞれのwidgetを配置
+        crawlerはwindowの表示後にCrawlerLoaderで準備し、完了後に各レイアウト部分へ渡す
     """
 
-    def __init__(self, master):
+    # crawlerの準備の完了を確認する間隔(ミリ秒)
+    load_interval = 50
+
+    def __init__(self, master, engine='thread', profile=None):
         self.master = master
         # row/columnconfigureのweightをデフォルトの0(伸縮しない)から変更することで、
         # windowの伸縮に合わせて、設定された比率に応じて内部widget(ここではLabelFrame)も伸縮
         master.columnconfigure(0, weight=1)
         master.rowconfigure(0, weight=1)
 
-        # crawlerモジュールのインスタンス化
-        crawler = Crawler()
-
         # 初めに、全体の土台として、master上に縦方向のPanedWindowをgrid配置
         vertical_pane = ttk.PanedWindow(master, orient='vertical')
         vertical_pane.grid(column=0, row=0, sticky='nesw')
@@ -498,6 +784,10 @@ class App(object):
         # これを(master上に配置した)vertical_paneにadd
         vertical_pane.add(control_frame, weight=1)
 
+        # 統計の土台となるLabelFrameを定義(windowの伸縮に合わせて伸縮させない)
+        stats_frame = ttk.LabelFrame(vertical_pane, text='統計')
+        vertical_pane.add(stats_frame, weight=0)
+
         # ログウィンドウの土台となるLabelFrameを定義
         # 後に配置するscrolledtextもLabelFrameの伸縮に合わせて伸縮させるため、row/columnconfigureを設定
         # masterのconfigureや以下のconfigureをコメントアウトして実際に伸縮させるとわかりやすい
@@ -508,24 +798,60 @@ class App(object):
         vertical_pane.add(log_window_frame, weight=1)
 
         # 上記のLabelFrame等を引数に渡し、各レイアウト部分を定義したクラスをインスタンス化
-        self.log_window = LogWindowUi(log_window_frame, crawler)
-        self.control = ControlUi(
-            control_frame, crawler, master, self.log_window)
+        self.log_window = LogWindowUi(log_window_frame)
+        self.stats = StatsUi(stats_frame)
+        self.control = ControlUi(control_frame, master, self.log_window)
 
         # ウィンドウの✕ボタンの処理(WM_DELETE_WINDOW)をControlUiクラスの関数に置き換える
         master.protocol('WM_DELETE_WINDOW', self.control.quit)
 
+        # windowの表示後(mainloopが最初に待機状態となった時点)にcrawlerの準備を開始
+        self.loader = CrawlerLoader(engine, profile)
+        master.after_idle(self.loader.start)
+        master.after(self.load_interval, self.wait_crawler)
+
+    def wait_crawler(self):
+        """crawlerの準備が完了するまで一定間隔で確認し、完了後に各レイアウト部分へ渡す"""
+
+        if not self.loader.done():
+            self.master.after(self.load_interval, self.wait_crawler)
+        elif self.loader.error:
+            self.control.crawler_failed(self.loader.error)
+        else:
+            crawler = self.loader.crawler
+            self.log_window.attach_crawler(crawler)
+            self.stats.attach_crawler(crawler)
+            self.control.attach_crawler(crawler)
+
 
 def main():
+    # exe化した場合も、parse処理用の子プロセスを正しく起動させるため
+    multiprocessing.freeze_support()
+
+    # 起動時の引数によりcrawlerの種類を選択
+    parser = argparse.ArgumentParser(description='Crawler GUI')
+    parser.add_argument(
+        '--engine',
+        choices=('thread', 'async'),
+        default='thread',
+        help='thread: requests/threadingのcrawler, async: asyncioのcrawler',
+    )
+    parser.add_argument(
+        '--profile',
+        default=None,
+        help='サイトのプロファイル名、またはjsonファイルのパス(省略した場合はbooks.toscrape.com)',
+    )
+    args = parser.parse_args()
+
     root = tk.Tk()
     root.title('Crawler GUI')
-    root.minsize(width=600, height=550)
+    root.minsize(width=600, height=600)
     root.geometry('600x500')
     root.iconbitmap('./icon.ico')
     # AppクラスにTkオブジェクト(root)を渡してインスタンス化、
     # 同クラス内では、さらに各レイアウト部分を定義したクラスをインスタンス化、
     # そのオブジェクトを以降のmainloopよりGUIとして表示
-    app = App(master=root)
+    app = App(master=root, engine=args.engine, profile=args.profile)
     app.master.mainloop()
 
 
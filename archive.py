@@ -0,0 +1,179 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from requests.structures import CaseInsensitiveDict
+
+
+# アーカイブの利用方法
+RECORD = 'record'
+REPLAY = 'replay'
+
+
+class ArchivedResponse(object):
+    """
+    アーカイブから返すレスポンス(Crawlerのscrape処理等で扱える、requests.Responseと同じ属性)
+
+    Note
+        ネットワークへは送信しないため、from_cacheはTrueとする
+        encodingを変更した場合、textはその文字コードで改めて変換
+    """
+
+    def __init__(self, url, status_code, headers, content, encoding='utf-8'):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.encoding = encoding
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+
+class ResponseArchive(object):
+    """
+    リクエストしたURLとレスポンスの組を、1つのSQLiteファイルに記録/再生
+
+    attribute:
+        self.mode:
+            record: crawl中に受信した全レスポンスを記録(キャッシュから返したものも含む)
+            replay: 記録済みのレスポンスだけを返し、ネットワークへは一切送信しない
+
+    Note
+        レスポンスはリクエストしたURLをkey(インデックス)として、
+        リダイレクト後のURL、ステータスコード、ヘッダー、圧縮したbodyを保存
+        同じURLを再度記録した場合は上書き(最後に受信したレスポンスを再生)
+        記録はcommit_interval件ごとにまとめてcommitし、close()で残りをcommit
+        複数のワーカー(スレッド)から利用するため、接続は共有してロックで排他制御
+    """
+
+    commit_interval = 100
+
+    def __init__(self, path, mode=REPLAY):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f'Unknown archive mode: {mode}')
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.pending = 0
+
+        if mode == REPLAY:
+            # 存在しないファイルを新規作成しないよう、読み取り専用で開く
+            self.conn = sqlite3.connect(
+                f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+            return None
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                final_url TEXT NOT NULL,
+                status_code INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                recorded REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        ''')
+        self.conn.commit()
+
+    @property
+    def replay(self):
+        return self.mode == REPLAY
+
+    def start(self, start_urls):
+        """記録を開始したcrawlの開始URLを保存(再生やベンチマークの開始URLとして利用)"""
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                ('start_urls', json.dumps(list(start_urls))))
+
+    def start_urls(self):
+        """記録時の開始URLのリスト(ない場合は空のリスト)"""
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'start_urls'").fetchone()
+        return json.loads(row[0]) if row else []
+
+    def record(self, url, response):
+        """リクエストしたurlのレスポンス(requests.Response等)を記録"""
+
+        headers = json.dumps(dict(response.headers), ensure_ascii=False)
+        body = zlib.compress(response.content)
+
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(url, final_url, status_code, headers, body, recorded) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (url, str(response.url), response.status_code, headers, body,
+                 time.time()),
+            )
+            self.pending += 1
+            if self.pending >= self.commit_interval:
+                self.conn.commit()
+                self.pending = 0
+
+    def response(self, url, encoding='utf-8'):
+        """urlの記録済みのレスポンスをArchivedResponseで返す(記録がない場合はNone)"""
+
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT final_url, status_code, headers, body FROM responses '
+                'WHERE url = ?',
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        final_url, status_code, headers, body = row
+        return ArchivedResponse(
+            final_url, status_code, json.loads(headers),
+            zlib.decompress(body), encoding)
+
+    def responses(self, batch_size=500):
+        """
+        記録済みの全レスポンスを、記録順にArchivedResponseで返すジェネレータ
+
+        Note
+            アーカイブ全体をメモリに読み込まないよう、batch_size件ずつ取得
+        """
+
+        last_rowid = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    'SELECT rowid, final_url, status_code, headers, body '
+                    'FROM responses WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (last_rowid, batch_size),
+                ).fetchall()
+            if not rows:
+                break
+            for last_rowid, final_url, status_code, headers, body in rows:
+                yield ArchivedResponse(
+                    final_url, status_code, json.loads(headers),
+                    zlib.decompress(body))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute(
+                'SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            if not self.replay:
+                self.conn.commit()
+                # WALの内容を書き戻し、アーカイブを1つのファイルにまとめる
+                self.conn.execute('PRAGMA journal_mode=DELETE')
+            self.conn.close()
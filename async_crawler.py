@@ -0,0 +1,709 @@
+import asyncio
+from collections import deque
+from concurrent.futures import BrokenExecutor
+from functools import partial
+import time
+from urllib.parse import urljoin
+
+import aiohttp
+
+from concurrency import is_overload_status
+from crawler import Crawler, logger
+from events import PAUSED, RESUMED, STARTED
+from media import CHUNK_SIZE
+from pipeline import ParseStage
+from profiles import parse_detail_page
+from retry_queue import (
+    DETAIL_PAGE, LISTING_PAGE, RequestError, RetryQueue, check_status)
+from writers import open_writer
+
+
+class AsyncResponse(object):
+    """
+    aiohttpのレスポンスを、Crawlerのscrape処理で扱える形式に変換
+
+    Note
+        Crawlerのscrape処理はrequests.Responseのurl/textだけを参照するため、
+        その他の属性はログ表示等に必要なものだけを定義
+    """
+
+    def __init__(self, url, status_code, content, encoding, headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+        self.text = content.decode(encoding, errors='replace')
+        # aiohttpのセッションではキャッシュを利用しない
+        self.from_cache = False
+        self.encoding = encoding
+
+
+class AsyncCrawler(Crawler):
+    """
+    asyncioによるcrawlerを定義(Crawlerと同じ属性/関数でGUIから操作可能)
+
+    Note
+        バックグラウンドのスレッド上で1つのイベントループを実行し、
+        aiohttpのセッションで最大max_workers件のリクエストを同時に処理
+        一覧ページは、詳細ページを処理中のページに加えてprefetch_pagesページまで先行してcrawlし、
+        詳細ページは先行した一覧ページの分も並行してcrawl/scrape
+        scrapeデータの出力と進捗の保存は、一覧ページ1ページ分の詳細ページが完了するごと
+        scrape処理やログ表示、ファイル出力、アーカイブの記録/再生はCrawlerの関数をそのまま利用
+
+        self.crawler_event/self.crawler_alive_flagによる停止/再開/取消の制御もCrawlerと同様
+        ただし、CacheControlによるキャッシュは利用しない
+
+        コネクションプールのサイズ、タイムアウト、再試行はCrawlerと同じTransportの設定
+        (再試行はurllib3のRetryの代わりにfetch()の中で行う)
+
+        parse_processesを指定した場合、詳細ページのparse処理はプロセスプールで実行
+        parse待ちのレスポンス数は、同時に処理する詳細ページ数(max_workers)が上限となる
+
+        同時に送信するリクエスト数は、max_workersを最大としてCrawlerと同じく自動で調整
+    """
+
+    # 詳細ページを処理中の一覧ページに加えて、先行してcrawlする一覧ページ数
+    prefetch_pages = 1
+
+    def __init__(self, start_url=None, max_workers=100, **kwargs):
+        # max_workers以外の引数はCrawlerと同じ
+        super().__init__(start_url, max_workers, **kwargs)
+
+    def run_crawler(self):
+        """作成したスレッド上で、crawlerのイベントループを実行"""
+
+        asyncio.run(self.crawl())
+
+    async def crawl(self):
+        """イベントループ上で処理されるcrawlerの全体処理"""
+
+        logger.info('----- Crawler Start -----')
+
+        # crawlerの状態変更等
+        self.crawler_event.set()
+        self.crawler_status = self.status[1]
+        self.events.publish(STARTED, start_urls=self.start_urls)
+
+        # scrapeデータの出力先(1ページ分scrapeするごとに追記)
+        self.writer = open_writer(
+            self.output_path, self.output_format, schema=self.profile.schema,
+            overwrite=self.overwrite or self.resume)
+        # ログ表示用のページ数
+        self.current_page = 1
+        # 詳細ページの処理中に発生した例外(全体処理で改めてraise)
+        self.worker_error = None
+        # 失敗したページの再試行待ち/dead-letter
+        self.retry_queue = RetryQueue(self.retry_attempts, self.retry_delay)
+        # 処理待ち/処理中の詳細ページのタスク数
+        self.pending_detail_tasks = 0
+        # 取消の検知により、詳細ページを処理せずに終了したタスクのある一覧ページ
+        self.interrupted_pages = set()
+        self.start_metrics()
+        self.metrics.set_gauge(
+            'detail_queue', lambda: self.pending_detail_tasks)
+
+        # 同時に処理する詳細ページのリクエスト数の上限
+        self.semaphore = asyncio.Semaphore(self.max_workers)
+        # AdaptiveConcurrencyの上限に空きができたことを、待機中のタスクに通知
+        self.concurrency_available = asyncio.Condition()
+        # 確立したコネクションはkeep-aliveで再利用(ホストごとの上限はTransportの設定)
+        connector = aiohttp.TCPConnector(
+            limit=self.max_workers,
+            limit_per_host=self.transport.pool_maxsize or 0,
+        )
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.transport.connect_timeout,
+            sock_read=self.transport.read_timeout,
+        )
+        # コネクションの確立/再利用の回数(display_processing_resultで表示)
+        self.connections_opened = 0
+        self.connections_reused = 0
+        # aiohttpのセッション(crawl_pagesで作成)
+        self.session = None
+
+        self.open_archive()
+        self.open_media()
+        # 進捗の保存先を開き、再開の場合は中断した一覧ページのURLを取得
+        listing_urls = self.open_checkpoint()
+        self.open_incremental()
+
+        # parse処理を別プロセスで実行する場合のステージ(crawlごとに作成/終了)
+        self.parse_stage = None
+        if self.parse_processes:
+            self.parse_stage = ParseStage(self.parse_processes, self.profile)
+
+        try:
+            await self.crawl_pages(listing_urls, connector, timeout)
+            # 失敗したページの再試行まで完了した場合だけ、正常終了として記録
+            if self.is_alive():
+                self.checkpoint.finish()
+        finally:
+            if self.parse_stage:
+                self.parse_stage.shutdown()
+            self.close_media()
+            self.checkpoint.close()
+            if self.incremental_store:
+                self.incremental_store.close()
+            if self.archive is not None:
+                self.archive.close()
+            # 取消やエラーによる終了でも、それまでのscrapeデータは出力済みのファイルに残す
+            self.output_file()
+            self.stop_metrics()
+
+        # 詳細ページでエラーが発生した場合は、crawlerのスレッドでraiseして終了
+        if self.worker_error:
+            raise self.worker_error
+
+        logger.info('===== Crawler Finished =====')
+
+        # 取消を検知した場合
+        if not self.crawler_alive_flag:
+            self.crawler_status = self.status[3]
+            self.display_processing_result()
+            return None
+
+        self.display_processing_result()
+        # crawlerの状態等変更
+        self.crawler_status = self.status[0]
+
+    async def crawl_pages(self, listing_urls, connector, timeout):
+        """一覧ページを順にcrawlし、各詳細ページのタスクを作成/完了まで待機"""
+
+        async with aiohttp.ClientSession(
+                connector=connector, timeout=timeout,
+                headers=self.transport.headers,
+                trace_configs=[self.connection_trace()]) as session:
+            self.session = session
+            try:
+                await self.crawl_session_pages(listing_urls)
+            finally:
+                # 残りの画像等のダウンロードの完了を待機(セッションを閉じる前)
+                await self.wait_media_tasks()
+
+    async def crawl_session_pages(self, listing_urls):
+        """作成したセッションで、開始URLから順にcrawl"""
+
+        # 再開の場合に復元したscrapeデータの、画像等のダウンロードを開始
+        if self.media_store:
+            self.download_media(self.media_backlog)
+
+        # robots.txtのCrawl-delayをリクエスト頻度の制限に反映
+        for url in self.robots_txt_urls():
+            await self.load_robots_txt_async(url)
+
+        # 新たなcrawlの場合は、開始URL(または取得したカテゴリ)から処理
+        if listing_urls is None:
+            listing_urls = await self.discover_start_urls_async()
+            self.checkpoint.start(listing_urls)
+
+        # 次にcrawlする一覧ページのURL(次ページは残りの開始URLより先にcrawl)
+        pending_urls = deque(
+            url for url in listing_urls if self.url_frontier.add(url))
+        await self.crawl_listing_pages(pending_urls)
+
+        # 失敗したページは、すべての一覧ページの処理後に再試行
+        await self.retry_failed_pages_async()
+
+    async def crawl_listing_pages(self, pending_urls):
+        """
+        pending_urlsの一覧ページから順にcrawlし、1ページ分の詳細ページが完了するごとに出力
+
+        Note
+            一覧ページは、詳細ページを処理中のページに加えてprefetch_pagesページまで先行してcrawl
+            (scrapeデータをメモリ上に保持するのは、処理中/先行した一覧ページの分だけ)
+            取消を検知した場合も、それまでに処理できたscrapeデータは出力/保存
+            進捗は、すべての詳細ページを処理できた一覧ページごとに保存
+            (取消の検知と同時に完了したページも含め、再開の場合は次の一覧ページからcrawl)
+        """
+
+        # crawl済みの一覧ページごとの(詳細ページのタスク, その一覧ページの処理完了後に
+        # crawlする一覧ページのURLのリスト)を一覧ページの順番で格納
+        page_tasks = deque()
+        self.metrics.set_gauge('listing_queue', lambda: len(pending_urls))
+
+        while True:
+            # 詳細ページの処理と並行して、次の一覧ページを先行してcrawl
+            while (pending_urls and self.is_alive()
+                   and len(page_tasks) <= self.prefetch_pages):
+                page_tasks.append(await self.crawl_listing_page(
+                    pending_urls, self.current_page + len(page_tasks)))
+            if not page_tasks:
+                break
+
+            tasks, remaining_urls = page_tasks.popleft()
+            results = await asyncio.gather(*tasks)
+            # 一覧ページ内の並び順でscrapeデータをファイルに追記/進捗として保存
+            self.emit_records(
+                [data for data in results if data is not None])
+            # 取消により処理していない詳細ページがある場合は、進捗を保存せずに終了
+            # (再開の場合は、この一覧ページから改めてcrawl)
+            if self.current_page in self.interrupted_pages:
+                break
+
+            logger.info(
+                f'----- Scrape completed page[{self.current_page}] -----')
+            self.publish_progress()
+
+            # 1ページ分の処理が完了したため、次にcrawlする一覧ページを進捗として保存
+            # (最後の一覧ページの場合は空のリスト)
+            self.checkpoint.set_next_pages(
+                remaining_urls, self.current_page + 1)
+            if remaining_urls:
+                self.current_page += 1
+
+        # 取消等により先行した一覧ページの詳細ページも、完了(取消の検知)まで待機して出力
+        for tasks, _ in page_tasks:
+            results = await asyncio.gather(*tasks)
+            self.emit_records(
+                [data for data in results if data is not None])
+
+    async def crawl_listing_page(self, pending_urls, page):
+        """
+        pending_urlsの先頭の一覧ページをcrawlし、(詳細ページのタスク,
+        この一覧ページの処理完了後にcrawlする一覧ページのURLのリスト)を返す
+        """
+
+        url = pending_urls.popleft()
+        await self.wait_if_paused_async()
+        await self.wait_rate_limit(url)
+        try:
+            r = await self.fetch(url)
+
+            # レスポンスは1回だけparseし、詳細ページ/次ページのURL抽出で共有
+            listing = self.profile.listing_page(r.url, r.text)
+            detail_urls = self.scrape_detail_page_urls(listing)
+            next_page_url = self.search_next_page(listing)
+        # 一覧ページの失敗は、そのページだけ後で再試行して残りのページを続行
+        except Exception as e:
+            # 取消等により処理できなかった場合は、再開時にこの一覧ページからcrawl
+            if self.page_interrupted(url):
+                self.interrupted_pages.add(page)
+            else:
+                self.page_failed(url, LISTING_PAGE, e)
+            detail_urls, next_page_url = [], None
+
+        # 次ページは、残りの開始URLより先にcrawl
+        if next_page_url and self.url_frontier.add(next_page_url):
+            pending_urls.appendleft(next_page_url)
+
+        # crawl済みの詳細ページ(他のカテゴリと重複、再開の場合のscrape済み)は除外
+        # 再試行の時刻になった詳細ページも、このページの詳細ページと合わせて処理
+        detail_urls = [
+            detail_url for detail_url in detail_urls
+            if self.url_frontier.add(detail_url)
+        ] + self.retry_queue.due(DETAIL_PAGE)
+        tasks = self.create_detail_page_tasks(page, detail_urls)
+
+        if pending_urls:
+            logger.info('----- Request next page -----')
+            logger.info(f'next page url: {pending_urls[0]}')
+
+        return tasks, list(pending_urls)
+
+    def create_detail_page_tasks(self, page, detail_urls):
+        """一覧ページ1ページ分の詳細ページのタスクを作成"""
+
+        tasks = [
+            asyncio.create_task(self.detail_page_task(page, i, detail_url))
+            for i, detail_url in enumerate(detail_urls, start=1)
+        ]
+        # 処理待ち/処理中のタスク数(完了したタスクはコールバックで減算)
+        self.pending_detail_tasks += len(tasks)
+        for task in tasks:
+            task.add_done_callback(self.detail_page_task_done)
+        return tasks
+
+    def detail_page_task_done(self, task):
+        """詳細ページのタスクの完了時に呼び出されるコールバック"""
+
+        self.pending_detail_tasks -= 1
+
+    async def retry_failed_pages_async(self):
+        """
+        再試行を待つページがなくなるまで、再試行の時刻になったページから順にcrawl/scrape
+        (Crawler.retry_failed_pagesのasyncio版)
+        """
+
+        while self.retry_queue and self.is_alive():
+            # 取消操作に素早く反応できるよう、短い間隔に区切って待機
+            deadline = self.retry_queue.next_due()
+            while self.is_alive() and time.monotonic() < deadline:
+                await asyncio.sleep(min(deadline - time.monotonic(), 0.2))
+            if not self.is_alive():
+                break
+
+            logger.info('----- Retry failed pages -----')
+            listing_urls = self.retry_queue.due(LISTING_PAGE)
+            if listing_urls:
+                await self.crawl_listing_pages(deque(listing_urls))
+
+            # 作成するタスクの数は、同時に処理する詳細ページ数(max_workers)ずつ
+            detail_urls = self.retry_queue.due(DETAIL_PAGE)
+            for i in range(0, len(detail_urls), self.max_workers):
+                results = await asyncio.gather(
+                    *self.create_detail_page_tasks(
+                        self.current_page,
+                        detail_urls[i:i + self.max_workers]))
+                self.emit_records(
+                    [data for data in results if data is not None])
+
+    async def detail_page_task(self, page, i, url):
+        """詳細ページ1件分のcrawl/scrape(取消やエラーを検知した場合はNoneを返す)"""
+
+        async with self.semaphore:
+            await self.wait_if_paused_async()
+            if not self.is_alive():
+                self.interrupted_pages.add(page)
+                return None
+
+            logger.info(f'----- Request detail page({page}-{i}) -----')
+
+            try:
+                await self.wait_rate_limit(url)
+                if not self.is_alive():
+                    self.interrupted_pages.add(page)
+                    return None
+                # 差分crawlの場合は、前回のETag/Last-Modifiedによる条件付きリクエスト
+                headers = None
+                if self.incremental_store:
+                    headers = self.incremental_store.conditional_headers(url)
+                r = await self.fetch(url, headers)
+
+                # 前回から変更がない場合はscrapeしない
+                if self.incremental_store and not self.check_modified(r):
+                    return None
+
+                # 詳細ページから各コンテンツのscrape
+                if not self.parse_stage:
+                    return self.scrape_detail_page_content(r)
+
+                # 別プロセスでparseし、完了までイベントループを止めずに待機
+                loop = asyncio.get_running_loop()
+                start = time.perf_counter()
+                data = await loop.run_in_executor(
+                    self.parse_stage.executor,
+                    parse_detail_page, r.url, r.content, self.profile.name)
+                self.metrics.observe('parse', time.perf_counter() - start)
+                self.log_scraped_content(data)
+                return data
+            # プロセスプール自体が使えなくなった場合はcrawlを終了(Crawlerと同じ)
+            except BrokenExecutor as e:
+                self.worker_error = self.worker_error or e
+                self.interrupted_pages.add(page)
+                return None
+            # リクエストやparseの失敗は、そのページだけ記録して他のタスクは続行
+            except Exception as e:
+                if self.page_interrupted(url):
+                    self.interrupted_pages.add(page)
+                else:
+                    self.page_failed(url, DETAIL_PAGE, e)
+                return None
+
+    def create_media_stage(self):
+        """
+        画像等のダウンロードは、スレッドプールではなくイベントループ上のタスクで実行
+
+        Note
+            同時にダウンロードする数はmedia_workersが上限(aiohttpのセッションを共有)
+        """
+
+        self.media_tasks = set()
+        self.media_semaphore = asyncio.Semaphore(self.media_workers)
+        # セッションの作成前に登録されたscrapeデータ(再開の場合に復元したもの)
+        self.media_backlog = []
+        return None
+
+    def download_media(self, records):
+        """scrapeデータの画像等のURLごとに、ダウンロードのタスクを作成"""
+
+        if not self.media_store:
+            return None
+        # セッションの作成後に、改めてタスクを作成
+        if self.session is None:
+            self.media_backlog.extend(records)
+            return None
+
+        for data in records:
+            url = data.get(self.profile.media)
+            if not url:
+                continue
+            task = asyncio.ensure_future(self.download_media_file_async(
+                str(data[self.profile.key]), url))
+            self.media_tasks.add(task)
+            task.add_done_callback(self.media_tasks.discard)
+            task.add_done_callback(partial(self.media_finished, url))
+
+    async def download_media_file_async(self, key, url):
+        """画像等を1件ダウンロードして保存(Crawler.download_media_fileのasyncio版)"""
+
+        async with self.media_semaphore:
+            path = self.media_store.lookup(key, url)
+            if path:
+                return path, 'exists'
+
+            await self.wait_rate_limit(url)
+            async with self.session.get(url) as resp:
+                check_status(url, resp.status, self.transport.status_forcelist)
+                # bodyはストリーミングで受信してファイルに書き込み、メモリ上に保持しない
+                media_file = self.media_store.open()
+                try:
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        media_file.write(chunk)
+                except BaseException:
+                    media_file.abort()
+                    raise
+
+            path, created = media_file.commit(key, url)
+            return path, 'saved' if created else 'duplicate'
+
+    async def wait_media_tasks(self):
+        """画像等のダウンロードのタスクの完了を待機(取消の場合はタスクを取消)"""
+
+        tasks = list(getattr(self, 'media_tasks', ()))
+        if not tasks:
+            return None
+        if not self.is_alive():
+            for task in tasks:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def connection_trace(self):
+        """コネクションの確立/再利用の回数を数えるaiohttpのTraceConfig"""
+
+        async def on_create(session, context, params):
+            self.connections_opened += 1
+
+        async def on_reuse(session, context, params):
+            self.connections_reused += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_create)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        return trace_config
+
+    def connection_stats(self):
+        """(新たに確立したコネクション数, ネットワークへ送信したリクエスト数)"""
+
+        opened = getattr(self, 'connections_opened', 0)
+        return opened, opened + getattr(self, 'connections_reused', 0)
+
+    async def fetch(self, url, headers=None):
+        """
+        リクエスト処理を一元管理(Crawler.try_requestのasyncio版)
+
+        Note
+            5xx/429のレスポンスや接続の切断/タイムアウトは、Transportの設定に従い再試行
+            再試行しても失敗した場合は、Crawler.try_requestと同様にRequestErrorをraise
+        """
+
+        # リクエストとレスポンスの総数を加算
+        # イベントループ上の処理はすべて同じスレッドで実行されるためロックは不要
+        self.result_counter['Request sent count'] += 1
+        self.result_counter['Response received count'] += 1
+
+        start = time.perf_counter()
+        try:
+            # アーカイブを再生中の場合は、記録済みのレスポンスを返す
+            if self.replaying:
+                r = self.archived_response(url)
+            else:
+                r = await self.fetch_with_retry(url, headers)
+        # ネットワークの未接続等
+        # crawlは終了させず、呼び出し元でページ単位の失敗として扱う
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.metrics.increment('request_errors')
+            raise RequestError(
+                url, reason='ConnectionError or ReadTimeoutError') from e
+        else:
+            logger.debug(f'Request url: {r.url}')
+            logger.debug(f'From cache: {r.from_cache}')
+            logger.debug(f'Status code: {r.status_code}')
+
+            # 記録中の場合は、アーカイブに記録(差分crawlの304は記録しない)
+            if self.recording and r.status_code != 304:
+                self.archive.record(url, r)
+
+            self.metrics.observe_request(
+                time.perf_counter() - start, r.status_code, r.from_cache,
+                len(r.content))
+            self.result_counter['Status code count'][r.status_code] += 1
+
+            # 404/503等のエラーページは、scrapeせずにページ単位の失敗として扱う
+            check_status(url, r.status_code, self.transport.status_forcelist)
+            return r
+
+    async def fetch_with_retry(self, url, headers=None):
+        """5xx/429のレスポンスや接続の切断/タイムアウトの場合は、Transportの設定に従い再試行"""
+
+        attempt = 0
+        while True:
+            try:
+                r = await self.fetch_once(url, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if not self.should_retry(attempt):
+                    raise
+                await self.wait_retry(url, attempt + 1)
+                # 待機中に取消を検知した場合は、再試行せずに失敗として扱う
+                if not self.is_alive():
+                    raise
+            else:
+                if (r.status_code not in self.transport.status_forcelist
+                        or not self.should_retry(attempt)):
+                    return r
+                retry_after = self.rate_limiter.parse_retry_after(
+                    r.headers.get('Retry-After'))
+                await self.wait_retry(url, attempt + 1, retry_after)
+                if not self.is_alive():
+                    return r
+
+            attempt += 1
+
+    async def wait_retry(self, url, attempt, retry_after=None):
+        """
+        attempt回目の再試行まで、イベントループを止めずに待機
+
+        Note
+            待機時間はTransportのmax_backoffが上限(Retry-Afterの秒数も同様)
+            取消操作に素早く反応できるよう、短い間隔に区切って待機
+        """
+
+        delay = self.transport.retry_delay(attempt, retry_after)
+        logger.debug(f'Retry ({attempt}) after {delay:.1f}s: {url}')
+        deadline = time.monotonic() + delay
+        while self.is_alive():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, 0.2))
+        await self.wait_rate_limit(url)
+
+    async def fetch_once(self, url, headers=None):
+        """
+        1回分のリクエストを送信し、レスポンスをAsyncResponseに変換
+
+        Note
+            同時に送信するリクエスト数は、AdaptiveConcurrencyの上限までに制限し、
+            レイテンシと429/5xx/接続の失敗等を記録して上限を調整
+        """
+
+        # 取消を検知した場合は、上限を超えて送信しないよう送信せずに失敗として扱う
+        if not await self.acquire_concurrency():
+            raise RequestError(url, reason='Cancelled before sending')
+        started = time.monotonic()
+        # 接続の失敗/タイムアウト等の例外も、エラーとして記録
+        error = True
+        try:
+            async with self.session.get(url, headers=headers) as resp:
+                content = await resp.read()
+                error = is_overload_status(resp.status)
+        finally:
+            self.concurrency.release(started, error)
+            async with self.concurrency_available:
+                self.concurrency_available.notify_all()
+
+        # 429/503のRetry-Afterをリクエスト頻度の制限に反映
+        self.rate_limiter.update_from_response(url, resp.status, resp.headers)
+        return AsyncResponse(
+            str(resp.url), resp.status, content, self.encoding, resp.headers)
+
+    async def acquire_concurrency(self):
+        """
+        AdaptiveConcurrencyの上限に空きができるまで、イベントループを止めずに待機
+
+        Note
+            送信中のリクエストの完了(上限の変更を含む)ごとに通知を受けて、空きを確認
+            取消はイベントループの外(GUIのスレッド等)で設定され通知がないため、
+            通知がない場合も短い間隔で確認し、取消を検知した場合はFalseを返す
+        """
+
+        async with self.concurrency_available:
+            while self.is_alive():
+                if self.concurrency.try_acquire():
+                    return True
+                try:
+                    await asyncio.wait_for(
+                        self.concurrency_available.wait(), 0.2)
+                except asyncio.TimeoutError:
+                    pass
+        return False
+
+    def should_retry(self, attempt):
+        """attempt回再試行した後に、さらに再試行するかどうか(取消の場合は再試行しない)"""
+
+        return attempt < self.transport.retries and self.is_alive()
+
+    async def discover_start_urls_async(self):
+        """crawlを開始する一覧ページのURLのリストを返す(Crawler.discover_start_urlsと同様)"""
+
+        if not self.discover_categories:
+            return list(self.start_urls)
+
+        pages = []
+        for url in self.start_urls:
+            await self.wait_rate_limit(url)
+            r = await self.fetch(url)
+            pages.append(self.profile.listing_page(r.url, r.text))
+        return self.extract_category_urls(pages)
+
+    async def load_robots_txt_async(self, url):
+        """urlのホストのrobots.txtを取得し、Crawl-delayをRateLimiterに反映"""
+
+        robots_url = urljoin(url, '/robots.txt')
+        try:
+            if self.replaying:
+                r = self.archived_response(robots_url)
+            else:
+                r = await self.fetch_once(robots_url)
+                if self.recording:
+                    self.archive.record(robots_url, r)
+        # robots.txtが取得できない場合は、制限を追加せずにcrawlを続行
+        except (aiohttp.ClientError, asyncio.TimeoutError, RequestError):
+            return None
+        if r.status_code != 200:
+            return None
+
+        crawl_delay = self.rate_limiter.set_crawl_delay(url, r.text)
+        if crawl_delay:
+            logger.info(f'Crawl-delay: {crawl_delay}')
+
+    async def wait_rate_limit(self, url):
+        """RateLimiterで予約した送信時刻まで、イベントループを止めずに待機"""
+
+        # アーカイブを再生中の場合は、ネットワークへ送信しないため待機しない
+        if self.replaying:
+            return None
+
+        slot = self.rate_limiter.reserve(url)
+
+        # 取消操作に素早く反応できるよう、短い間隔に区切って待機
+        while self.is_alive():
+            remaining = slot - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, 0.2))
+
+    async def wait_if_paused_async(self):
+        """
+        thread.Eventの状態Falseを検知した場合、状態がTrueに戻るまで待機
+
+        Note
+            event.wait()はイベントループ全体を止めてしまうため、短い間隔で状態を確認
+            停止のログと状態変更は、最初に検知したタスクだけが行う
+        """
+
+        if self.crawler_event.is_set():
+            return None
+
+        if self.crawler_status == self.status[1]:
+            logger.info('----- Crawler Pause -----')
+            # 処理停止にあたりcrawlerの状態等変更
+            self.crawler_status = self.status[2]
+            self.events.publish(PAUSED)
+
+        while not self.crawler_event.is_set():
+            await asyncio.sleep(0.1)
+
+        # 処理開始にあたりcrawlerの状態等変更
+        if self.crawler_status == self.status[2]:
+            self.crawler_status = self.status[1]
+            self.events.publish(RESUMED)
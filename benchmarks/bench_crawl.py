@@ -0,0 +1,186 @@
+"""
+ローカルの合成サイトに対してcrawlerを最後まで実行し、
+スループット、ピークメモリ(RSS)、段階ごとの処理時間(fetch/parse/extract/write)を計測
+
+使用方法(リポジトリのルートディレクトリで実行):
+    python -m benchmarks.bench_crawl --categories 10 --pages 10 --books 20
+    python -m benchmarks.bench_crawl --engine async --workers 50 --repeat 3
+    python -m benchmarks.bench_crawl --profiler cprofile --stats crawl.prof
+    python -m benchmarks.bench_crawl --profiler tracemalloc
+    python -m benchmarks.bench_crawl --archive books.archive
+
+Note
+    crawlerは1回ごとに新たな子プロセス(spawn)で実行し、合成サイトのサーバーは親プロセスで配信
+    (サーバーの処理や前回の実行が、スループット/ピークメモリの計測に混ざらないため)
+    リクエスト頻度の制限はなく、キャッシュ/進捗等は一時ディレクトリに新規作成
+    ネットワーク接続は不要なため、変更前後で同じ条件の計測を繰り返して性能の低下を検知できる
+    --archiveを指定した場合は、合成サイトの代わりに記録済みのアーカイブ(cli.pyの--record)を再生
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import logging
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.local_site import LocalSiteServer, SyntheticSite
+
+
+def peak_rss():
+    """実行中のプロセスのピークメモリ(バイト、取得できない環境ではNone)"""
+
+    try:
+        import resource
+    except ImportError:
+        # Windowsにはresourceモジュールがない
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト単位
+    return maxrss if os.uname().sysname == 'Darwin' else maxrss * 1024
+
+
+def run_crawl(
+        start_urls, engine, workers, parse_processes, profiler_mode,
+        stats_path, output_dir, archive_path=None):
+    """
+    子プロセスでcrawlerを1回実行し、計測結果をdictで返す
+
+    Note
+        crawler等のimportも子プロセスで行い、ピークメモリに親プロセスの分を含めない
+    """
+
+    from archive import REPLAY
+    from cli import create_crawler
+    from crawler import logger
+    from profiling import StageProfiler
+    from sqlite_cache import SQLiteCache
+
+    # コマンドラインからの実行と同じく、リクエストごとの詳細等のログは作成しない
+    logger.setLevel(logging.INFO)
+    stage_profiler = StageProfiler(profiler_mode)
+    crawler = create_crawler(
+        start_urls, engine, workers,
+        cache=SQLiteCache(os.path.join(output_dir, 'cache.sqlite3')),
+        requests_per_second=None,
+        parse_processes=parse_processes,
+        checkpoint_path=os.path.join(output_dir, 'checkpoint.sqlite3'),
+        incremental_path=os.path.join(output_dir, 'incremental.sqlite3'),
+    )
+    crawler.output_path = os.path.join(output_dir, 'result.ndjson')
+    if archive_path:
+        crawler.archive_path = archive_path
+        crawler.archive_mode = REPLAY
+    stage_profiler.attach(crawler)
+
+    stage_profiler.start()
+    start = time.perf_counter()
+    crawler.start_crawler_thread()
+    crawler.crawler_thread.join()
+    elapsed = time.perf_counter() - start
+    stage_profiler.stop()
+
+    if crawler.error:
+        raise crawler.error
+    if stats_path and stage_profiler.profilers:
+        stage_profiler.dump_stats(stats_path)
+
+    return {
+        'elapsed': elapsed,
+        'requests': crawler.result_counter['Request sent count'],
+        'records': crawler.writer.count,
+        'peak_rss': peak_rss(),
+        'stages': stage_profiler.stages,
+        'report': stage_profiler.report(),
+    }
+
+
+def format_size(size):
+    return 'n/a' if size is None else f'{size / 1024 / 1024:.1f}MB'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--books', type=int, default=20)
+    parser.add_argument(
+        '--latency', type=float, default=0.0,
+        help='サーバーの応答ごとの待機時間(秒)')
+    parser.add_argument(
+        '--engine', choices=('thread', 'async'), default='thread')
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='詳細ページを並行して処理する数(省略した場合は各crawlerのデフォルト)')
+    parser.add_argument('--parse-processes', type=int, default=0)
+    parser.add_argument(
+        '--repeat', type=int, default=1, help='計測の回数(結果は中央値)')
+    parser.add_argument(
+        '--profiler', choices=('cprofile', 'tracemalloc'), default=None,
+        help='段階ごとの処理時間に加えて、cProfile/tracemallocの上位を表示')
+    parser.add_argument(
+        '--stats', default=None,
+        help='cProfileの記録を出力するファイルパス(最後の計測の分)')
+    parser.add_argument(
+        '--archive', default=None,
+        help='合成サイトの代わりに再生するアーカイブのファイルパス')
+    args = parser.parse_args()
+
+    # 子プロセスはspawnで起動し、親プロセスのメモリを引き継がない
+    context = multiprocessing.get_context('spawn')
+
+    if args.archive:
+        from archive import REPLAY, ResponseArchive
+
+        archive = ResponseArchive(args.archive, REPLAY)
+        start_urls = archive.start_urls()
+        print(
+            f'archive: {len(archive)} responses, '
+            f'{len(start_urls)} start urls, engine {args.engine}')
+        archive.close()
+        server = nullcontext()
+    else:
+        site = SyntheticSite(args.categories, args.pages, args.books)
+        server = LocalSiteServer(site, latency=args.latency)
+
+    with server:
+        if not args.archive:
+            # 全カテゴリを1回のcrawlで処理
+            start_urls = [
+                site.start_url(server.base_url, i)
+                for i in range(len(site.categories))]
+            print(
+                f'site: {site.book_count} books, '
+                f'{len(site.categories) * site.pages_per_category} '
+                f'listing pages, latency {args.latency}s, '
+                f'engine {args.engine}')
+
+        results = []
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as output_dir, \
+                    ProcessPoolExecutor(1, mp_context=context) as executor:
+                result = executor.submit(
+                    run_crawl, start_urls, args.engine, args.workers,
+                    args.parse_processes, args.profiler, args.stats,
+                    output_dir, args.archive).result()
+            results.append(result)
+            print(
+                f'records={result["records"]:<6} '
+                f'requests={result["requests"]:<6} '
+                f'elapsed={result["elapsed"]:7.2f}s '
+                f'throughput={result["requests"] / result["elapsed"]:8.1f} '
+                f'req/s peak_rss={format_size(result["peak_rss"])}')
+
+    elapsed = statistics.median(result['elapsed'] for result in results)
+    throughput = statistics.median(
+        result['requests'] / result['elapsed'] for result in results)
+    print(f'median: elapsed={elapsed:.2f}s throughput={throughput:.1f} req/s')
+    print(results[-1]['report'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+ローカルの合成サイトに対して、threadingのcrawlerとasyncioのcrawlerのスループットを比較
+
+使用方法(リポジトリのルートディレクトリで実行):
+    python -m benchmarks.bench_engines --pages 10 --latency 0.05
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from async_crawler import AsyncCrawler
+from benchmarks.local_site import LocalSiteServer, SyntheticSite
+from crawler import Crawler
+from sqlite_cache import SQLiteCache
+
+
+def run_engine(
+        crawler_class, start_url, workers, parse_processes, output_dir):
+    """crawlerを1回実行し、(経過時間, リクエスト数, scrapeデータ数)を返す"""
+
+    # ベンチマークではリクエスト頻度を制限しない
+    # キャッシュ等はcrawlerごとに一時ディレクトリに作成(カレントディレクトリのファイルは使用しない)
+    name = crawler_class.__name__
+    crawler = crawler_class(
+        start_url, max_workers=workers, requests_per_second=None,
+        parse_processes=parse_processes,
+        cache=SQLiteCache(os.path.join(output_dir, f'{name}_cache.sqlite3')),
+        checkpoint_path=os.path.join(
+            output_dir, f'{name}_checkpoint.sqlite3'),
+        incremental_path=os.path.join(
+            output_dir, f'{name}_incremental.sqlite3'),
+    )
+    crawler.output_path = os.path.join(output_dir, f'{name}.json')
+    # GUIのログウィンドウは使用しないため、Queueへログを出力しない
+    crawler.use_log_queue = False
+
+    start = time.perf_counter()
+    crawler.start_crawler_thread()
+    crawler.crawler_thread.join()
+    elapsed = time.perf_counter() - start
+
+    return (
+        elapsed,
+        crawler.result_counter['Request sent count'],
+        crawler.writer.count,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--categories', type=int, default=1)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--books', type=int, default=20)
+    parser.add_argument(
+        '--latency', type=float, default=0.05,
+        help='サーバーの応答ごとの待機時間(秒)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument(
+        '--parse-processes', type=int, default=0,
+        help='詳細ページのparse処理を実行するプロセス数(0の場合は同じスレッドでparse)')
+    args = parser.parse_args()
+
+    site = SyntheticSite(args.categories, args.pages, args.books)
+    engines = (
+        (Crawler, args.workers),
+        (AsyncCrawler, args.concurrency),
+    )
+
+    with LocalSiteServer(site, latency=args.latency) as server, \
+            tempfile.TemporaryDirectory() as output_dir:
+        start_url = site.start_url(server.base_url)
+        print(f'site: {site.book_count} books, latency {args.latency}s')
+
+        for crawler_class, workers in engines:
+            elapsed, requests, records = run_engine(
+                crawler_class, start_url, workers, args.parse_processes,
+                output_dir)
+            print(
+                f'{crawler_class.__name__:<12} workers={workers:<4} '
+                f'records={records:<6} requests={requests:<6} '
+                f'elapsed={elapsed:7.2f}s '
+                f'throughput={requests / elapsed:8.1f} req/s'
+            )
+
+
+if __name__ == '__main__':
+    main()
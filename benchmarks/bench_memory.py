@@ -0,0 +1,105 @@
+"""
+多数のscrapeデータをメモリ上にまとめて保持する場合のメモリ使用量を、保持の方法ごとに比較
+
+使用方法(リポジトリのルートディレクトリで実行):
+    python -m benchmarks.bench_memory --records 100000
+
+Note
+    dicts: scrapeデータ1件ごとのdictのリスト(出力のバッファの変更前)
+    dicts+DataFrame: dictのリストからpandasのDataFrameを作成(ファイル出力の当初の方法、
+                     pandasがインストールされている場合のみ)
+    columns: 項目ごとの列にまとめて保持(RecordColumns、出力のバッファの変更後)
+    scrapeデータは合成サイトの詳細ページと同じ値を、プロファイルの整形後の型で生成
+    (HTMLの生成/parseは行わない)
+    メモリ使用量はtracemallocで計測し、保持した後の使用量(current)とピーク(peak)を表示
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.local_site import SyntheticSite
+from parsers import extract_currency, extract_price, extract_stock, STAR_RATING
+from profiles import get_profile
+from records import RecordColumns
+
+
+BASE_URL = 'http://127.0.0.1:8000'
+
+
+def synthetic_records(count):
+    """合成サイトのbook_idごとのscrapeデータ(dict)を、1件ずつ生成するジェネレータ"""
+
+    site = SyntheticSite()
+    for book_id in range(count):
+        book = site.book(book_id)
+        price = '£' + book['price']
+        yield {
+            'url': f'{BASE_URL}/catalogue/{book["slug"]}/index.html',
+            'title': book['title'],
+            'price': extract_price(price),
+            'currency': extract_currency(price),
+            'star': STAR_RATING[book['star']],
+            'reviews': book['reviews'],
+            'stock': extract_stock(book['availability']),
+            'upc': book['upc'],
+            'image_url': f'{BASE_URL}/{book["image"]}',
+        }
+
+
+def keep_dicts(records, schema):
+    return list(records)
+
+
+def keep_dataframe(records, schema):
+    import pandas as pd
+
+    data_list = list(records)
+    return data_list, pd.DataFrame(data_list)
+
+
+def keep_columns(records, schema):
+    columns = RecordColumns(schema)
+    columns.extend(records)
+    return columns
+
+
+def measure(keep, count, schema):
+    """保持した後のメモリ使用量、ピーク(バイト)と処理時間(秒)"""
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = keep(synthetic_records(count), schema)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return current, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--records', type=int, default=100000)
+    args = parser.parse_args()
+
+    cases = [('dicts', keep_dicts)]
+    try:
+        import pandas  # noqa: F401
+        cases.append(('dicts+DataFrame', keep_dataframe))
+    except ImportError:
+        pass
+    cases.append(('columns', keep_columns))
+
+    schema = get_profile().schema
+    print(f'records: {args.records}, fields: {len(schema)}')
+    for name, keep in cases:
+        current, peak, elapsed = measure(keep, args.records, schema)
+        print(
+            f'{name:<16} current={current / 1024 / 1024:7.1f}MB '
+            f'peak={peak / 1024 / 1024:7.1f}MB '
+            f'per record={current / args.records:6.0f}B '
+            f'elapsed={elapsed:6.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+保存済みページ(.webcache)を対象に、1ページあたりのparse時間を変更前後で比較
+
+使用方法(リポジトリのルートディレクトリで実行):
+    python -m benchmarks.bench_parse --repeat 20
+    python -m benchmarks.bench_parse --archive books.archive
+
+Note
+    変更前: BeautifulSoupで一覧ページを2回parseし、詳細ページは:-soup-contains()で抽出
+    変更後: lxmlで各ページを1回だけparseし、コンパイル済みのXPathで抽出
+"""
+
+import argparse
+import os
+import time
+
+from bs4 import BeautifulSoup
+import msgpack
+
+from profiles import get_profile
+
+
+CACHE_DIR = './.webcache'
+# 保存済みページのURLはキャッシュに含まれないため、相対URLの基準として仮のURLを使用
+LISTING_URL = (
+    'https://books.toscrape.com/catalogue/category/books/'
+    'fantasy_19/page-1.html')
+DETAIL_URL = 'https://books.toscrape.com/catalogue/book_1/index.html'
+PROFILE = get_profile()
+
+
+def load_cached_pages(cache_dir):
+    """FileCacheの各ファイルからレスポンスのbodyを読み込み、一覧/詳細ページに分類"""
+
+    listing_pages, detail_pages = [], []
+
+    for root, _, files in os.walk(cache_dir):
+        for file_name in files:
+            with open(os.path.join(root, file_name), 'rb') as f:
+                # CacheControlのシリアライズ形式は「cc=4,(msgpack)」
+                _, _, payload = f.read().partition(b',')
+            body = msgpack.loads(payload, raw=False)['response']['body']
+
+            if b'product_page' in body:
+                detail_pages.append(body)
+            elif b'product_pod' in body:
+                listing_pages.append(body)
+
+    return listing_pages, detail_pages
+
+
+def load_archived_pages(archive_path):
+    """アーカイブ(cli.pyの--record)の各レスポンスのbodyを読み込み、一覧/詳細ページに分類"""
+
+    from archive import REPLAY, ResponseArchive
+
+    listing_pages, detail_pages = [], []
+    archive = ResponseArchive(archive_path, REPLAY)
+    try:
+        for r in archive.responses():
+            if b'product_page' in r.content:
+                detail_pages.append(r.content)
+            elif b'product_pod' in r.content:
+                listing_pages.append(r.content)
+    finally:
+        archive.close()
+
+    return listing_pages, detail_pages
+
+
+def bs4_listing(body):
+    """変更前の一覧ページの処理(詳細ページのURL抽出と次ページの検索で2回parse)"""
+
+    soup = BeautifulSoup(body, 'lxml')
+    urls = [a.attrs['href'] for a in soup.select('h3 > a')]
+    soup = BeautifulSoup(body, 'lxml')
+    next_page = soup.select_one('li.next > a')
+    return urls, next_page
+
+
+def bs4_detail(body):
+    """変更前の詳細ページの処理"""
+
+    soup = BeautifulSoup(body, 'lxml')
+    contents = soup.select_one('article > div.row')
+    table = soup.find('table')
+    return {
+        'title': contents.find('h1').text,
+        'price': table.select_one('th:-soup-contains("excl")+td').text,
+        'star': contents.select_one(
+            'div.product_main p.star-rating').attrs['class'][1],
+        'reviews': table.select_one('th:-soup-contains("reviews")+td').text,
+        'stock': table.select_one('th:-soup-contains("Availability")+td').text,
+        'upc': table.select_one('th:-soup-contains("UPC")+td').text,
+        'image_url': contents.select_one('div.item > img').attrs['src'],
+    }
+
+
+def lxml_listing(body):
+    """変更後の一覧ページの処理(1回だけparse)"""
+
+    page = PROFILE.listing_page(LISTING_URL, body)
+    return page.detail_page_urls(), page.next_page_url()
+
+
+def lxml_detail(body):
+    """変更後の詳細ページの処理"""
+
+    return PROFILE.parse_detail_page(DETAIL_URL, body)
+
+
+def measure(func, pages, repeat):
+    """1ページあたりの平均処理時間(ミリ秒)"""
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for body in pages:
+            func(body)
+    return (time.perf_counter() - start) / (repeat * len(pages)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument(
+        '--archive', default=None,
+        help='保存済みページの代わりに読み込むアーカイブのファイルパス')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.archive:
+        listing_pages, detail_pages = load_archived_pages(args.archive)
+    else:
+        listing_pages, detail_pages = load_cached_pages(args.cache_dir)
+    print(
+        f'pages: {len(listing_pages)} listing, {len(detail_pages)} detail, '
+        f'repeat {args.repeat}')
+
+    cases = (
+        ('listing', listing_pages, bs4_listing, lxml_listing),
+        ('detail', detail_pages, bs4_detail, lxml_detail),
+    )
+    for name, pages, before, after in cases:
+        if not pages:
+            continue
+        before_ms = measure(before, pages, args.repeat)
+        after_ms = measure(after, pages, args.repeat)
+        print(
+            f'{name:<8} before={before_ms:7.2f} ms/page '
+            f'after={after_ms:7.2f} ms/page '
+            f'speedup={before_ms / after_ms:5.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
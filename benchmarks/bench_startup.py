@@ -0,0 +1,141 @@
+"""
+アプリの起動時間(windowの表示まで、crawlerの準備の完了まで)を計測
+
+使用方法(リポジトリのルートディレクトリで実行):
+    python -m benchmarks.bench_startup --repeat 5
+    python -m benchmarks.bench_startup --engine async --importtime 15
+
+Note
+    各計測は新たなPythonのプロセスで実行し、プロセスの起動からの経過時間を表示(結果は中央値)
+    python: 何もimportせずに終了するまで(インタープリタの起動時間)
+    import app: GUIのモジュールの読み込みまで(crawlerモジュールは読み込まない)
+    import crawler: crawlerモジュールの読み込みまで(windowの表示後にバックグラウンドで実行)
+    Crawler(): crawlerのインスタンス化まで(キャッシュ等は一時ディレクトリに新規作成)
+    window: windowを表示するまで(ディスプレイがない環境ではn/a)
+    crawler ready: crawlerの準備が完了し、開始ボタンが有効になるまで(同上)
+    変更前は、windowを表示する前にcrawlerのimportとインスタンス化を行っていたため、
+    windowの表示までの時間はおおよそ「Crawler()」と同じ
+    --importtimeを指定すると、python -X importtimeによる読み込み時間の上位も表示
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子プロセスで実行するコード(起動からの経過時間の秒数を標準出力に出力)
+# 起動時刻は、子プロセスの起動直前に親プロセスで取得したtime.time()の値を引数で受け取る
+CASES = {
+    'python': '',
+    'import app': 'import app',
+    'import crawler': 'import {module}',
+    'Crawler()': 'import {module}; {module}.{crawler_class}()',
+}
+GUI_CASE = '''
+import tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError:
+    print('n/a n/a')
+    raise SystemExit
+import app
+root.withdraw()
+application = app.App(root, engine='{engine}')
+root.deiconify()
+root.update()
+window = time.time() - started
+while application.control.crawler is None and not application.loader.error:
+    root.update()
+    time.sleep(0.005)
+print(window, time.time() - started)
+root.destroy()
+'''
+PRELUDE = 'import sys, time\nstarted = float(sys.argv[1])\n'
+EPILOGUE = '\nprint(time.time() - started)'
+
+
+def run_child(code, work_dir):
+    """子プロセスでcodeを実行し、標準出力の最終行を返す"""
+
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    result = subprocess.run(
+        [sys.executable, '-c', PRELUDE + code, str(time.time())],
+        cwd=work_dir, env=env, capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def import_time(module, work_dir, top):
+    """python -X importtimeの結果から、累積の読み込み時間の上位top件を返す"""
+
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=work_dir, env=env, capture_output=True, text=True, check=True)
+
+    entries = []
+    for line in result.stderr.splitlines():
+        # 「import time: self [us] | cumulative | imported package」
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        entries.append((int(cumulative), name.rstrip()))
+    entries.sort(reverse=True)
+    return entries[:top]
+
+
+def format_time(value):
+    return 'n/a' if value is None else f'{value * 1000:7.1f}ms'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--engine', choices=('thread', 'async'), default='thread')
+    parser.add_argument(
+        '--repeat', type=int, default=5, help='計測の回数(結果は中央値)')
+    parser.add_argument(
+        '--importtime', type=int, default=0, metavar='N',
+        help='読み込み時間の上位N件を表示(0の場合は表示しない)')
+    args = parser.parse_args()
+
+    module, crawler_class = (
+        ('async_crawler', 'AsyncCrawler') if args.engine == 'async'
+        else ('crawler', 'Crawler'))
+
+    results = {name: [] for name in (*CASES, 'window', 'crawler ready')}
+    for _ in range(args.repeat):
+        # キャッシュ/進捗等のファイルは、計測ごとに新たな一時ディレクトリに作成
+        with tempfile.TemporaryDirectory() as work_dir:
+            for name, code in CASES.items():
+                code = code.format(module=module, crawler_class=crawler_class)
+                results[name].append(
+                    float(run_child(code + EPILOGUE, work_dir)))
+
+            window, ready = run_child(
+                GUI_CASE.format(engine=args.engine), work_dir).split()
+            if window != 'n/a':
+                results['window'].append(float(window))
+                results['crawler ready'].append(float(ready))
+
+    print(f'engine: {args.engine}, repeat: {args.repeat}')
+    for name, values in results.items():
+        median = statistics.median(values) if values else None
+        print(f'{name:<16}{format_time(median)}')
+
+    if args.importtime:
+        with tempfile.TemporaryDirectory() as work_dir:
+            for name in ('app', module):
+                print(f'\nimport {name} (cumulative):')
+                for cumulative, package in import_time(
+                        name, work_dir, args.importtime):
+                    print(f'{cumulative / 1000:8.1f}ms {package}')
+
+
+if __name__ == '__main__':
+    main()
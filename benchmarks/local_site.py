@@ -0,0 +1,364 @@
+"""
+ベンチマーク用に、books.toscrape.comを模した合成サイトをローカルで配信
+
+Note
+    実サイトと同じHTML構造(一覧ページのh3 > a、li.next > a、詳細ページのtable等)と
+    同じURL構造(catalogue/category/books/(カテゴリ)/page-N.html等)を再現しているため、
+    start_urlをローカルのURLに置き換えるだけでcrawlerをそのまま実行できる
+"""
+
+from functools import lru_cache
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+
+LISTING_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en-us">
+<head><title>{name} | Books to Scrape - Sandbox</title></head>
+<body>
+<div class="container-fluid page">
+<div class="page_inner">
+<div class="row">
+<aside class="sidebar col-sm-4 col-md-3">
+<div class="side_categories">
+<ul class="nav nav-list">
+<li><a href="{prefix}books_1/index.html">Books</a>
+<ul>
+{categories}
+</ul></li>
+</ul>
+</div>
+</aside>
+<div class="col-sm-8 col-md-9">
+<div class="page-header action"><h1>{name}</h1></div>
+<section>
+<ol class="row">
+{products}
+</ol>
+<div>
+<ul class="pager">
+{previous}
+<li class="current">Page {page} of {last_page}</li>
+{next}
+</ul>
+</div>
+</section>
+</div>
+</div>
+</div>
+</div>
+</body>
+</html>
+'''
+
+PRODUCT_POD_TEMPLATE = '''<li class="col-xs-6 col-sm-4 col-md-3 col-lg-3">
+<article class="product_pod">
+<div class="image_container">
+<a href="../../../{slug}/index.html">
+<img src="../../../../{image}" alt="{title}" class="thumbnail"></a>
+</div>
+<p class="star-rating {star}"><i class="icon-star"></i></p>
+<h3><a href="../../../{slug}/index.html" title="{title}">{title}</a></h3>
+<div class="product_price"><p class="price_color">&pound;{price}</p></div>
+</article>
+</li>'''
+
+DETAIL_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en-us">
+<head><title>{title} | Books to Scrape - Sandbox</title></head>
+<body>
+<div class="container-fluid page">
+<div class="page_inner">
+<div class="content">
+<div id="content_inner">
+<article class="product_page">
+<div class="row">
+<div class="col-sm-6">
+<div id="product_gallery" class="carousel">
+<div class="thumbnail">
+<div class="carousel-inner">
+<div class="item active">
+<img src="../../{image}" alt="{title}" />
+</div>
+</div>
+</div>
+</div>
+</div>
+<div class="col-sm-6 product_main">
+<h1>{title}</h1>
+<p class="price_color">&pound;{price}</p>
+<p class="instock availability"><i class="icon-ok"></i> {availability}</p>
+<p class="star-rating {star}"><i class="icon-star"></i></p>
+</div>
+</div>
+<div id="product_description" class="sub-header">
+<h2>Product Description</h2></div>
+<p>{description}</p>
+<div class="sub-header"><h2>Product Information</h2></div>
+<table class="table table-striped">
+<tr><th>UPC</th><td>{upc}</td></tr>
+<tr><th>Product Type</th><td>Books</td></tr>
+<tr><th>Price (excl. tax)</th><td>&pound;{price}</td></tr>
+<tr><th>Price (incl. tax)</th><td>&pound;{price}</td></tr>
+<tr><th>Tax</th><td>&pound;0.00</td></tr>
+<tr><th>Availability</th><td>{availability}</td></tr>
+<tr><th>Number of reviews</th><td>{reviews}</td></tr>
+</table>
+</article>
+</div>
+</div>
+</div>
+</div>
+</body>
+</html>
+'''
+
+STARS = ('One', 'Two', 'Three', 'Four', 'Five')
+
+# 表紙画像の種類と1枚あたりのサイズ(複数の書籍で同じ画像を共有)
+COVER_COUNT = 10
+COVER_SIZE = 20 * 1024
+
+
+class SyntheticSite(object):
+    """
+    合成サイトのページ構成とHTML生成を定義
+
+    attribute:
+        self.categories:
+            (カテゴリのslug, 表示名)のリスト
+            カテゴリのslugは実サイトと同様に「名前_番号」の形式
+
+        self.pages_per_category:
+            カテゴリごとの一覧ページ数
+
+        self.books_per_page:
+            一覧ページ1ページあたりの詳細ページ数
+
+        self.crawl_delay:
+            robots.txtに記載するCrawl-delay(Noneの場合はrobots.txtなし)
+
+        self.revisions:
+            book_idごとの更新回数(差分crawlの動作確認用、update_book()で更新)
+    """
+
+    def __init__(
+            self, categories=1, pages_per_category=3, books_per_page=20,
+            crawl_delay=None):
+        self.crawl_delay = crawl_delay
+        self.categories = [
+            (f'category-{i}_{i + 1}', f'Category {i}')
+            for i in range(1, categories + 1)
+        ]
+        self.pages_per_category = pages_per_category
+        self.books_per_page = books_per_page
+        self.revisions = {}
+
+    @property
+    def book_count(self):
+        """サイト全体の詳細ページ数"""
+
+        return (
+            len(self.categories) * self.pages_per_category *
+            self.books_per_page)
+
+    def start_url(self, base_url, category=0):
+        """crawlerの開始URL(指定したカテゴリの1ページ目)"""
+
+        slug = self.categories[category][0]
+        return f'{base_url}/catalogue/category/books/{slug}/page-1.html'
+
+    def update_book(self, book_id):
+        """詳細ページ1件分の価格を変更(生成済みのHTMLも破棄)"""
+
+        self.revisions[book_id] = self.revisions.get(book_id, 0) + 1
+        self.render.cache_clear()
+
+    def book(self, book_id):
+        """詳細ページ1件分のデータ(book_idと更新回数から決定的に生成)"""
+
+        digest = hashlib.sha1(str(book_id).encode()).hexdigest()
+        stock = book_id % 23
+        revision = self.revisions.get(book_id, 0)
+        return {
+            'slug': f'book-{book_id}_{book_id}',
+            'title': f'Synthetic Book {book_id}',
+            'price': f'{10 + (book_id + revision) % 50}.{book_id % 100:02d}',
+            'star': STARS[book_id % 5],
+            'reviews': book_id % 7,
+            'availability': (
+                f'In stock ({stock} available)' if stock else 'Out of stock'),
+            'upc': digest[:16],
+            'image': f'media/cache/{digest[:2]}/{digest[2:4]}/{digest}.jpg',
+            'description': f'Description of synthetic book {book_id}. ' * 20,
+        }
+
+    @lru_cache(maxsize=None)
+    def render(self, path):
+        """リクエストのパスに対応するHTMLを生成(該当ページがない場合はNone)"""
+
+        if path == '/robots.txt':
+            if self.crawl_delay is None:
+                return None
+            return f'User-agent: *\nCrawl-delay: {self.crawl_delay}\n'
+
+        parts = path.strip('/').split('/')
+
+        # 詳細ページ: /catalogue/book-N_N/index.html
+        if len(parts) == 3 and parts[0] == 'catalogue' and \
+                parts[2] == 'index.html' and parts[1].startswith('book-'):
+            book_id = int(parts[1].rsplit('_', 1)[1])
+            if not 0 <= book_id < self.book_count:
+                return None
+            return DETAIL_TEMPLATE.format(**self.book(book_id))
+
+        # 一覧ページ: /catalogue/category/books/(カテゴリ)/page-N.html
+        if len(parts) == 5 and parts[:3] == ['catalogue', 'category', 'books']:
+            slugs = [slug for slug, _ in self.categories]
+            if parts[3] not in slugs:
+                return None
+            page = 1 if parts[4] == 'index.html' else \
+                int(parts[4].replace('page-', '').replace('.html', ''))
+            return self.render_listing(slugs.index(parts[3]), page)
+
+        return None
+
+    def cover(self, path):
+        """
+        表紙画像のパス(media/cache/.../(ハッシュ値).jpg)に対応するbytes(該当しない場合はNone)
+
+        Note
+            画像はCOVER_COUNT種類だけのため、多くの書籍で同じ内容の画像となる
+        """
+
+        if not path.startswith('/media/cache/') or not path.endswith('.jpg'):
+            return None
+        try:
+            cover = int(path.rsplit('/', 1)[1][:-4], 16) % COVER_COUNT
+        except ValueError:
+            return None
+        header = b'\xff\xd8\xff\xe0' + f'synthetic cover {cover}'.encode()
+        return header.ljust(COVER_SIZE, b'\0')
+
+    def render_listing(self, category, page):
+        """一覧ページのHTMLを生成"""
+
+        if not 1 <= page <= self.pages_per_category:
+            return None
+
+        first_id = (
+            (category * self.pages_per_category + page - 1) *
+            self.books_per_page)
+        products = [
+            PRODUCT_POD_TEMPLATE.format(**self.book(book_id))
+            for book_id in range(first_id, first_id + self.books_per_page)
+        ]
+        categories = [
+            f'<li><a href="../{slug}/index.html">{name}</a></li>'
+            for slug, name in self.categories
+        ]
+        previous = (
+            f'<li class="previous"><a href="page-{page - 1}.html">'
+            'previous</a></li>' if page > 1 else '')
+        next_ = (
+            f'<li class="next"><a href="page-{page + 1}.html">next</a></li>'
+            if page < self.pages_per_category else '')
+
+        return LISTING_TEMPLATE.format(
+            name=self.categories[category][1],
+            prefix='../',
+            categories='\n'.join(categories),
+            products='\n'.join(products),
+            previous=previous,
+            page=page,
+            last_page=self.pages_per_category,
+            next=next_,
+        )
+
+
+class SiteRequestHandler(BaseHTTPRequestHandler):
+    """合成サイトのHTMLを返すリクエストハンドラ"""
+
+    # keep-aliveによりコネクションを再利用させる
+    protocol_version = 'HTTP/1.1'
+    # ヘッダーとbodyを別々に送信する際、Nagleアルゴリズムによる遅延を防ぐ
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        # 実サイトの応答時間を模した待機
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        path = self.path.split('?')[0]
+        if path.startswith('/media/'):
+            body = self.server.site.cover(path)
+            content_type = 'image/jpeg'
+        else:
+            html = self.server.site.render(path)
+            body = html and html.encode('utf-8')
+            content_type = 'text/html; charset=utf-8'
+        if body is None:
+            self.send_error(404)
+            return None
+
+        # bodyが変わらない限り同じETagを返し、条件付きリクエストには304で応答
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        if self.server.max_age:
+            self.send_header(
+                'Cache-Control', f'max-age={self.server.max_age}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # ベンチマーク中はアクセスログを出力しない
+        pass
+
+
+class LocalSiteServer(object):
+    """
+    合成サイトをバックグラウンドのスレッドで配信するHTTPサーバー
+
+    Note
+        withブロックで使用すると、ブロックを抜けたタイミングでサーバーを停止
+    """
+
+    def __init__(
+            self, site=None, latency=0.0, max_age=0, host='127.0.0.1',
+            port=0):
+        self.httpd = ThreadingHTTPServer((host, port), SiteRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.site = site or SyntheticSite()
+        self.httpd.latency = latency
+        # 0より大きい場合はCache-Controlヘッダーを付与(キャッシュの動作確認用)
+        self.httpd.max_age = max_age
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def site(self):
+        return self.httpd.site
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,157 @@
+import json
+import sqlite3
+
+
+class CheckpointStore(object):
+    """
+    crawlの進捗(次にcrawlする一覧ページ、処理済みの詳細ページ、scrapeデータ)をSQLiteに保存
+
+    attribute:
+        self.crawl_id:
+            crawlを識別するためのkey(crawlerの開始URL)
+            開始URLごとに1件の進捗を保存し、同じ開始URLで再開した場合に続きから処理
+            開始URLが複数の場合は、スペース区切りで連結した文字列
+
+    Note
+        scrapeデータは再開に備えた控えのため、crawlの正常終了時(finish)に削除
+        正常終了は、一覧ページの処理後に失敗したページの再試行も完了した時点
+        (再試行中に中断した場合は、再試行で取得した分も含めて続きから再開)
+        WALモードのため、書込み中に強制終了した場合でも、最後にcommitした時点の状態が残る
+        crawlerのスレッドだけが操作する前提(sqlite3の接続はスレッド間で共有しない)
+    """
+
+    def __init__(self, path, crawl_id):
+        self.crawl_id = crawl_id
+        self.finished = False
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # WALモードでは、NORMALでもcommit済みのデータは破損しない
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS crawls (
+                crawl_id TEXT PRIMARY KEY,
+                next_url TEXT,
+                current_page INTEGER NOT NULL,
+                finished INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS records (
+                crawl_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (crawl_id, url)
+            );
+            CREATE INDEX IF NOT EXISTS records_seq ON records (crawl_id, seq);
+        ''')
+        # 以前の形式(次にcrawlする一覧ページが1件だけ)のファイルには列を追加
+        columns = {
+            row[1] for row in self.conn.execute('PRAGMA table_info(crawls)')}
+        if 'pending_urls' not in columns:
+            self.conn.execute(
+                'ALTER TABLE crawls ADD COLUMN pending_urls TEXT')
+        self.conn.commit()
+
+    def load(self):
+        """
+        中断したcrawlの(次にcrawlする一覧ページのURLのリスト, ページ数)を返す
+
+        Note
+            進捗がない場合や、前回のcrawlが正常終了している場合はNone
+        """
+
+        row = self.conn.execute(
+            'SELECT next_url, pending_urls, current_page FROM crawls '
+            'WHERE crawl_id = ? AND finished = 0',
+            (self.crawl_id,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        next_url, pending_urls, current_page = row
+        if pending_urls is None:
+            return [next_url], current_page
+        return json.loads(pending_urls), current_page
+
+    def start(self, start_urls):
+        """保存済みの進捗を削除し、新たなcrawlとして記録"""
+
+        self.finished = False
+        with self.conn:
+            self.conn.execute(
+                'DELETE FROM records WHERE crawl_id = ?', (self.crawl_id,))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO crawls '
+                '(crawl_id, next_url, pending_urls, current_page, finished) '
+                'VALUES (?, ?, ?, 1, 0)',
+                (self.crawl_id, start_urls[0], json.dumps(start_urls)),
+            )
+
+    def visited_urls(self):
+        """scrape済みの詳細ページのURL"""
+
+        rows = self.conn.execute(
+            'SELECT url FROM records WHERE crawl_id = ?', (self.crawl_id,))
+        return {url for url, in rows}
+
+    def records(self):
+        """保存済みのscrapeデータを、scrapeした順番に1件ずつ返す"""
+
+        rows = self.conn.execute(
+            'SELECT data FROM records WHERE crawl_id = ? ORDER BY seq',
+            (self.crawl_id,),
+        )
+        for data, in rows:
+            yield json.loads(data)
+
+    def add_records(self, records):
+        """scrapeデータを保存(同時に、詳細ページのURLを処理済みとして記録)"""
+
+        if self.finished:
+            return None
+
+        with self.conn:
+            seq = self.conn.execute(
+                'SELECT COALESCE(MAX(seq), 0) FROM records WHERE crawl_id = ?',
+                (self.crawl_id,),
+            ).fetchone()[0]
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO records (crawl_id, seq, url, data) '
+                'VALUES (?, ?, ?, ?)',
+                [
+                    (self.crawl_id, seq + i, data['url'],
+                     json.dumps(data, ensure_ascii=False))
+                    for i, data in enumerate(records, start=1)
+                ],
+            )
+
+    def set_next_pages(self, pending_urls, current_page):
+        """
+        1ページ分の処理完了時に、次にcrawlする一覧ページ(のリスト)を記録
+
+        Note
+            最後の一覧ページの場合は空のリスト(再開の場合は、失敗したページの再試行だけ)
+        """
+
+        next_url = pending_urls[0] if pending_urls else None
+        with self.conn:
+            self.conn.execute(
+                'UPDATE crawls SET next_url = ?, pending_urls = ?, '
+                'current_page = ? WHERE crawl_id = ?',
+                (next_url, json.dumps(list(pending_urls)), current_page,
+                 self.crawl_id),
+            )
+
+    def finish(self):
+        """crawlの正常終了を記録し、保存済みのscrapeデータを削除(以降の再開では最初からcrawl)"""
+
+        self.finished = True
+        with self.conn:
+            self.conn.execute(
+                'UPDATE crawls SET finished = 1 WHERE crawl_id = ?',
+                (self.crawl_id,),
+            )
+            self.conn.execute(
+                'DELETE FROM records WHERE crawl_id = ?', (self.crawl_id,))
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,330 @@
+"""
+GUIを使わずにcrawlerを実行するコマンドラインのエントリーポイント
+
+使用方法:
+    python cli.py --output result.ndjson
+    python cli.py --engine async --workers 50 --output result.json
+    python cli.py --profile my_site.json --output result.ndjson
+    python cli.py https://books.toscrape.com/index.html --all-categories
+    python cli.py --record books.archive --output result.ndjson
+    python cli.py --replay books.archive --output result.ndjson
+    python cli.py --media-dir covers --output result.ndjson
+
+Note
+    tkinterはimportしないため、ディスプレイのないサーバー等でも実行可能
+    終了コードは、正常終了の場合0、エラーの場合1、Ctrl+Cによる取消の場合130
+"""
+
+import argparse
+from datetime import datetime
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+
+from archive import RECORD, REPLAY, ResponseArchive
+from crawler import CACHE_PATH, Crawler, fmt, logger, open_cache
+from profiles import get_profile
+from ratelimit import RateLimiter
+from transport import Transport
+
+
+# 終了コード
+EXIT_OK = 0
+EXIT_ERROR = 1
+# crawlは完了したが、最終的に失敗したページ(_failed.jsonに出力)がある場合
+EXIT_PARTIAL = 2
+EXIT_INTERRUPTED = 130
+
+
+def create_crawler(
+        start_url=None, engine='thread', max_workers=None,
+        cache_path=CACHE_PATH, cache=None, **kwargs):
+    """
+    crawlerをインスタンス化(engineに応じてCrawler/AsyncCrawlerを選択)
+
+    Note
+        max_workers以外の引数はCrawlerと同じ(Noneの場合は各crawlerのデフォルト値)
+        cacheを指定しない場合は、cache_pathのキャッシュを開く
+        asyncioのcrawlerはaiohttpが必要なため、選択された場合に限りimport
+    """
+
+    if engine == 'async':
+        from async_crawler import AsyncCrawler
+        crawler_class = AsyncCrawler
+    else:
+        crawler_class = Crawler
+
+    if max_workers:
+        kwargs['max_workers'] = max_workers
+    crawler = crawler_class(
+        start_url, cache=cache or open_cache(cache_path), **kwargs)
+
+    # GUIのログウィンドウは使用しないため、Queueへログを出力しない
+    crawler.use_log_queue = False
+    return crawler
+
+
+def create_crawlers(
+        start_urls=None, profile=None, requests_per_second=0.5,
+        cache_path=CACHE_PATH, separate=False, **kwargs):
+    """
+    crawlerを、キャッシュとRateLimiter、Transport(コネクションプール)を共有して作成
+
+    Note
+        start_urlsを指定しない場合は、プロファイルのstart_urls
+        separateがFalseの場合は、全開始URLを1つのcrawlerで処理(重複したURLは1回だけcrawl)
+        separateがTrueの場合は開始URLごとにcrawlerを作成し、同時にcrawl
+        同じホストへのリクエスト頻度は、全crawlerの合計で制限
+        その他の引数はcreate_crawlerと同じ
+    """
+
+    profile = get_profile(profile)
+    cache = open_cache(cache_path)
+    kwargs['transport'] = kwargs.get('transport') or Transport()
+    rate_limiter = RateLimiter(
+        requests_per_second,
+        max_retry_after=kwargs['transport'].max_backoff)
+
+    start_urls = list(start_urls or profile.start_urls)
+    groups = [[url] for url in start_urls] if separate else [start_urls]
+
+    return [
+        create_crawler(
+            urls, cache=cache, profile=profile,
+            rate_limiter=rate_limiter, **kwargs)
+        for urls in groups
+    ]
+
+
+def output_paths(output_path, count):
+    """crawlerが複数の場合は、出力先のファイル名に連番を付与"""
+
+    if count == 1:
+        return [output_path]
+
+    root, ext = os.path.splitext(output_path)
+    return [f'{root}-{i}{ext}' for i in range(1, count + 1)]
+
+
+def run(crawler, output_path, output_format=None, resume=False,
+        incremental=False, discover_categories=False):
+    """
+    crawlを実行し、完了するまで待機(ライブラリとして利用する場合の入口)
+
+    Note
+        crawlのエラーはそのままraise、Ctrl+C(KeyboardInterrupt)の場合は
+        crawlerを取消して終了を待ってからraise
+        いずれの場合も、それまでのscrapeデータはファイルに出力済み
+    """
+
+    run_many(
+        [crawler], [output_path], output_format, resume, incremental,
+        discover_categories)
+    return crawler
+
+
+def run_many(crawlers, paths, output_format=None, resume=False,
+             incremental=False, discover_categories=False):
+    """複数のcrawlerを同時に実行し、すべて完了するまで待機(エラー等の扱いはrunと同じ)"""
+
+    for crawler, path in zip(crawlers, paths):
+        crawler.output_path = path
+        crawler.output_format = output_format
+        crawler.resume = resume
+        crawler.incremental = incremental
+        crawler.discover_categories = discover_categories
+        crawler.start_crawler_thread()
+
+    try:
+        # join()はCtrl+Cで中断できないため、短い間隔に区切って待機
+        for crawler in crawlers:
+            while crawler.crawler_thread.is_alive():
+                crawler.crawler_thread.join(0.2)
+    except KeyboardInterrupt:
+        for crawler in crawlers:
+            crawler.crawler_alive_flag = False
+            # 停止中の場合も取消を検知できるよう再開
+            crawler.crawler_event.set()
+        for crawler in crawlers:
+            crawler.crawler_thread.join()
+        raise
+
+    for crawler in crawlers:
+        if crawler.error:
+            raise crawler.error
+    return crawlers
+
+
+def replay_start_urls(archive_path):
+    """アーカイブに記録されている開始URL(ファイルがない場合等は空のリスト)"""
+
+    try:
+        archive = ResponseArchive(archive_path, REPLAY)
+    except sqlite3.Error:
+        return []
+    try:
+        return archive.start_urls()
+    finally:
+        archive.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Crawler (headless)',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        'start_urls', nargs='*', metavar='start_url',
+        help='crawlerの開始URL(複数指定が可能、省略した場合はプロファイルの開始URL)')
+    parser.add_argument(
+        '--all-categories', action='store_true',
+        help='開始URLのページのサイドバーから全カテゴリを取得してcrawl')
+    parser.add_argument(
+        '--separate', action='store_true',
+        help='開始URLごとに別々のcrawlerで同時にcrawlし、別々のファイルに出力')
+    parser.add_argument(
+        '--profile', default=None,
+        help='サイトのプロファイル名、またはjsonファイルのパス'
+             '(省略した場合はbooks.toscrape.com)')
+    parser.add_argument(
+        '-o', '--output',
+        default=datetime.now().strftime('%Y%m%d%H%M%S') + '_scrape.json',
+        help='出力先のファイルパス(crawlerが複数の場合は連番を付与)')
+    parser.add_argument(
+        '--format',
+        choices=('json', 'ndjson', 'csv', 'sqlite', 'parquet'), default=None,
+        help='出力形式(省略した場合は出力先の拡張子から判定)')
+    parser.add_argument(
+        '--engine', choices=('thread', 'async'), default='thread',
+        help='thread: requests/threadingのcrawler, async: asyncioのcrawler')
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='詳細ページを並行して処理する数(省略した場合は各crawlerのデフォルト)')
+    parser.add_argument(
+        '--rps', type=float, default=0.5,
+        help='同一ホストへの1秒あたりのリクエスト数の上限(0の場合は制限なし)')
+    parser.add_argument(
+        '--parse-processes', type=int, default=0,
+        help='詳細ページのparse処理を実行するプロセス数(0の場合は同じスレッドでparse)')
+    parser.add_argument(
+        '--cache', default=CACHE_PATH, help='レスポンスのキャッシュの保存先')
+    parser.add_argument(
+        '--connect-timeout', type=float, default=3.5,
+        help='接続の確立を待機する秒数')
+    parser.add_argument(
+        '--read-timeout', type=float, default=10.0,
+        help='レスポンスの受信を待機する秒数')
+    parser.add_argument(
+        '--retries', type=int, default=3,
+        help='5xx/429のレスポンスや接続の切断/タイムアウトの場合に再試行する回数')
+    parser.add_argument(
+        '--max-backoff', type=float, default=60.0,
+        help='再試行までの待機時間の上限(秒)、Retry-Afterの秒数もこの上限まで')
+    parser.add_argument(
+        '--latency-target', type=float, default=2.0,
+        help='同時リクエスト数を増やすp95レイテンシの目標値(秒)、超えた場合は減らす')
+    parser.add_argument(
+        '--max-error-rate', type=float, default=0.1,
+        help='同時リクエスト数を増やす429/5xx/タイムアウトの割合の上限、超えた場合は減らす')
+    parser.add_argument(
+        '--resume', action='store_true', help='中断したcrawlを続きから再開')
+    parser.add_argument(
+        '--overwrite', action='store_true',
+        help='sqliteの出力先に既存のrecordsテーブルがある場合に上書き')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='前回から新規/変更のあったデータだけを出力')
+    parser.add_argument(
+        '--metrics-file', default=None,
+        help='crawl中の統計をPrometheusのテキスト形式で出力するファイルパス'
+             '(crawlerが複数の場合は連番を付与)')
+    parser.add_argument(
+        '--media-dir', default=None,
+        help='scrapeデータの画像等をダウンロードして保存するディレクトリ'
+             '(内容のハッシュ値をファイル名とし、upcごとのパスをindex.sqlite3に記録)')
+    parser.add_argument(
+        '--media-workers', type=int, default=4,
+        help='画像等を並行してダウンロードする数')
+    archive = parser.add_mutually_exclusive_group()
+    archive.add_argument(
+        '--record', default=None, metavar='ARCHIVE',
+        help='受信した全レスポンスを記録するアーカイブのファイルパス'
+             '(crawlerが複数の場合は連番を付与)')
+    archive.add_argument(
+        '--replay', default=None, metavar='ARCHIVE',
+        help='記録済みのアーカイブだけでcrawlし、ネットワークへは送信しない'
+             '(開始URLを省略した場合は記録時の開始URL)')
+    parser.add_argument(
+        '--log-level', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+        default='INFO', help='標準エラー出力に表示するログのレベル')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """コマンドラインから実行し、終了コードを返す"""
+
+    # parse処理用の子プロセスを正しく起動させるため
+    multiprocessing.freeze_support()
+
+    args = parse_args(argv)
+
+    # ログは標準エラー出力に表示
+    handler = logging.StreamHandler()
+    handler.setFormatter(fmt)
+    logger.addHandler(handler)
+
+    archive_path = args.record or args.replay
+    start_urls = args.start_urls
+    if args.replay and not start_urls:
+        start_urls = replay_start_urls(args.replay)
+
+    try:
+        crawlers = create_crawlers(
+            start_urls, args.profile, args.rps, args.cache,
+            args.separate,
+            engine=args.engine,
+            max_workers=args.workers,
+            parse_processes=args.parse_processes,
+            transport=Transport(
+                connect_timeout=args.connect_timeout,
+                read_timeout=args.read_timeout,
+                retries=args.retries,
+                max_backoff=args.max_backoff,
+            ),
+        )
+        logger.setLevel(getattr(logging, args.log_level))
+        for crawler in crawlers:
+            crawler.concurrency.latency_target = args.latency_target
+            crawler.concurrency.error_threshold = args.max_error_rate
+            crawler.media_dir = args.media_dir
+            crawler.media_workers = args.media_workers
+            crawler.overwrite = args.overwrite
+        if archive_path:
+            for crawler, path in zip(
+                    crawlers, output_paths(archive_path, len(crawlers))):
+                crawler.archive_path = path
+                crawler.archive_mode = RECORD if args.record else REPLAY
+        if args.metrics_file:
+            for crawler, path in zip(
+                    crawlers, output_paths(args.metrics_file, len(crawlers))):
+                crawler.metrics_path = path
+        run_many(
+            crawlers, output_paths(args.output, len(crawlers)), args.format,
+            args.resume, args.incremental, args.all_categories)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        logger.error(f'[Crawler] {e}')
+        return EXIT_ERROR
+    finally:
+        logger.removeHandler(handler)
+
+    if any(crawler.retry_queue.dead_letters for crawler in crawlers):
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import threading
+import time
+
+from metrics import percentile
+
+
+def is_overload_status(status_code):
+    """サイトの過負荷を示すステータスコード(429、5xx)か"""
+
+    return status_code == 429 or status_code >= 500
+
+
+class AdaptiveConcurrency(object):
+    """
+    ネットワークへ同時に送信するリクエスト数の上限を、レイテンシとエラー率から自動で調整(AIMD)
+
+    attribute:
+        self.limit:
+            現在の同時リクエスト数の上限(min_limit以上、max_limit以下)
+
+        self.max_limit:
+            上限の最大値(ワーカー数、asyncioのcrawlerでは同時に処理する詳細ページ数)
+
+        self.latency_target:
+            p95レイテンシ(秒)の目標値、超えた場合は上限を減らす
+
+        self.error_threshold:
+            429/5xx/タイムアウト等の割合の上限、超えた場合は上限を減らす
+
+        self.min_samples:
+            上限を調整する判断に必要な、最低限のレスポンス数
+
+        self.decrease_factor:
+            上限を減らす場合に掛ける値
+
+        self.slow_start:
+            Trueの間(最初に上限を減らすまで)は、上限を1回ごとに2倍に増やす
+            以降は1ずつ増やす
+
+    Note
+        上限を減らす判断は、min_samples件のレスポンスごとに行い、超過を検知したら素早く減らす
+        上限を増やす判断は、現在の上限と同じ件数(最低min_samples件)のレスポンスが
+        すべて目標値以内の場合に行うため、サイトが耐えられる上限付近で落ち着く
+        上限を減らした時点で送信中だったリクエストは、減らす前の上限による結果のため判断に含めない
+        キャッシュから返すレスポンスや、RateLimiterによる待機時間は計測しない
+    """
+
+    def __init__(
+            self, max_limit, min_limit=1, initial=None, latency_target=2.0,
+            error_threshold=0.1, min_samples=10, decrease_factor=0.5):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = min(max(1, min_limit), self.max_limit)
+        self.limit = min(
+            self.max_limit, max(self.min_limit, initial or self.min_limit))
+        self.latency_target = latency_target
+        self.error_threshold = error_threshold
+        self.min_samples = min_samples
+        self.decrease_factor = decrease_factor
+        self.slow_start = True
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        # 前回の調整以降のレスポンスのレイテンシと、エラーの件数
+        self.samples = []
+        self.errors = 0
+        self.last_decrease = 0.0
+        # 上限を変更した際に呼び出す関数(変更前, 変更後, 理由)
+        self.on_change = None
+
+    def acquire(self, is_alive=lambda: True):
+        """
+        送信中のリクエスト数が上限未満になるまで待機し、送信中として数えてTrueを返す
+
+        Note
+            取消操作に素早く反応できるよう短い間隔に区切って待機し、
+            is_aliveがFalseを返した場合は送信中として数えずにFalseを返す
+            (呼び出し元は、上限を超えてリクエストを送信しない)
+        """
+
+        with self.condition:
+            while is_alive():
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return True
+                self.condition.wait(0.2)
+            return False
+
+    def try_acquire(self):
+        """上限未満の場合だけ送信中として数えてTrueを返す(待機しない)"""
+
+        with self.condition:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, started, error=False):
+        """
+        リクエスト1件分の送信を終了し、結果(レイテンシとエラーの有無)から上限を調整
+
+        Note
+            startedは送信を開始した時刻(time.monotonic基準)
+            RateLimiterによる待機の後の時刻とし、待機時間はレイテンシに含めない
+            startedがNoneの場合(取消により送信しなかった場合)は、結果として記録しない
+        """
+
+        latency = None if started is None else time.monotonic() - started
+        with self.condition:
+            self.in_flight -= 1
+            change = None
+            if latency is not None and started >= self.last_decrease:
+                change = self.observe(latency, error)
+            self.condition.notify_all()
+
+        if change and self.on_change:
+            self.on_change(*change)
+
+    def observe(self, latency, error):
+        """
+        結果を記録し、上限を変更した場合は(変更前, 変更後, 理由)を返す
+
+        Note
+            self.conditionを取得した状態で呼び出す
+        """
+
+        self.samples.append(latency)
+        if error:
+            self.errors += 1
+
+        count = len(self.samples)
+        if count < self.min_samples:
+            return None
+
+        p95 = percentile(sorted(self.samples), 95)
+        error_rate = self.errors / count
+        previous = self.limit
+        if error_rate > self.error_threshold or p95 > self.latency_target:
+            # 目標値を超えた場合は、上限を素早く減らす
+            self.limit = max(
+                self.min_limit, int(self.limit * self.decrease_factor))
+            self.slow_start = False
+            self.last_decrease = time.monotonic()
+        elif count >= self.limit:
+            # 現在の上限で目標値以内に収まった場合は、上限を増やす
+            increase = self.limit if self.slow_start else 1
+            self.limit = min(self.max_limit, self.limit + increase)
+        else:
+            return None
+        reason = f'p95 {p95:.2f}s, error rate {error_rate:.0%}'
+
+        self.samples = []
+        self.errors = 0
+        if self.limit == previous:
+            return None
+        return previous, self.limit, reason
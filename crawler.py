@@ -1,45 +1,100 @@
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import BrokenExecutor, Future, ThreadPoolExecutor
 from datetime import timedelta
+from functools import partial
+from itertools import islice
 import logging
+import os
 import queue
-import random
-import re
 import threading
 import time
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit
 
-from bs4 import BeautifulSoup
 from cachecontrol import CacheControl
-from cachecontrol.caches import FileCache
-import pandas as pd
 import requests
 from requests.exceptions import ConnectionError, ReadTimeout
 
+from archive import RECORD, ResponseArchive
+from checkpoint import CheckpointStore
+from concurrency import AdaptiveConcurrency
+from events import (
+    CANCELLED, FAILED, FINISHED, PAUSED, PROGRESS, RESUMED, STARTED,
+    EventChannel)
+from frontier import URLFrontier
+from incremental import IncrementalStore
+from media import CHUNK_SIZE, MediaStage, MediaStore
+from metrics import Metrics, MetricsExporter, format_latency
+from pipeline import ParseStage
+from profiles import get_profile
+from ratelimit import RateLimitedCacheAdapter, RateLimiter
+from retry_queue import (
+    DETAIL_PAGE, LISTING_PAGE, RequestError, RetryQueue, check_status,
+    failed_pages_path)
+from sqlite_cache import SQLiteCache
+from transport import Transport, pool_stats
+from writers import open_writer
+
 
 # GUIに表示させるためのログ設定
 logger = logging.getLogger(__name__)
+# リクエストごとの詳細やscrapeデータの各項目はDEBUGで出力
+# (GUIで表示レベルにDEBUGを選択した場合だけ、Crawler.set_log_levelで下げる)
 logger.setLevel(logging.INFO)
 fmt = logging.Formatter('[%(asctime)s] (%(levelname)s) %(message)s')
+# GUIへ渡すログのQueueに保持する上限数
+LOG_QUEUE_SIZE = 10000
 
+# 以前のFileCacheのディレクトリ(キャッシュが空の場合に1回だけ取り込む)
 CACHE_DIR = './.webcache'
+CACHE_PATH = './.webcache.sqlite3'
+CHECKPOINT_PATH = './.checkpoint.sqlite3'
+INCREMENTAL_PATH = './.incremental.sqlite3'
+
+
+def open_cache(path=CACHE_PATH, legacy_dir=CACHE_DIR):
+    """
+    SQLiteCacheを開き、キャッシュが空の場合は以前のFileCacheのレスポンスを取り込む
+
+    Note
+        取り込み後も.webcacheディレクトリは削除しない(不要であれば手動で削除)
+    """
+
+    cache = SQLiteCache(path)
+    if cache.total_size == 0 and os.path.isdir(legacy_dir):
+        cache.import_file_cache(legacy_dir)
+    return cache
 
 
 class QueueHandler(logging.Handler):
     """
     ログの出力先をQueueに変更するための独自Handler
     loggingのHandlerクラスをを継承(emit関数をオーバーライド)
+
+    attribute:
+        self.dropped:
+            Queueが上限に達していたため破棄したログの数
+
+    Note
+        フォーマットはログを出力したスレッド(crawler/ワーカー)で適用し、
+        GUIのスレッドでは(ログレベル, フォーマット済みの文字列)を表示するだけ
+        Queueが上限に達している場合も待機せずに破棄するため、crawlerの処理は止まらない
     """
 
     def __init__(self, log_queue):
         super().__init__()
         # インスタンス化時にQueueを受け取り、ログの出力先として定義
         self.log_queue = log_queue
+        self.dropped = 0
 
     def emit(self, record):
         """ログ出力に応じて呼び出されるlogging.Handlerクラスの関数"""
 
         # ログ出力のタイミングで、ログをQueueにputすることで出力先を変更
-        self.log_queue.put(record)
+        # emitはHandlerのロックを取得した状態で呼び出されるため、破棄数の加算も排他制御済み
+        try:
+            self.log_queue.put_nowait((record.levelname, self.format(record)))
+        except queue.Full:
+            self.dropped += 1
 
 
 class Crawler(object):
@@ -59,55 +114,248 @@ class Crawler(object):
             crawlerのより詳細な状態を、以下のstatusから設定することで管理
             GUIから状態変更は行わず、状態変化に連動したGUIの初期化等を行う
 
+        self.events(EventChannelオブジェクト):
+            crawlerの状態遷移(開始/停止/再開/進捗/終了/取消/エラー)をGUI等へ通知
+            GUIはcrawler_statusを監視せず、購読したイベントに応じて表示内容等を更新
+            終了/取消/エラーのイベントは、出力ファイルを閉じてスレッドが終了する直前に通知
+
         self.status:
             crawlerのより詳細な状態を定義
                 none: 初期状態、処理正常終了後
                 run: 処理中
                 pause: 停止中
                 cancel: 取消終了後、エラーによる終了後
+
+        self.log_queue/self.queue_handler:
+            GUIのログウィンドウに渡すログのQueueと、そのQueueに出力するHandler
+            Handlerはcrawlの実行中だけloggerに追加するため、インスタンスを
+            複数作成しても、実行していないcrawlerのQueueにログは溜まらない
+            self.use_log_queueがFalseの場合は追加しない(GUIを使用しない場合)
+
+        self.max_workers:
+            詳細ページを並行してcrawl/scrapeするワーカー(スレッド)数
+
+        self.concurrency(AdaptiveConcurrencyオブジェクト):
+            ネットワークへ同時に送信するリクエスト数の上限(最大max_workers)
+            p95レイテンシと429/5xx/タイムアウトの割合が目標値以内の間は上限を増やし、
+            超えた場合は半分に減らす(AIMD)ため、サイトが耐えられる並行数に自動で調整
+            上限を変更した場合はログに出力し、GUIの統計にも現在の上限を表示
+
+        self.rate_limiter(RateLimiterオブジェクト):
+            全ワーカーで共有する、ホストごとのリクエスト頻度の制限
+            キャッシュから返すレスポンスには適用しない
+
+        self.parse_processes:
+            詳細ページのparse処理を実行するプロセス数
+            0の場合は、リクエストしたワーカーのスレッドでそのままparse
+
+        self.resume:
+            Trueの場合、前回取消/エラー等により中断したcrawlを続きから再開
+            進捗はself.checkpoint_pathのSQLiteに、1ページ分の処理ごとに保存
+
+        self.overwrite:
+            Trueの場合、sqliteの出力先に既存のrecordsテーブルがあれば上書き
+            Falseの場合はエラーとして終了(再開の場合は、中断したcrawlの出力として上書き)
+
+        self.incremental:
+            Trueの場合、前回から新規/変更のあった詳細ページのデータだけを出力(差分crawl)
+            詳細ページの状態(ETag/Last-Modified/bodyのハッシュ値)は
+            self.incremental_pathのSQLiteに保存し、条件付きリクエストで変更の有無を確認
+
+        self.cache(CacheControlのキャッシュオブジェクト):
+            レスポンスのキャッシュ(指定がない場合はCACHE_PATHのSQLiteCache)
+            複数のcrawlerで同じキャッシュ/RateLimiterを共有することも可能
+
+        self.profile(SiteProfileオブジェクト):
+            crawlするサイトのプロファイル(開始URL、一覧ページ/詳細ページのXPath)
+            プロファイル名、jsonファイルのパスでも指定可能(Noneの場合はbooks.toscrape.com)
+
+        self.start_urls:
+            crawlerの開始URL(一覧ページ)のリスト、先頭から順に次ページがなくなるまでcrawl
+            start_urlにリストを渡すと複数指定が可能(Noneの場合はプロファイルの開始URL)
+            self.start_urlは先頭の開始URL(GUIの表示用)
+
+        self.discover_categories:
+            Trueの場合、開始URLのページのサイドバーから全カテゴリの一覧ページを取得し、
+            それらを開始URLとしてcrawl(サイト全体を1回の処理でcrawl)
+
+        self.url_frontier(URLFrontierオブジェクト):
+            crawl済み/crawl予定のURL
+            複数のカテゴリに同じ詳細ページがある場合も、リクエストは1回だけ
+
+        self.transport(Transportオブジェクト):
+            コネクションプール、接続/受信のタイムアウト、再試行の設定
+            5xx/429のレスポンスや接続の切断は、指数関数的に待機時間を延ばして再試行
+            同じTransportを渡したcrawler同士は、コネクションプールを共有
+
+        self.retry_attempts/self.retry_delay:
+            上記の再試行でも失敗したページの、1ページあたりの試行回数の上限と、
+            最初の再試行までの待機時間(秒)
+            失敗したページはcrawlごとのRetryQueueに登録し、他のページの処理を続けながら
+            時間をおいて再試行(404等や、parseに失敗したページは再試行しない)
+            最終的に失敗したページは、出力先のファイル名に「_failed」を付与したjsonに出力
+
+        self.metrics(Metricsオブジェクト):
+            1秒あたりのリクエスト数、fetch/parseのレイテンシ、キャッシュのヒット率、
+            受信したサイズ、キューの長さ等(crawlごとに作成、snapshot()で参照)
+
+        self.metrics_path:
+            指定した場合、crawl中にself.metricsをPrometheusのテキスト形式で
+            self.metrics_intervalの間隔でファイルに出力
+
+        self.archive_path/self.archive_mode:
+            指定した場合、self.archive_pathのResponseArchiveを利用
+                record: 受信した全レスポンスをアーカイブに記録
+                replay: アーカイブに記録済みのレスポンスだけでcrawlし、ネットワークへは送信しない
+            replayの場合はリクエスト頻度の制限もないため、parse処理や出力の変更を
+            同じレスポンスに対して何度でも素早く実行可能(アーカイブにないURLは失敗したページ)
+
+        self.media_dir:
+            指定した場合、scrapeデータの画像等(プロファイルのmediaの項目のURL)を
+            self.media_workers件ずつ並行してダウンロードし、MediaStoreとして保存
+            ファイル名は内容のハッシュ値(重複した画像は1つだけ)とし、
+            keyの項目(upc)ごとのパスはself.media_dirのindex.sqlite3に記録
+            保存済みの画像は再取得しないため、再開や再実行の場合は続きからダウンロード
     """
 
-    def __init__(self):
-        self.start_url = (
-            'https://books.toscrape.com/'
-            'catalogue/category/books/fantasy_19/page-1.html'
-        )
+    def __init__(
+            self, start_url=None, max_workers=4,
+            requests_per_second=0.5, burst=1, jitter=0.5, parse_processes=0,
+            checkpoint_path=CHECKPOINT_PATH, incremental_path=INCREMENTAL_PATH,
+            cache=None, profile=None, rate_limiter=None, transport=None,
+            concurrency=None):
+        self.profile = get_profile(profile)
+        if isinstance(start_url, str):
+            start_url = [start_url]
+        self.start_urls = list(start_url or self.profile.start_urls)
+        self.start_url = self.start_urls[0]
         self.encoding = 'utf-8'
         # sessionは、HTTPヘッダー等の設定やユーザー認証情報を引き継ぐほか、
         # 確立したTCPコネクションも引き継ぐのでパフォーマンス向上
+        # (コネクションプールはTransportが保持し、同じTransportのcrawler間で共有)
         session = requests.Session()
-        self.session_cache = CacheControl(session, FileCache(CACHE_DIR))
-        # GUIのボタン操作によりappモジュールからファイルパスが渡される
+        self.transport = transport or Transport()
+        session.headers.update(self.transport.headers)
+        self.rate_limiter = rate_limiter or RateLimiter(
+            requests_per_second, burst, jitter, self.transport.max_backoff)
+        self.concurrency = concurrency or AdaptiveConcurrency(max_workers)
+        self.concurrency.on_change = self.concurrency_changed
+        # ネットワークへ送信する場合だけ頻度を制限するAdapterを、CacheControlに組み込む
+        # コネクションプールは、ワーカーが同時にリクエストしても待機しないサイズ
+        # (Transportを共有する場合は、全crawlerのワーカーの合計)
+        adapter_class = partial(
+            RateLimitedCacheAdapter,
+            rate_limiter=self.rate_limiter,
+            is_alive=self.is_alive,
+            concurrency=self.concurrency,
+            **self.transport.adapter_kwargs(max_workers, self.is_alive),
+        )
+        self.cache = cache or open_cache()
+        self.session_cache = CacheControl(
+            session, self.cache, adapter_class=adapter_class)
+        # GUIのボタン操作によりappモジュールからファイルパスと再開/差分の有無が渡される
         self.output_path = None
+        # 出力形式(Noneの場合は出力先のファイルパスの拡張子から判定)
+        self.output_format = None
+        self.resume = False
+        self.overwrite = False
+        self.incremental = False
+        self.discover_categories = False
+        self.retry_attempts = 3
+        self.retry_delay = 10.0
+        self.metrics = Metrics()
+        self.metrics_path = None
+        self.metrics_interval = 5.0
+        self.archive_path = None
+        self.archive_mode = None
+        self.media_dir = None
+        self.media_workers = 4
+        self.checkpoint_path = checkpoint_path
+        self.incremental_path = incremental_path
         self.crawler_event = threading.Event()
         self.status = ('none', 'run', 'pause', 'cancel')
         self.crawler_status = self.status[0]
+        self.events = EventChannel()
+
+        self.max_workers = max_workers
+        self.parse_processes = parse_processes
+        # ワーカー間で共有するカウントや状態を更新する際のロック
+        self.counter_lock = threading.Lock()
+        self.pause_lock = threading.Lock()
 
         # QueueHandlerによるログの出力先としてQueueをインスタンス化
-        self.log_queue = queue.Queue()
+        self.log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
         self.queue_handler = QueueHandler(self.log_queue)
         self.queue_handler.setFormatter(fmt)
-        logger.addHandler(self.queue_handler)
+        self.queue_handler.setLevel(logging.INFO)
+        self.use_log_queue = True
+
+    def set_log_level(self, level):
+        """
+        Queueに出力するログのレベルを変更(GUIの表示レベルの選択に連動)
+
+        Note
+            DEBUGのログはloggerのレベルも下げた場合だけ作成されるため、
+            DEBUGを選択した場合だけloggerもDEBUGとし、それ以外は既定のINFOに戻す
+        """
+
+        self.queue_handler.setLevel(level)
+        logger.setLevel(min(level, logging.INFO))
 
     def start_crawler_thread(self):
         """crawlerのスレッド作成/開始処理"""
 
         self.execute_time = time.time()
-        self.crawler_thread = threading.Thread(target=self.run_crawler)
+        self.crawler_thread = threading.Thread(target=self.run_crawler_thread)
+        # crawlerのスレッドを終了させた例外(正常終了/取消の場合はNone)
+        self.error = None
 
         # crawlerの状態変更等
         self.crawler_status = self.status[1]
         self.crawler_alive_flag = True
 
-        self.crawler_thread.start()
-
         # ログに表示するカウント関連の初期化
+        # スレッド開始直後からワーカーが加算するため、必ずstart()より前に記述
         self.result_counter = {
             'Request sent count': 0,
             'Response received count': 0,
             'Status code count': defaultdict(int),
             'Scraped content count': 0,
+            'Unchanged page count': 0,
+            'Retried page count': 0,
+            'Failed page count': 0,
         }
+        self.metrics = Metrics()
+
+        # crawlの実行中だけ、GUIのログウィンドウへのQueueにログを出力
+        if self.use_log_queue:
+            logger.addHandler(self.queue_handler)
+        self.crawler_thread.start()
+
+    def run_crawler_thread(self):
+        """
+        crawlerのスレッドの処理(スレッドを終了させた例外をself.errorに記録)
+
+        Note
+            例外はスレッドの外へraiseせず、GUIはFAILEDの通知、cli.run_manyはself.errorで扱う
+            (threading.excepthookによるトレースバックの表示は、DEBUGのログだけ)
+        """
+
+        try:
+            self.run_crawler()
+        except Exception as e:
+            logger.debug('Crawler thread stopped by an error', exc_info=True)
+            self.error = e
+            self.crawler_status = self.status[3]
+            self.events.publish(FAILED, error=e)
+            return None
+        finally:
+            logger.removeHandler(self.queue_handler)
+
+        # 正常終了/取消のいずれかを、出力したscrapeデータ数とともに通知
+        kind = CANCELLED if self.crawler_status == self.status[3] \
+            else FINISHED
+        self.events.publish(kind, records=self.writer.count)
 
     def run_crawler(self):
         """作成したスレッド上で処理されるcrawlerの全体処理"""
@@ -117,254 +365,820 @@ class Crawler(object):
         # crawlerの状態変更等
         self.crawler_event.set()
         self.crawler_status = self.status[1]
+        self.events.publish(STARTED, start_urls=self.start_urls)
 
-        # 最終的なscrapeデータの格納場所
-        self.data_list = []
+        # scrapeデータの出力先(1ページ分scrapeするごとに追記)
+        # 拡張子に応じて、json(配列)/ndjson(1行1件)/csv/sqlite/parquet形式で出力
+        self.writer = open_writer(
+            self.output_path, self.output_format, schema=self.profile.schema,
+            overwrite=self.overwrite or self.resume)
         # ログ表示用のページ数
         self.current_page = 1
+        # ワーカーのスレッドで発生した例外(crawlerのスレッドで改めてraise)
+        self.worker_error = None
+        # 失敗したページの再試行待ち/dead-letter
+        self.retry_queue = RetryQueue(self.retry_attempts, self.retry_delay)
+        self.start_metrics()
+
+        self.open_archive()
+        self.open_media()
+        # 進捗の保存先を開き、再開の場合は中断した一覧ページのURLを取得
+        listing_urls = self.open_checkpoint()
+        self.open_incremental()
+
+        # parse処理を別プロセスで実行する場合のステージ(crawlごとに作成/終了)
+        self.parse_stage = None
+        if self.parse_processes:
+            self.parse_stage = ParseStage(self.parse_processes, self.profile)
 
-        time.sleep(random.randint(1, 3))
-        # 自己定義した関数内でリクエスト
-        r = self.try_request(self.start_url)
-        r.encoding = self.encoding
-
-        # start_urlのレスポンスを元に詳細ページのcrawl/scrape実行
-        self.scraping_detail_page(r)
+        try:
+            # robots.txtのCrawl-delayをリクエスト頻度の制限に反映
+            for url in self.robots_txt_urls():
+                self.load_robots_txt(url)
+
+            # 新たなcrawlの場合は、開始URL(または取得したカテゴリ)から処理
+            if listing_urls is None:
+                listing_urls = self.discover_start_urls()
+                self.checkpoint.start(listing_urls)
+
+            # 最初の一覧ページから順に、詳細ページのcrawl/scrape実行
+            self.scraping_detail_page(listing_urls)
+            # 失敗したページの再試行まで完了した場合だけ、正常終了として記録
+            if self.is_alive():
+                self.checkpoint.finish()
+        finally:
+            if self.parse_stage:
+                self.parse_stage.shutdown()
+            # 残りの画像等のダウンロードの完了を待機(取消の場合は取消)
+            if self.media_stage:
+                self.media_stage.shutdown(cancel=not self.is_alive())
+            self.close_media()
+            self.checkpoint.close()
+            if self.incremental_store:
+                self.incremental_store.close()
+            if self.archive is not None:
+                self.archive.close()
+            # 取消やエラーによる終了でも、それまでのscrapeデータは出力済みのファイルに残す
+            self.output_file()
+            self.stop_metrics()
 
-        # 正常終了した場合だけjsonファイル出力
+        # 正常終了した場合だけcrawlerの状態等変更
         if not self.crawler_status == self.status[3]:
-            self.output_file()
-            # crawlerの状態等変更
             self.crawler_status = self.status[0]
 
-    def try_request(self, url):
-        """リクエスト処理を一元管理"""
+    def start_metrics(self):
+        """キューの長さ等の現在値をself.metricsに登録し、必要に応じてファイル出力を開始"""
 
-        # リクエストとレスポンスの総数を加算
-        self.result_counter['Request sent count'] += 1
-        self.result_counter['Response received count'] += 1
+        self.metrics.set_gauge('retry_queue', lambda: len(self.retry_queue))
+        self.metrics.set_gauge('log_queue', self.log_queue.qsize)
+        self.metrics.set_gauge(
+            'concurrency_limit', lambda: self.concurrency.limit)
+        self.metrics.set_gauge(
+            'in_flight_requests', lambda: self.concurrency.in_flight)
+
+        self.metrics_exporter = None
+        if self.metrics_path:
+            self.metrics_exporter = MetricsExporter(
+                self.metrics, self.metrics_path, self.metrics_interval)
+            self.metrics_exporter.start()
+
+    def stop_metrics(self):
+        """ファイル出力を終了し、最終的な値を出力"""
+
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
+
+    def open_checkpoint(self):
+        """
+        進捗の保存先を開き、再開の場合は次にcrawlする一覧ページのURLのリストを返す
+
+        Note
+            再開の場合は、保存済みのscrapeデータを今回の出力先に改めて出力し、
+            scrape済みの詳細ページはcrawlの対象から除外
+            再開ではない場合や、再開できる進捗がない場合はNoneを返し、最初からcrawl
+            (進捗の削除は、開始URLが決まった時点でcheckpoint.start()により行う)
+        """
+
+        self.checkpoint = CheckpointStore(
+            self.checkpoint_path, ' '.join(self.start_urls))
+        # crawl済み/crawl予定のURL(再開の場合は、scrape済みの詳細ページのURLを登録)
+        self.url_frontier = URLFrontier()
+
+        state = self.checkpoint.load() if self.resume else None
+        if not state:
+            return None
+
+        listing_urls, self.current_page = state
+        self.url_frontier.update(self.checkpoint.visited_urls())
+        # 保存済みのscrapeデータを一度にメモリ上に読み込まないよう、1000件ずつ出力
+        restored = self.checkpoint.records()
+        while True:
+            records = list(islice(restored, 1000))
+            if not records:
+                break
+            self.writer.write_many(records)
+            # 中断により未保存の画像等があれば、続きからダウンロード
+            self.download_media(records)
+
+        logger.info(
+            f'----- Crawler Resume page[{self.current_page}] '
+            f'({self.writer.count} items restored) -----')
+
+        return listing_urls
+
+    def robots_txt_urls(self):
+        """開始URLのホストごとに1件ずつ、robots.txtを取得するURL"""
+
+        hosts = {}
+        for url in self.start_urls:
+            hosts.setdefault(urlsplit(url).netloc, url)
+        return list(hosts.values())
+
+    def discover_start_urls(self):
+        """
+        crawlを開始する一覧ページのURLのリストを返す
+
+        Note
+            self.discover_categoriesがTrueの場合は、開始URLのページのサイドバーから
+            各カテゴリの一覧ページのURLを取得(取得できない場合は開始URLのまま)
+        """
+
+        if not self.discover_categories:
+            return list(self.start_urls)
+
+        pages = []
+        for url in self.start_urls:
+            r = self.request_listing_page(url)
+            pages.append(self.profile.listing_page(r.url, r.text))
+        return self.extract_category_urls(pages)
+
+    def extract_category_urls(self, pages):
+        """開始URLのページ(parse済みのListingPage)から、各カテゴリのURLを重複なく抽出"""
+
+        category_urls = []
+        for page in pages:
+            category_urls.extend(page.category_urls())
+        # 順番を維持したまま重複を除く
+        category_urls = list(dict.fromkeys(category_urls))
+
+        if not category_urls:
+            logger.warning('No categories found, crawl the start urls')
+            return list(self.start_urls)
+
+        logger.info(f'----- {len(category_urls)} categories found -----')
+        return category_urls
+
+    def open_archive(self):
+        """アーカイブを指定した場合は、記録/再生のために開く"""
+
+        self.archive = None
+        if not self.archive_path:
+            return None
+
+        self.archive = ResponseArchive(
+            self.archive_path, self.archive_mode or RECORD)
+        if not self.archive.replay:
+            self.archive.start(self.start_urls)
+        logger.info(
+            f'Archive ({self.archive.mode}): {self.archive_path} '
+            f'({len(self.archive)} responses)')
+
+    @property
+    def replaying(self):
+        """アーカイブを再生中(ネットワークへは送信しない)か"""
+
+        archive = getattr(self, 'archive', None)
+        return archive is not None and archive.replay
+
+    @property
+    def recording(self):
+        """受信したレスポンスをアーカイブに記録中か"""
+
+        archive = getattr(self, 'archive', None)
+        return archive is not None and not archive.replay
+
+    def request(self, url, headers=None):
+        """
+        ネットワーク(キャッシュ)、または再生中のアーカイブからレスポンスを取得
+
+        Note
+            記録中の場合は、取得したレスポンスをアーカイブに記録
+            (差分crawlの304は、変更前のレスポンスを残すため記録しない)
+        """
+
+        if self.replaying:
+            return self.archived_response(url)
+
+        r = self.session_cache.get(
+            url, headers=headers, timeout=self.transport.timeout)
+        if self.recording and r.status_code != 304:
+            self.archive.record(url, r)
+        return r
+
+    def archived_response(self, url):
+        """アーカイブに記録済みのレスポンス(記録がない場合はRequestErrorをraise)"""
+
+        r = self.archive.response(url, self.encoding)
+        if r is None:
+            raise RequestError(
+                url, reason='Not found in the archive', retryable=False)
+        return r
+
+    def open_media(self):
+        """画像等のダウンロードを指定した場合は、保存先とダウンロードのステージを作成"""
+
+        self.media_store = None
+        self.media_stage = None
+        if not self.media_dir or not self.profile.media:
+            return None
+        # アーカイブの再生中はネットワークへ送信しないため、ダウンロードしない
+        if self.replaying:
+            logger.info(
+                'Media download is skipped while replaying the archive')
+            return None
+
+        self.media_store = MediaStore(self.media_dir)
+        self.media_stage = self.create_media_stage()
+
+    def create_media_stage(self):
+        return MediaStage(self.download_media_file, self.media_workers)
+
+    def close_media(self):
+        if self.media_store:
+            self.media_store.close()
+
+    def download_media(self, records):
+        """scrapeデータの画像等のURLを、ダウンロードのステージに登録"""
+
+        if not self.media_store:
+            return None
+
+        for data in records:
+            url = data.get(self.profile.media)
+            if not url:
+                continue
+            future = self.media_stage.submit(
+                str(data[self.profile.key]), url, self.is_alive)
+            # 取消を検知した場合
+            if future is None:
+                break
+            future.add_done_callback(partial(self.media_finished, url))
+
+    def download_media_file(self, key, url):
+        """
+        画像等を1件ダウンロードして保存し、(パス, 結果)を返す(ワーカーのスレッドで実行)
+
+        Note
+            結果は、saved: 新たに保存、duplicate: 同じ内容のファイルが保存済み、
+            exists: 同じkey/URLでダウンロード済み
+            bodyはストリーミングで受信してファイルに書き込み、メモリ上に保持しない
+            リクエスト頻度の制限や同時リクエスト数の上限は、ページのリクエストと共有
+            (キャッシュには保存しない)
+        """
+
+        path = self.media_store.lookup(key, url)
+        if path:
+            return path, 'exists'
+
+        with self.session_cache.get(
+                url, stream=True, timeout=self.transport.timeout,
+                headers={'Cache-Control': 'no-store'}) as r:
+            check_status(url, r.status_code, self.transport.status_forcelist)
+            path, created = self.media_store.save(
+                key, url, r.iter_content(CHUNK_SIZE))
+        return path, 'saved' if created else 'duplicate'
+
+    def media_finished(self, url, future):
+        """
+        画像等のダウンロード1件分の結果を記録(Futureの完了時に呼び出される)
+
+        Note
+            asyncioのTaskも同じ属性/関数を持つため、AsyncCrawlerからも利用
+            失敗した画像等はログに出力するだけで、crawlは続行
+        """
+
+        if future.cancelled():
+            return None
+
+        error = future.exception()
+        if error:
+            self.metrics.increment('media_failed')
+            logger.warning(
+                f'[Media] {self.retry_queue.describe(error)}: {url}')
+            return None
+
+        path, outcome = future.result()
+        self.metrics.increment(f'media_{outcome}')
+        logger.debug(f'Media {outcome}: {url} -> {path}')
+
+    def open_incremental(self):
+        """差分crawlの場合、前回までの詳細ページの状態を開く"""
+
+        self.incremental_store = None
+        # 変更のあった詳細ページのURLごとの状態(1ページ分の処理ごとに保存)
+        self.page_validators = {}
+
+        if self.incremental:
+            self.incremental_store = IncrementalStore(
+                self.incremental_path, self.profile.key)
+            logger.info(
+                f'----- Incremental crawl '
+                f'({len(self.incremental_store.pages)} pages known) -----')
+
+    def check_modified(self, r):
+        """
+        差分crawlで、詳細ページに前回からの変更があるかを判定
+
+        Note
+            変更がない場合はscrape処理を行わないため、Falseを返す
+            変更がある場合は、ページの状態をscrapeデータの出力時まで保持
+        """
 
+        validators = self.incremental_store.validators(r)
+        if validators is None:
+            logger.debug('Not modified')
+            with self.counter_lock:
+                self.result_counter['Unchanged page count'] += 1
+            self.metrics.increment('unchanged_pages')
+            return False
+
+        self.page_validators[r.url] = validators
+        return True
+
+    def emit_records(self, records):
+        """scrapeデータをファイルに追記し、進捗としても保存"""
+
+        # 差分crawlの場合、upcごとに前回と同じデータは出力しない
+        if self.incremental_store:
+            records = self.incremental_store.update(
+                records, self.page_validators)
+
+        self.writer.write_many(records)
+        self.checkpoint.add_records(records)
+        self.metrics.increment('records', len(records))
+        self.download_media(records)
+
+    def load_robots_txt(self, url):
+        """urlのホストのrobots.txtを取得し、Crawl-delayをRateLimiterに反映"""
+
+        robots_url = urljoin(url, '/robots.txt')
         try:
-            r = self.session_cache.get(url, timeout=3.5)
-        # ネットワークの未接続等
-        except (ConnectionError, ReadTimeout):
-            logger.error('[Request] ConnectionError or ReadTimeoutError')
-            logger.info('===== Crawler Finished =====')
+            r = self.request(robots_url)
+        # robots.txtが取得できない場合は、制限を追加せずにcrawlを続行
+        except (ConnectionError, ReadTimeout, RequestError):
+            return None
 
-            # crawlerの状態等変更
-            self.crawler_status = self.status[3]
+        if r.status_code == 200:
+            crawl_delay = self.rate_limiter.set_crawl_delay(url, r.text)
+            if crawl_delay:
+                logger.info(f'Crawl-delay: {crawl_delay}')
 
-            # 処理終了に際して結果をログ表示
-            self.display_processing_result()
+    def try_request(self, url, headers=None):
+        """リクエスト処理を一元管理(headersは条件付きリクエスト等の追加のヘッダー)"""
+
+        # リクエストとレスポンスの総数を加算
+        with self.counter_lock:
+            self.result_counter['Request sent count'] += 1
+            self.result_counter['Response received count'] += 1
 
-            # raiseでcrawlerのスレッド終了
-            # GUIでは上記のstatus[3]を検知して表示内容等の初期化
-            raise Exception('[Request] ConnectionError or ReadTimeoutError')
+        start = time.perf_counter()
+        try:
+            # 5xx/429や接続の切断は、Transportの設定によりAdapterの中で再試行
+            r = self.request(url, headers)
+        # ネットワークの未接続等
+        # crawlは終了させず、呼び出し元でページ単位の失敗として扱う
+        except (ConnectionError, ReadTimeout) as e:
+            self.metrics.increment('request_errors')
+            raise RequestError(
+                url, reason='ConnectionError or ReadTimeoutError') from e
         else:
-            logger.info(f'Request url: {r.url}')
-            logger.info(f'From cache: {r.from_cache}')
-            logger.info(f'Status code: {r.status_code}')
+            logger.debug(f'Request url: {r.url}')
+            logger.debug(f'From cache: {r.from_cache}')
+            logger.debug(f'Status code: {r.status_code}')
+
+            from_cache = getattr(r, 'from_cache', False)
+            self.metrics.observe_request(
+                time.perf_counter() - start, r.status_code, from_cache,
+                len(r.content))
 
             # ログ表示用のカウント
             # 既存のコードを検知した場合はvalueだけ加算、
             # 新たなコードを検知した場合はkeyとvalueを新たに定義して追加
-            self.result_counter['Status code count'][r.status_code] += 1
+            with self.counter_lock:
+                self.result_counter['Status code count'][r.status_code] += 1
 
+            # 404/503等のエラーページは、scrapeせずにページ単位の失敗として扱う
+            check_status(url, r.status_code, self.transport.status_forcelist)
             return r
 
-    def scraping_detail_page(self, r):
+    def concurrency_changed(self, previous, limit, reason):
+        """同時リクエスト数の上限を変更した際のログ出力(送信したスレッドから呼び出される)"""
+
+        logger.info(f'Concurrency limit: {previous} -> {limit} ({reason})')
+
+    def page_interrupted(self, url):
+        """
+        取消やワーカーのエラーによりcrawlを終了するため、処理できなかったページか
+
+        Note
+            その一覧ページの進捗は保存しないため、失敗として記録せずに再開時に改めてcrawl
+            再試行中のページは一覧ページの進捗が保存済みのため、失敗したページとして記録
+        """
+
+        return not self.is_alive() and url not in self.retry_queue.attempts
+
+    def page_failed(self, url, kind, error):
+        """
+        ページの失敗を記録し、再試行の対象であればRetryQueueに登録
+
+        Note
+            1ページの失敗ではcrawlを終了させず、残りのページの処理を続行
+        """
+
+        retry = self.retry_queue.push(url, kind, error)
+        message = f'{self.retry_queue.describe(error)}: {url}'
+        with self.counter_lock:
+            if retry:
+                self.result_counter['Retried page count'] += 1
+            else:
+                self.result_counter['Failed page count'] += 1
+        self.metrics.increment('retried_pages' if retry else 'failed_pages')
+
+        if retry:
+            logger.warning(f'{message} (retry later)')
+        else:
+            logger.error(f'{message} (gave up)')
+
+    def scraping_detail_page(self, listing_urls):
         """
         詳細ページのcrawl/scrape処理を管理
 
         Note(処理の流れ):
-            1. start_url(1ページ分)から各詳細ページのURL取得
-            2. start_urlに次ページがある場合はそのURL取得
-            3. 上記1で取得した各詳細ページのURLを順にcrawl/コンテンツのscrape処理
-            4. 上記2で次ページがある場合は、上記1に戻り、次ページに対して同様に処理
+            1. 一覧ページ(1ページ分)から各詳細ページのURL取得
+            2. 一覧ページに次ページがある場合はそのURL取得、
+               次にcrawlする一覧ページ(次ページ、または次の開始URL)のリクエストを先行して開始
+            3. 上記1で取得した各詳細ページのURLをワーカーで並行してcrawl/コンテンツのscrape処理
+            4. 上記2で次の一覧ページがある場合は、先行したリクエストの結果を受け取り上記1に戻る
+
+            上記1~4の処理を、次の一覧ページがある限りwhileループで繰り返す
+            (再帰呼び出しではないため、ページ数に関わらずスタックの使用量は一定)
+            次ページは残りの開始URLより先にcrawlし、カテゴリごとにページ順で処理
+            crawl済みのURL(一覧ページ/詳細ページ)はself.url_frontierにより除外
+
+            失敗したページは、すべての一覧ページの処理後に再試行(retry_failed_pages)
+        """
+
+        # 次にcrawlする一覧ページのURL(先頭から順に処理)
+        pending_urls = deque(
+            url for url in listing_urls if self.url_frontier.add(url))
+        if pending_urls and not self.crawl_listing_pages(pending_urls):
+            return None
+
+        if not self.retry_failed_pages():
+            return None
+
+        # 残りの画像等のダウンロードの完了を待機
+        if self.media_stage:
+            self.media_stage.shutdown()
 
-            上記1~4の処理を次ページがある限り繰り返す
+        # 次ページのurlがない場合は処理終了、これに伴いスレッドも終了
+        logger.info('===== Crawler Finished =====')
+        self.display_processing_result()
+
+    def crawl_listing_pages(self, pending_urls):
         """
+        pending_urlsの一覧ページから順に、次ページがなくなるまでcrawl/scrape
 
-        # start_url(詳細ページをまとめたページ)のレスポンスから各詳細ページのurlをscrape
-        detail_urls = self.scrape_detail_page_urls(r)
+        Note
+            取消を検知した場合はFalse、すべての一覧ページを処理した場合はTrueを返す
+        """
 
-        # start_urlのページに、次ページのURLがある場合はそのURLをscrape
-        next_page_url = self.search_next_page(r)
+        self.metrics.set_gauge('listing_queue', lambda: len(pending_urls))
 
-        # 各詳細ページのurlを順番にcrawl/scrape
-        # thread.Eventやフラグにおいて制御するのは以下のループ処理
-        for i, url in enumerate(detail_urls, start=1):
-            # ループ途中でフラグFalseを検知した場合はスレッド終了
-            # フラグはGUIにより特定のボタン操作を行うことで操作
+        # 次ページのリクエストを、詳細ページの処理と並行して行うためのスレッド
+        prefetcher = ThreadPoolExecutor(max_workers=1)
+        next_url = pending_urls.popleft()
+        next_page = prefetcher.submit(self.request_listing_page, next_url)
+
+        try:
+            while next_page:
+                try:
+                    # 先行して開始したリクエストの結果を受け取る(エラーの場合はここでraise)
+                    r = next_page.result()
+
+                    # レスポンスは1回だけparseし、詳細ページ/次ページのURL抽出で共有
+                    page = self.profile.listing_page(r.url, r.text)
+                    # 一覧ページのレスポンスから各詳細ページのurlをscrape
+                    detail_urls = self.scrape_detail_page_urls(page)
+                    # 一覧ページに、次ページのURLがある場合はそのURLをscrape
+                    next_page_url = self.search_next_page(page)
+                    # 以降の処理で不要なため、レスポンスとparse済みのドキュメントを解放
+                    del r, page
+                # 一覧ページの失敗は、そのページだけ後で再試行して残りのページを続行
+                except Exception as e:
+                    if not self.page_interrupted(next_url):
+                        self.page_failed(next_url, LISTING_PAGE, e)
+                    detail_urls, next_page_url = [], None
+                next_page = None
+
+                # 次ページは、残りの開始URLより先にcrawl
+                if next_page_url and self.url_frontier.add(next_page_url):
+                    pending_urls.appendleft(next_page_url)
+                # 進捗として保存する、この一覧ページの処理完了後にcrawlする一覧ページ
+                remaining_urls = list(pending_urls)
+
+                # 詳細ページの処理中に、次の一覧ページのリクエストを先行して開始
+                if pending_urls and self.is_alive():
+                    next_url = pending_urls.popleft()
+                    next_page = prefetcher.submit(
+                        self.request_listing_page, next_url)
+
+                if not self.scrape_listing_page(detail_urls, remaining_urls):
+                    return False
+        finally:
+            # 取消等により受け取らなかったリクエストは、完了を待たずに破棄
+            prefetcher.shutdown(wait=False, cancel_futures=True)
+
+        return True
+
+    def retry_failed_pages(self):
+        """
+        再試行を待つページがなくなるまで、再試行の時刻になったページから順にcrawl/scrape
+
+        Note
+            一覧ページは次ページも含めてcrawlし、詳細ページは1ページ分としてまとめて処理
+            取消を検知した場合はFalseを返す
+        """
+
+        while self.retry_queue:
+            self.wait_until(self.retry_queue.next_due())
             if not self.crawler_alive_flag:
-                logger.info('===== Crawler Finished =====')
+                self.cancel_crawl()
+                return False
 
-                # crawlerの状態等変更
-                self.crawler_status = self.status[3]
+            logger.info('----- Retry failed pages -----')
+            listing_urls = self.retry_queue.due(LISTING_PAGE)
+            if listing_urls and \
+                    not self.crawl_listing_pages(deque(listing_urls)):
+                return False
+            # 再試行の時刻になった詳細ページは、scrape_listing_pageで追加
+            if not self.scrape_listing_page([], []):
+                return False
 
-                # 処理終了に際して結果をログ表示
-                self.display_processing_result()
+        return True
 
-                # エラー終了ではないためreturn Noneでこの処理を終了
-                # その後、呼び出し元の処理に戻り、上記のstatus[3]によりファイル出力はせずスレッドも終了
-                return None
+    def wait_until(self, deadline):
+        """time.monotonic()の値がdeadlineになるまで待機(取消を検知した場合は中断)"""
 
-            logger.info(
-                f'----- Request detail page({self.current_page}-{i}) -----')
+        # 取消操作に素早く反応できるよう、短い間隔に区切って待機
+        while self.crawler_alive_flag:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.2))
 
-            time.sleep(random.randint(1, 3))
-            # 自己定義した関数内でリクエスト
-            r = self.try_request(url)
-            r.encoding = self.encoding
+    def request_listing_page(self, url):
+        """一覧ページのリクエスト(次ページの先行リクエストにも利用)"""
 
-            # 詳細ページから各コンテンツのscrape
-            data = self.scrape_detail_page_content(r)
-            self.data_list.append(data)
+        # 自己定義した関数内でリクエスト
+        r = self.try_request(url)
+        r.encoding = self.encoding
+        return r
 
-            # thread.Eventによるスレッドの停止/再開処理
-            # thread.Eventの状態Falseを検知した場合、event.wait()実行によりスレッド停止
-            # 上記の状態でevent.set()が実行されると、状態はTrueに変更されスレッドも再開
-            # thread.Eventの状態は、GUIの特定のボタン操作により変更、
-            # スレッド処理のループ上に以下の記述することで、任意のタイミングで制御可能
-            if not self.crawler_event.is_set():
-                logger.info('----- Crawler Pause -----')
-                # 処理停止にあたりcrawlerの状態等変更(必ずwait()より前に記述)
-                self.crawler_status = self.status[2]
-                self.crawler_event.wait()
-                # 処理開始にあたりcrawlerの状態等変更
-                self.crawler_status = self.status[1]
+    def scrape_listing_page(self, detail_urls, pending_urls):
+        """
+        一覧ページ1ページ分の詳細ページをcrawl/scrapeし、進捗を保存
+
+        Note
+            pending_urlsは、この一覧ページの次にcrawlする一覧ページのURLのリスト
+            取消を検知した場合はFalse、次ページへ進む場合はTrueを返す
+        """
+
+        # crawl済みの詳細ページ(他のカテゴリの一覧ページに含まれていた場合や、
+        # 再開の場合のscrape済みのページ)は除外
+        # 再試行の時刻になった詳細ページは、このページの詳細ページと合わせて処理
+        detail_urls = [
+            url for url in detail_urls if self.url_frontier.add(url)
+        ] + self.retry_queue.due(DETAIL_PAGE)
+
+        # 各詳細ページのurlをワーカーで並行してcrawl/scrape
+        # thread.Eventやフラグにおいて制御するのは各ワーカーのループ処理
+        data_list = self.fetch_detail_pages(detail_urls)
+
+        # ワーカーの処理順に関わらず、ページ内の並び順でscrapeデータをファイルに追記
+        # 取消やエラーの場合も、それまでに処理できたscrapeデータは出力/保存
+        self.emit_records(data_list)
+        del data_list
+
+        # ワーカーでエラーが発生した場合は、crawlerのスレッドでraiseして終了
+        if self.worker_error:
+            raise self.worker_error
+
+        # ループ途中でフラグFalseを検知した場合はスレッド終了
+        # フラグはGUIにより特定のボタン操作を行うことで操作
+        if not self.crawler_alive_flag:
+            self.cancel_crawl()
+
+            # エラー終了ではないためFalseを返し、呼び出し元のループを終了
+            # その後、出力中のファイルを閉じてスレッドも終了
+            return False
 
         logger.info(f'----- Scrape completed page[{self.current_page}] -----')
+        self.publish_progress()
 
-        # 次ページのurlがある場合の処理
-        if next_page_url:
+        # 1ページ分の処理が完了したため、次にcrawlする一覧ページを進捗として保存
+        # (最後の一覧ページの場合は空のリスト)
+        self.checkpoint.set_next_pages(pending_urls, self.current_page + 1)
+        if pending_urls:
             logger.info('----- Request next page -----')
-            logger.info(f'next page url: {next_page_url}')
+            logger.info(f'next page url: {pending_urls[0]}')
 
             # ログ表示用のページ数を加算
             self.current_page += 1
 
-            time.sleep(random.randint(1, 3))
-            # 自己定義した関数内で次ページのURLにリクエスト
-            r = self.try_request(next_page_url)
-            r.encoding = self.encoding
+        return True
 
-            # 自分自身を呼び出すことで、次ページのURLがある限りループ
-            self.scraping_detail_page(r)
-        # 次ページのurlがない場合は処理終了、これに伴いスレッドも終了
-        else:
-            logger.info('===== Crawler Finished =====')
-            self.display_processing_result()
+    def publish_progress(self):
+        """1ページ分の処理の完了を、処理済みのページ数とscrapeデータ数とともに通知"""
 
-    def scrape_detail_page_urls(self, r):
-        """start_urlのレスポンスから各詳細ページのURLをscrape"""
+        self.events.publish(
+            PROGRESS, page=self.current_page, records=self.writer.count)
 
-        logger.info('Scrape detail page urls')
+    def cancel_crawl(self):
+        """取消を検知した場合に、crawlerの状態を変更して結果をログ表示"""
 
-        soup = BeautifulSoup(r.text, 'lxml')
-        # 詳細ページのURLにあたる個所をcssセレクターですべて抽出
-        urls = soup.select('h3 > a')
+        logger.info('===== Crawler Finished =====')
 
-        for url in urls:
-            abs_url = self.convert_absolute_url(url.attrs['href'])
-            yield abs_url
+        # crawlerの状態等変更
+        self.crawler_status = self.status[3]
 
-    def convert_absolute_url(self, url):
-        """相対URLから絶対URLに変換"""
+        # 処理終了に際して結果をログ表示
+        self.display_processing_result()
 
-        # 余分な文字を削除
-        molding_url = url.replace('../', '')
+    def fetch_detail_pages(self, detail_urls):
+        """
+        詳細ページのURLを共有のQueue(frontier)に格納し、ワーカーで並行してcrawl/scrape
 
-        # ページURLの場合
-        if re.search(r'html$', molding_url):
-            return urljoin(
-                'https://books.toscrape.com/catalogue/', molding_url)
-        # 画像URLの場合
-        else:
-            return urljoin('https://books.toscrape.com/', molding_url)
+        Note
+            各ワーカーはfrontierからURLを取り出し、空になるまで処理を繰り返す
+            戻り値は、ワーカーの処理順ではなくdetail_urlsの並び順
+            (取消等により処理されなかったページは含まない)
+        """
 
-    def search_next_page(self, r):
-        """次ページURLの有無に応じた処理"""
+        frontier = queue.Queue()
+        for i, url in enumerate(detail_urls, start=1):
+            frontier.put((i, url))
+        self.metrics.set_gauge('detail_queue', frontier.qsize)
+
+        results = [None] * len(detail_urls)
+        workers = [
+            threading.Thread(
+                target=self.detail_page_worker, args=(frontier, results))
+            for _ in range(min(self.max_workers, len(detail_urls)))
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        data_list = []
+        for url, result in zip(detail_urls, results):
+            if result is None:
+                continue
+            # parse処理を別プロセスで実行した場合は、ページ内の並び順で結果を取り出す
+            if isinstance(result, Future):
+                try:
+                    result = result.result()
+                # プロセスプール自体が使えなくなった場合はcrawlを終了
+                except BrokenExecutor as e:
+                    self.worker_error = self.worker_error or e
+                    break
+                except Exception as e:
+                    self.page_failed(url, DETAIL_PAGE, e)
+                    continue
+                self.log_scraped_content(result)
+            data_list.append(result)
+
+        return data_list
+
+    def detail_page_worker(self, frontier, results):
+        """frontierが空になるまで、詳細ページのcrawl/scrapeを繰り返すワーカー"""
+
+        while self.is_alive():
+            try:
+                i, url = frontier.get(block=False)
+            except queue.Empty:
+                break
 
-        soup = BeautifulSoup(r.text, 'lxml')
+            # thread.Eventによるスレッドの停止/再開処理
+            self.wait_if_paused()
+            if not self.is_alive():
+                break
 
-        try:
-            url = soup.select_one('li.next > a').attrs['href']
-        # 次ページのURLがない場合(抽出できない場合)
-        except AttributeError:
+            logger.info(
+                f'----- Request detail page({self.current_page}-{i}) -----')
+
+            try:
+                # 自己定義した関数内でリクエスト
+                # 差分crawlの場合は、前回のETag/Last-Modifiedによる条件付きリクエスト
+                headers = None
+                if self.incremental_store:
+                    headers = self.incremental_store.conditional_headers(url)
+                r = self.try_request(url, headers)
+                r.encoding = self.encoding
+
+                # 前回から変更がない場合はscrapeしない
+                if self.incremental_store and not self.check_modified(r):
+                    continue
+
+                # 詳細ページから各コンテンツのscrape
+                # 別プロセスでparseする場合は、bodyを渡してFutureを格納
+                # (プロセスプールのparseのレイテンシは、空きを待つ時間も含む)
+                if self.parse_stage:
+                    start = time.perf_counter()
+                    future = self.parse_stage.submit(
+                        r.url, r.content, self.is_alive)
+                    if future:
+                        future.add_done_callback(
+                            lambda _, start=start: self.metrics.observe(
+                                'parse', time.perf_counter() - start))
+                    results[i - 1] = future
+                else:
+                    results[i - 1] = self.scrape_detail_page_content(r)
+            # リクエストやparseの失敗は、そのページだけ記録して次のページへ進む
+            except Exception as e:
+                if not self.page_interrupted(url):
+                    self.page_failed(url, DETAIL_PAGE, e)
+
+    def wait_if_paused(self):
+        """
+        thread.Eventの状態Falseを検知した場合、event.wait()実行によりワーカーを停止
+
+        Note
+            上記の状態でevent.set()が実行されると、状態はTrueに変更されワーカーも再開
+            thread.Eventの状態は、GUIの特定のボタン操作により変更
+            停止のログと状態変更は、最初に検知したワーカーだけが行う
+        """
+
+        if self.crawler_event.is_set():
             return None
-        # 次ページのURLがある場合
-        else:
-            next_page_url = urljoin(
-                'https://books.toscrape.com/'
-                'catalogue/category/books/fantasy_19/',
-                url,
-            )
-            return next_page_url
+
+        with self.pause_lock:
+            if not self.crawler_event.is_set() and \
+                    self.crawler_status == self.status[1]:
+                logger.info('----- Crawler Pause -----')
+                # 処理停止にあたりcrawlerの状態等変更(必ずwait()より前に記述)
+                self.crawler_status = self.status[2]
+                self.events.publish(PAUSED)
+
+        self.crawler_event.wait()
+
+        with self.pause_lock:
+            # 処理開始にあたりcrawlerの状態等変更
+            if self.crawler_status == self.status[2]:
+                self.crawler_status = self.status[1]
+                self.events.publish(RESUMED)
+
+    def is_alive(self):
+        """crawlerを継続すべきか(取消やワーカーのエラーを検知した場合はFalse)"""
+
+        return self.crawler_alive_flag and self.worker_error is None
+
+    def scrape_detail_page_urls(self, page):
+        """一覧ページ(parse済みのListingPage)から各詳細ページのURLをscrape"""
+
+        logger.info('Scrape detail page urls')
+
+        return page.detail_page_urls()
+
+    def search_next_page(self, page):
+        """一覧ページ(parse済みのListingPage)から次ページのURLをscrape(ない場合はNone)"""
+
+        return page.next_page_url()
 
     def scrape_detail_page_content(self, r):
         """詳細ページから各コンテンツをscrape"""
 
-        logger.info('Scrape detail page content')
-
-        soup = BeautifulSoup(r.text, 'lxml')
-
-        # 初めに取得したいデータに応じて大きく抽出
-        contents = soup.select_one('article > div.row')
-        table = soup.find('table')
-
-        # 画像は絶対URLに変換する必要があるので先に抽出
-        image_rel_url = contents.select_one('div.item > img').attrs['src']
-        image_abs_url = self.convert_absolute_url(image_rel_url)
-
-        data = {
-            'url': r.url,
-            'title': contents.find('h1').text,
-            # bs4独自の記述として、要素に特定の文字が含まれているか-soup-contains()で抽出
-            'price': table.select_one('th:-soup-contains("excl")+td').text,
-            # .attrsで抽出した要素に複数の属性が存在する場合リストで抽出
-            'star': self.convert_text_to_number(contents.select_one(
-                'div.product_main p.star-rating').attrs['class'][1]),
-            'reviews': int(
-                table.select_one('th:-soup-contains("reviews")+td').text),
-            'stock': self.extract_stock(table.select_one(
-                'th:-soup-contains("Availability")+td').text),
-            'upc': table.select_one('th:-soup-contains("UPC")+td').text,
-            'image_url': image_abs_url,
-        }
-
-        [logger.info(f'- {k}: {v}') for k, v in data.items()]
+        logger.debug('Scrape detail page content')
 
-        # ログ表示用のscrapeコンテンツ数の加算
-        self.result_counter['Scraped content count'] += len(data)
+        # プロファイルのコンパイル済みのXPathにより各コンテンツを抽出/整形
+        start = time.perf_counter()
+        data = self.profile.parse_detail_page(r.url, r.text)
+        self.metrics.observe('parse', time.perf_counter() - start)
+        self.log_scraped_content(data)
 
         return data
 
-    def extract_stock(self, element):
-        """scrapeデータの整形(stock数の抽出)"""
+    def log_scraped_content(self, data):
+        """scrapeデータのログ表示とカウント"""
 
-        if element:
-            m = re.search('In stock', element)
-            if m:
-                return int(
-                    element.replace(
-                        'In stock (', '').replace(' available)', ''))
-            else:
-                return 0
-        return 0
-
-    def convert_text_to_number(self, element):
-        """scrape後のデータ整形(テキストから数字へ変換)"""
+        # 表示しないレベルの場合は、各項目の文字列も作成しない
+        if logger.isEnabledFor(logging.DEBUG):
+            [logger.debug(f'- {k}: {v}') for k, v in data.items()]
 
-        convert_pattern = {
-            'One': 1, 'Two': 2, 'Three': 3, 'Four': 4, 'Five': 5
-        }
-        if element:
-            try:
-                return convert_pattern[element]
-            except KeyError:
-                return 0
-        return 0
+        # ログ表示用のscrapeコンテンツ数の加算
+        with self.counter_lock:
+            self.result_counter['Scraped content count'] += len(data)
 
     def display_processing_result(self):
         """処理終了のタイミングで、結果をログ出力"""
@@ -377,15 +1191,60 @@ class Crawler(object):
                 continue
             logger.info(f'* {k}: {v}')
 
-        elapsed_time = int(time.time() - self.execute_time)
-        logger.info(f'* Elapsed time: {timedelta(seconds=elapsed_time)}')
+        # コネクションの再利用状況(キャッシュから返したレスポンスは含まない)
+        connections, sent = self.connection_stats()
+        logger.info(
+            f'* Connections: {connections} opened, '
+            f'{max(sent - connections, 0)} reused ({sent} requests)')
+
+        logger.info(
+            f'* Concurrency limit: {self.concurrency.limit} '
+            f'(max {self.concurrency.max_limit})')
+
+        snapshot = self.metrics.snapshot()
+        logger.info(
+            f'* Requests per second: '
+            f'{snapshot["requests"] / max(snapshot["elapsed"], 1e-3):.2f}')
+        logger.info(f'* Cache hit ratio: {snapshot["cache_hit_ratio"]:.1%}')
+        logger.info(f'* Received bytes: {snapshot["bytes_received"]}')
+        for stage, latency in snapshot['latency'].items():
+            if latency['count']:
+                logger.info(
+                    f'* {stage.capitalize()} latency: '
+                    f'{format_latency(latency)}')
+
+        if getattr(self, 'media_store', None):
+            counters = snapshot['counters']
+            logger.info(
+                f'* Media files: {counters.get("media_saved", 0)} saved, '
+                f'{counters.get("media_duplicate", 0)} duplicate, '
+                f'{counters.get("media_exists", 0)} already saved, '
+                f'{counters.get("media_failed", 0)} failed '
+                f'({self.media_dir})')
+
+        elapsed_time = time.time() - self.execute_time
+        logger.info(
+            f'* Elapsed time: {timedelta(seconds=round(elapsed_time, 3))}')
 
-    def output_file(self):
-        """scrapeデータのjsonファイル出力処理"""
+    def connection_stats(self):
+        """(新たに確立したコネクション数, ネットワークへ送信したリクエスト数)"""
 
-        df = pd.DataFrame(self.data_list)
-        # orientは、どういった形式で出力するか、
-        # force_asciiは、全角文字などの非ascii文字をunicodeエスケープ(\u3042等)するかどうか
-        df.to_json(self.output_path, orient='records', force_ascii=False)
+        return pool_stats(self.session_cache)
 
-        logger.info(f'* Output the file {self.output_path}')
+    def output_file(self):
+        """scrapeデータの出力を確定させてファイルを閉じる"""
+
+        self.writer.close()
+
+        logger.info(
+            f'* Output the file {self.output_path} '
+            f'({self.writer.count} items)')
+
+        # 再試行できなかったページも含めて、失敗したページの一覧を出力
+        self.retry_queue.abandon()
+        if self.retry_queue.dead_letters:
+            path = failed_pages_path(self.output_path)
+            self.retry_queue.write_report(path)
+            logger.warning(
+                f'* Output the failed pages {path} '
+                f'({len(self.retry_queue.dead_letters)} urls)')
@@ -0,0 +1,59 @@
+from collections import namedtuple
+import queue
+import threading
+
+
+# crawlerの状態遷移のイベントの種類
+STARTED = 'started'
+PAUSED = 'paused'
+RESUMED = 'resumed'
+PROGRESS = 'progress'
+FINISHED = 'finished'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+# crawlerのスレッドが終了したことを示すイベント(いずれか1つを最後に通知)
+TERMINAL_EVENTS = (FINISHED, CANCELLED, FAILED)
+
+
+# kind: イベントの種類、data: イベントごとの情報(ページ数、scrapeデータ数、エラー等)のdict
+CrawlerEvent = namedtuple('CrawlerEvent', ('kind', 'data'))
+
+
+class EventChannel(object):
+    """
+    crawlerのスレッドから、GUI等へ状態遷移のイベントを通知
+
+    attribute:
+        self.subscribers:
+            subscribe()で作成した、購読者ごとのQueueのリスト
+
+    Note
+        イベントは購読者ごとのQueueにputするため、スレッド間で安全に受け渡し可能
+        購読者がいない場合(コマンドラインからの実行等)はイベントを保持しない
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = []
+
+    def subscribe(self):
+        """イベントを受け取るQueueを作成して返す"""
+
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.remove(subscriber)
+
+    def publish(self, kind, **data):
+        """イベントを全購読者に通知"""
+
+        event = CrawlerEvent(kind, data)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.put(event)
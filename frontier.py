@@ -0,0 +1,65 @@
+import hashlib
+from urllib.parse import urldefrag, urlsplit, urlunsplit
+
+
+def normalize_url(url):
+    """
+    同じページを指すURLを同じ文字列に変換
+
+    Note
+        フラグメント(#以降)を除き、スキーム/ホスト名を小文字に統一
+        相対URLの解決は、呼び出し元でレスポンスのURLを基準にurljoinで行う前提
+    """
+
+    url, _ = urldefrag(url)
+    parts = urlsplit(url)
+    return urlunsplit((
+        parts.scheme.lower(), parts.netloc.lower(), parts.path or '/',
+        parts.query, '',
+    ))
+
+
+class URLFrontier(object):
+    """
+    crawl済み/crawl予定のURLを記録し、同じURLへの重複したリクエストを防ぐ
+
+    attribute:
+        self.seen:
+            正規化したURLのハッシュ値(64bitの整数)の集合
+            URLの文字列をそのまま保持するよりメモリ使用量が少ない
+            (数百万件の規模でも、ハッシュ値の衝突による取りこぼしは実質的に発生しない)
+
+    Note
+        一覧ページ/詳細ページのURLを共通で記録するため、
+        複数の開始URL(カテゴリ)に同じ詳細ページがあっても1回だけcrawl
+    """
+
+    def __init__(self, urls=()):
+        self.seen = set()
+        self.update(urls)
+
+    @staticmethod
+    def fingerprint(url):
+        digest = hashlib.blake2b(
+            normalize_url(url).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+
+    def add(self, url):
+        """未登録のURLであれば登録してTrue、登録済みの場合はFalseを返す"""
+
+        fingerprint = self.fingerprint(url)
+        if fingerprint in self.seen:
+            return False
+        self.seen.add(fingerprint)
+        return True
+
+    def update(self, urls):
+        """複数のURLをまとめて登録"""
+
+        self.seen.update(self.fingerprint(url) for url in urls)
+
+    def __contains__(self, url):
+        return self.fingerprint(url) in self.seen
+
+    def __len__(self):
+        return len(self.seen)
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import sqlite3
+
+
+def hash_content(content):
+    """レスポンスのbody(bytes)のハッシュ値"""
+
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_record(record):
+    """scrapeデータ1件のハッシュ値(keyの並び順に依存しない)"""
+
+    return hash_content(
+        json.dumps(record, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+
+
+class IncrementalStore(object):
+    """
+    差分crawlのため、前回までに取得した詳細ページとscrapeデータの状態をSQLiteに保存
+
+    attribute:
+        self.pages:
+            詳細ページのURLごとの(ETag, Last-Modified, bodyのハッシュ値)
+            条件付きリクエストのヘッダー作成と、変更の有無の判定に利用
+
+        self.record_hashes:
+            upcごとのscrapeデータのハッシュ値
+            ページに変更があっても、抽出したデータが同じ場合は出力しない
+
+        self.key:
+            scrapeデータを識別する項目名(サイトのプロファイルで定義、テーブルのupc列に保存)
+
+    Note
+        保存済みの状態は開いた時点でメモリ上に読み込み、ワーカーはメモリ上の状態だけを参照
+        SQLiteへの書込みはcrawlerのスレッドだけが行う(1ページ分の処理ごと)
+    """
+
+    def __init__(self, path, key='upc'):
+        self.key = key
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS records (
+                upc TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                record_hash TEXT NOT NULL
+            );
+        ''')
+        self.conn.commit()
+
+        self.pages = {
+            url: (etag, last_modified, content_hash)
+            for url, etag, last_modified, content_hash in self.conn.execute(
+                'SELECT url, etag, last_modified, content_hash FROM pages')
+        }
+        self.record_hashes = dict(
+            self.conn.execute('SELECT upc, record_hash FROM records'))
+
+    def conditional_headers(self, url):
+        """前回のレスポンスのETag/Last-Modifiedから、条件付きリクエストのヘッダーを作成"""
+
+        headers = {}
+        etag, last_modified, _ = self.pages.get(url, (None, None, None))
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def validators(self, r):
+        """
+        レスポンスに変更がない場合はNone、変更がある場合は保存する状態を返す
+
+        Note
+            304の場合のほか、bodyのハッシュ値が前回と同じ場合も変更なしと判定
+            (CacheControlのキャッシュから返したレスポンスも、前回と同じbodyのため変更なし)
+        """
+
+        if r.status_code == 304:
+            return None
+
+        content_hash = hash_content(r.content)
+        stored = self.pages.get(r.url)
+        if stored and stored[2] == content_hash:
+            return None
+
+        return (
+            r.headers.get('ETag'), r.headers.get('Last-Modified'),
+            content_hash)
+
+    def update(self, records, validators):
+        """
+        scrapeデータに対応するページの状態を保存し、新規/変更のあったデータだけを返す
+
+        Note
+            validatorsは詳細ページのURLごとの状態(validators()の戻り値)
+            保存したページの状態はvalidatorsから取り除く
+            scrapeデータがない(parseできなかった等)ページの状態は保存せず、次回も再取得
+        """
+
+        changed = []
+        page_rows = []
+        record_rows = []
+        for data in records:
+            page_state = validators.pop(data['url'], None)
+            if page_state:
+                page_rows.append((data['url'], *page_state))
+
+            record_hash = hash_record(data)
+            key = str(data[self.key])
+            if self.record_hashes.get(key) == record_hash:
+                continue
+            changed.append(data)
+            record_rows.append((key, data['url'], record_hash))
+
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO pages '
+                '(url, etag, last_modified, content_hash) '
+                'VALUES (?, ?, ?, ?)',
+                page_rows,
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO records (upc, url, record_hash) '
+                'VALUES (?, ?, ?)',
+                record_rows,
+            )
+
+        for url, *page_state in page_rows:
+            self.pages[url] = tuple(page_state)
+        for upc, _, record_hash in record_rows:
+            self.record_hashes[upc] = record_hash
+
+        return changed
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,225 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import posixpath
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+# ファイル名の拡張子として使用する、URLの拡張子の最大長
+MAX_EXT_LENGTH = 5
+# ストリーミングで受信/書込みする単位(bytes)
+CHUNK_SIZE = 64 * 1024
+
+
+class MediaStore(object):
+    """
+    画像等のファイルを、内容のハッシュ値(sha256)をファイル名として保存
+
+    attribute:
+        self.directory:
+            保存先のディレクトリ
+            ファイルは「(ハッシュ値の先頭2文字)/(ハッシュ値)(URLの拡張子)」に保存し、
+            同じ内容のファイル(重複した表紙画像等)は1つだけ保存
+
+        self.index_path:
+            データのkey(upc等)ごとに、URLと保存したファイルのパスを記録したSQLite
+            パスはself.directoryからの相対パス
+
+    Note
+        受信したbodyは一時ファイルに書き込みながらハッシュ値を計算するため、
+        ファイル全体をメモリ上に保持しない
+        再開や再実行の場合、記録済みのkey/URLでファイルが存在するものは再取得しない
+        複数のワーカー(スレッド)から利用するため、接続は共有してロックで排他制御
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.sqlite3')
+        self.tmp_dir = os.path.join(directory, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS media (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                path TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                saved REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS media_url ON media (url);
+        ''')
+        self.conn.commit()
+
+    def lookup(self, key, url):
+        """
+        keyまたはurlの保存済みのファイルのパスを返す(ない場合はNone)
+
+        Note
+            keyが未登録でも、同じurlのファイルが保存済みの場合はkeyを登録して再利用
+        """
+
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT url, path, sha256, size FROM media WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or row[0] != url:
+                row = self.conn.execute(
+                    'SELECT url, path, sha256, size FROM media WHERE url = ?',
+                    (url,)).fetchone()
+        if row is None:
+            return None
+
+        _, path, sha256, size = row
+        if not os.path.exists(os.path.join(self.directory, path)):
+            return None
+        self.add(key, url, path, sha256, size)
+        return path
+
+    def open(self):
+        """受信したbodyを書き込むMediaFileを作成"""
+
+        return MediaFile(self)
+
+    def save(self, key, url, chunks):
+        """
+        bodyのbytesを順に返すiterableから保存し、(パス, 新たに保存したか)を返す
+
+        Note
+            同じ内容のファイルが保存済みの場合は、そのパスをkeyに登録するだけ
+        """
+
+        media_file = self.open()
+        try:
+            for chunk in chunks:
+                media_file.write(chunk)
+        except BaseException:
+            media_file.abort()
+            raise
+        return media_file.commit(key, url)
+
+    def add(self, key, url, path, sha256, size):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO media '
+                '(key, url, path, sha256, size, saved) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, url, path, sha256, size, time.time()),
+            )
+
+    def paths(self):
+        """keyごとの保存したファイルのパス(self.directoryからの相対パス)のdict"""
+
+        with self.lock:
+            return dict(self.conn.execute('SELECT key, path FROM media'))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def media_extension(url):
+    """URLのパスの拡張子(「.jpg」等、ない場合や長すぎる場合は空文字)"""
+
+    ext = posixpath.splitext(urlsplit(url).path)[1].lower()
+    return ext if len(ext) <= MAX_EXT_LENGTH else ''
+
+
+class MediaFile(object):
+    """
+    受信中のbodyを一時ファイルに書き込み、完了後にハッシュ値のパスへ移動
+
+    Note
+        commit()/abort()のいずれかを必ず呼び出す(一時ファイルを残さないため)
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.file = tempfile.NamedTemporaryFile(
+            dir=store.tmp_dir, suffix='.part', delete=False)
+
+    def write(self, chunk):
+        self.hash.update(chunk)
+        self.size += len(chunk)
+        self.file.write(chunk)
+
+    def commit(self, key, url):
+        """保存先へ移動してkeyを登録し、(パス, 新たに保存したか)を返す"""
+
+        self.file.close()
+        sha256 = self.hash.hexdigest()
+        path = posixpath.join(sha256[:2], sha256 + media_extension(url))
+        full_path = os.path.join(self.store.directory, path)
+
+        created = not os.path.exists(full_path)
+        if created:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(self.file.name, full_path)
+        else:
+            os.remove(self.file.name)
+
+        self.store.add(key, url, path, sha256, self.size)
+        return path, created
+
+    def abort(self):
+        """受信を中断した場合に、一時ファイルを削除"""
+
+        self.file.close()
+        os.remove(self.file.name)
+
+
+class MediaStage(object):
+    """
+    scrapeデータの画像等のURLを、スレッドプールで並行してダウンロードするステージ
+
+    attribute:
+        self.download:
+            (key, url)を受け取り、(パス, 新たに保存したか)を返す関数
+            crawlerのセッション(コネクションプール、リクエスト頻度の制限等を共有)で受信
+
+        self.max_pending:
+            ダウンロード待ち/ダウンロード中のURLの上限数
+            上限に達した場合はsubmit()が待機し、未処理のURLが増え続けないように制御
+
+    Note
+        ParseStageと同様に、submit()はFutureを返す
+        crawlの終了時はshutdown()で残りのダウンロードの完了を待機(取消の場合は取消)
+    """
+
+    def __init__(self, download, max_workers=4, max_pending=None):
+        self.download = download
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_pending = max_pending or max_workers * 4
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+
+    def submit(self, key, url, is_alive=lambda: True):
+        """
+        ダウンロードを登録し、(パス, 新たに保存したか)のFutureを返す
+
+        Note
+            空きがない場合は待機し、待機中にis_aliveがFalseを返した場合はNoneを返す
+        """
+
+        # 取消操作に素早く反応できるよう、短い間隔に区切って待機
+        while not self.slots.acquire(timeout=0.2):
+            if not is_alive():
+                return None
+
+        future = self.executor.submit(self.download, key, url)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def shutdown(self, cancel=False):
+        """残りのダウンロードの完了を待機して終了(cancelの場合は未処理のものを取消)"""
+
+        self.executor.shutdown(cancel_futures=cancel)
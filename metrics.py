@@ -0,0 +1,233 @@
+from collections import defaultdict, deque
+import os
+import threading
+import time
+
+
+# スナップショットに含めるレイテンシのパーセンタイル
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    """昇順に並べた値から、pパーセンタイルの値を返す(nearest-rank法、値がない場合はNone)"""
+
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def format_latency(latency):
+    """レイテンシのパーセンタイル(秒)を、ミリ秒の文字列に変換"""
+
+    return ' / '.join(
+        f'{name} {latency[name] * 1000:.0f}ms'
+        for name in ('p50', 'p95', 'p99') if latency[name] is not None)
+
+
+class Metrics(object):
+    """
+    crawlのスループット、レイテンシ、キャッシュのヒット率等を記録
+
+    attribute:
+        self.window:
+            直近の1秒あたりのリクエスト数を算出する期間(秒)
+
+        self.latencies:
+            処理の段階(fetch/parse)ごとのレイテンシ(秒)
+            パーセンタイルは、直近のmax_samples件から算出
+
+        self.counters:
+            scrapeデータ数や失敗したページ数等の累計
+
+        self.gauges:
+            キューの長さ等の現在値(値、または値を返す関数)
+
+    Note
+        ワーカーのスレッドから記録し、GUIやPrometheusのファイル出力からsnapshot()で参照
+        記録はロックで排他制御し、パーセンタイルの計算等はsnapshot()の呼び出し時だけ行う
+    """
+
+    def __init__(self, window=10.0, max_samples=10000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+        self.cache_hits = 0
+        self.bytes_received = 0
+        self.status_codes = defaultdict(int)
+        # 直近window秒間のリクエストの時刻
+        self.request_times = deque()
+        self.latencies = {
+            'fetch': deque(maxlen=max_samples),
+            'parse': deque(maxlen=max_samples),
+        }
+        self.counters = defaultdict(int)
+        self.gauges = {}
+
+    def observe_request(self, seconds, status_code, from_cache, size):
+        """リクエスト1件分のレイテンシ、ステータスコード、受信したbodyのサイズを記録"""
+
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            self.status_codes[status_code] += 1
+            if from_cache:
+                self.cache_hits += 1
+            else:
+                self.bytes_received += size
+            self.latencies['fetch'].append(seconds)
+            self.request_times.append(now)
+            self.trim(now)
+
+    def observe(self, stage, seconds):
+        """fetch以外の段階(parse)のレイテンシを記録"""
+
+        with self.lock:
+            self.latencies[stage].append(seconds)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name, value):
+        """現在値を設定(関数の場合は、snapshot()の呼び出し時に値を取得)"""
+
+        self.gauges[name] = value
+
+    def trim(self, now):
+        """window秒より前のリクエストの時刻を削除(ロックを取得した状態で呼び出す)"""
+
+        while self.request_times and \
+                self.request_times[0] < now - self.window:
+            self.request_times.popleft()
+
+    def snapshot(self):
+        """現時点の各値をdictで返す"""
+
+        now = time.monotonic()
+        with self.lock:
+            self.trim(now)
+            elapsed = now - self.started
+            recent = len(self.request_times)
+            latencies = {
+                stage: sorted(values)
+                for stage, values in self.latencies.items()}
+            snapshot = {
+                'elapsed': elapsed,
+                'requests': self.requests,
+                # 開始直後は、1秒未満の経過時間で割って過大にならないよう1秒とみなす
+                'requests_per_second': recent / min(
+                    self.window, max(elapsed, 1.0)),
+                'cache_hits': self.cache_hits,
+                'cache_hit_ratio': (
+                    self.cache_hits / self.requests if self.requests else 0.0),
+                'bytes_received': self.bytes_received,
+                'status_codes': dict(self.status_codes),
+                'counters': dict(self.counters),
+            }
+
+        snapshot['latency'] = {
+            stage: dict(
+                count=len(values),
+                **{f'p{p}': percentile(values, p) for p in PERCENTILES})
+            for stage, values in latencies.items()
+        }
+        snapshot['gauges'] = {
+            name: value() if callable(value) else value
+            for name, value in list(self.gauges.items())
+        }
+        return snapshot
+
+
+def format_prometheus(snapshot, prefix='crawler'):
+    """スナップショットをPrometheusのテキスト形式に変換"""
+
+    lines = []
+
+    def metric(name, metric_type, samples):
+        lines.append(f'# TYPE {prefix}_{name} {metric_type}')
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+            if label_text:
+                label_text = '{' + label_text + '}'
+            lines.append(f'{prefix}_{name}{label_text} {value}')
+
+    metric('requests_total', 'counter', [({}, snapshot['requests'])])
+    metric('responses_total', 'counter', [
+        ({'status': status}, count)
+        for status, count in sorted(snapshot['status_codes'].items())])
+    metric('cache_hits_total', 'counter', [({}, snapshot['cache_hits'])])
+    metric('received_bytes_total', 'counter', [
+        ({}, snapshot['bytes_received'])])
+    metric('requests_per_second', 'gauge', [
+        ({}, round(snapshot['requests_per_second'], 3))])
+    metric('elapsed_seconds', 'gauge', [
+        ({}, round(snapshot['elapsed'], 3))])
+
+    samples = []
+    for stage, latency in snapshot['latency'].items():
+        for p in PERCENTILES:
+            samples.append((
+                {'stage': stage, 'quantile': p / 100}, latency[f'p{p}']))
+    metric('latency_seconds', 'summary', samples)
+    # summaryのサンプル数は、同じメトリクス名に_countを付けて出力
+    for stage, latency in snapshot['latency'].items():
+        lines.append(
+            f'{prefix}_latency_seconds_count{{stage="{stage}"}} '
+            f'{latency["count"]}')
+
+    for name, value in sorted(snapshot['counters'].items()):
+        metric(f'{name}_total', 'counter', [({}, value)])
+    for name, value in sorted(snapshot['gauges'].items()):
+        metric(name, 'gauge', [({}, value)])
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, metrics):
+    """
+    Prometheusのテキスト形式でファイルに出力
+
+    Note
+        node_exporterのtextfile collector等が書込み途中のファイルを読まないよう、
+        一時ファイルに書き込んでから置き換える
+    """
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(format_prometheus(metrics.snapshot()))
+    os.replace(tmp_path, path)
+
+
+class MetricsExporter(object):
+    """
+    crawl中に一定間隔で、Metricsをprometheusのテキスト形式でファイルに出力
+
+    attribute:
+        self.interval:
+            ファイルを更新する間隔(秒)
+    """
+
+    def __init__(self, metrics, path, interval=5.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            write_prometheus(self.path, self.metrics)
+
+    def stop(self):
+        """出力を終了し、最終的な値をファイルに出力"""
+
+        self.stopped.set()
+        self.thread.join()
+        write_prometheus(self.path, self.metrics)
@@ -0,0 +1,229 @@
+import re
+from urllib.parse import urljoin
+
+from lxml import etree
+import lxml.html
+
+
+# bytes/strどちらのレスポンスも同じparserで解析(bytesの場合はutf-8としてdecode)
+HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+
+
+def has_class(name):
+    """class属性に指定したクラス名を含む要素を抽出するXPathの条件式"""
+
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+def table_value(header):
+    """詳細ページのtableから、thに指定した文字列を含む行のtdを抽出するXPath"""
+
+    return (
+        f'string((//table)[1]//th[contains(., "{header}")]'
+        '/following-sibling::*[1][self::td])'
+    )
+
+
+STAR_RATING = {'One': 1, 'Two': 2, 'Three': 3, 'Four': 4, 'Five': 5}
+
+
+def parse_html(body):
+    """レスポンスのbody(str or bytes)をlxmlのドキュメントに変換"""
+
+    return lxml.html.document_fromstring(body, parser=HTML_PARSER)
+
+
+def first_value(result):
+    """XPathの結果(文字列 or 要素のリスト)を1つの文字列に変換"""
+
+    if isinstance(result, list):
+        return str(result[0]) if result else ''
+    return str(result)
+
+
+def extract_star_rating(value, url=None):
+    """scrapeデータの整形(star-ratingのclass属性「star-rating Three」から数字へ変換)"""
+
+    star_classes = value.split()
+    return convert_text_to_number(
+        star_classes[1] if len(star_classes) > 1 else '')
+
+
+def extract_stock(element, url=None):
+    """scrapeデータの整形(stock数の抽出)"""
+
+    if element:
+        m = re.search(r'In stock \((\d+) available\)', element)
+        if m:
+            return int(m.group(1))
+    return 0
+
+
+def convert_text_to_number(element):
+    """scrape後のデータ整形(テキストから数字へ変換)"""
+
+    return STAR_RATING.get(element, 0)
+
+
+# 通貨記号とISO 4217の通貨コード
+CURRENCY_SYMBOLS = {'£': 'GBP', '$': 'USD', '€': 'EUR', '¥': 'JPY'}
+
+
+def extract_price(value, url=None):
+    """scrapeデータの整形(「£51.77」等の価格から数値だけを抽出、ない場合はNone)"""
+
+    number = re.sub(r'[^\d.\-]', '', value)
+    return float(number) if number else None
+
+
+def extract_currency(value, url=None):
+    """scrapeデータの整形(価格の通貨記号を通貨コードに変換、未知の記号はそのまま)"""
+
+    m = re.match(r'\s*([^\d\s.,\-]+)', value)
+    if not m:
+        return None
+    return CURRENCY_SYMBOLS.get(m.group(1), m.group(1))
+
+
+# サイトのプロファイルで、各項目の整形に指定できる関数
+# 引数は(XPathで抽出した文字列, 詳細ページのURL)
+CONVERTERS = {
+    'text': lambda value, url: value,
+    'int': lambda value, url: int(value),
+    'url': lambda value, url: urljoin(url, value),
+    'star_rating': extract_star_rating,
+    'stock': extract_stock,
+    'price': extract_price,
+    'currency': extract_currency,
+}
+
+# 整形ごとの値の型(scrapeデータのスキーマとして、csv/sqlite/parquet等の出力で利用)
+CONVERTER_TYPES = {
+    'text': 'string',
+    'int': 'int',
+    'url': 'string',
+    'star_rating': 'int',
+    'stock': 'int',
+    'price': 'float',
+    'currency': 'string',
+}
+
+
+class SiteProfile(object):
+    """
+    サイトごとのcrawl/scrapeの設定(開始URL、一覧ページ/詳細ページのXPath)
+
+    attribute:
+        self.spec:
+            プロファイルの定義(json等で記述できるdict)
+                name: プロファイル名
+                start_urls: crawlerの開始URLのリスト
+                detail_page_urls: 一覧ページから各詳細ページのURLを抽出するXPath
+                next_page_url: 一覧ページから次ページのURLを抽出するXPath
+                category_urls: 各カテゴリの一覧ページのURLを抽出するXPath(省略可)
+                key: scrapeデータを識別する項目名(差分crawlで利用)
+                media: 画像等のダウンロードするURLの項目名(省略可)
+                fields: 項目名ごとのXPath、または{'xpath': XPath, 'convert': 整形}
+
+        self.fields:
+            項目名ごとの(コンパイル済みのXPath, 整形の関数)
+
+        self.schema:
+            scrapeデータの項目名と型(string/int/float)のリスト
+            型は整形から決まり、値がない場合はNone
+
+    Note
+        XPathはプロファイルの読み込み時に1回だけコンパイルし、各ページの解析で使い回す
+        scrapeデータの項目は、url、fieldsの定義順
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec['name']
+        self.start_urls = list(spec.get('start_urls', []))
+        self.key = spec.get('key', 'url')
+        self.media = spec.get('media')
+        self.detail_page_urls = etree.XPath(spec['detail_page_urls'])
+        self.next_page_url = etree.XPath(spec['next_page_url'])
+        self.category_urls = None
+        if spec.get('category_urls'):
+            self.category_urls = etree.XPath(spec['category_urls'])
+
+        self.fields = {}
+        self.schema = [('url', 'string')]
+        for name, field in spec['fields'].items():
+            if isinstance(field, str):
+                field = {'xpath': field}
+            converter = field.get('convert', 'text')
+            try:
+                convert = CONVERTERS[converter]
+            except KeyError:
+                raise ValueError(
+                    f'Unknown converter for {name}: {converter}')
+            self.fields[name] = (etree.XPath(field['xpath']), convert)
+            self.schema.append((name, CONVERTER_TYPES[converter]))
+
+    def listing_page(self, url, body):
+        """一覧ページのレスポンスを1回だけparse"""
+
+        return ListingPage(url, body, self)
+
+    def parse_detail_page(self, url, body):
+        """詳細ページのレスポンスから各コンテンツを抽出して整形"""
+
+        return self.extract(parse_html(body), url)
+
+    def extract(self, doc, url):
+        """parse済みの詳細ページから各コンテンツを抽出して整形"""
+
+        data = {'url': url}
+        for name, (xpath, convert) in self.fields.items():
+            data[name] = convert(first_value(xpath(doc)), url)
+        return data
+
+
+class ListingPage(object):
+    """
+    一覧ページのレスポンスを1回だけparseし、詳細ページ/次ページのURL抽出で共有
+
+    attribute:
+        self.url:
+            一覧ページのURL(相対URLを絶対URLに変換する際の基準)
+
+        self.doc:
+            parse済みのlxmlドキュメント
+
+        self.profile:
+            URL抽出のXPathを定義したサイトのプロファイル
+    """
+
+    def __init__(self, url, body, profile):
+        self.url = url
+        self.doc = parse_html(body)
+        self.profile = profile
+
+    def detail_page_urls(self):
+        """各詳細ページの絶対URLを抽出"""
+
+        return [
+            urljoin(self.url, str(href))
+            for href in self.profile.detail_page_urls(self.doc)
+        ]
+
+    def category_urls(self):
+        """サイドバー等から、各カテゴリの一覧ページの絶対URLを抽出"""
+
+        if self.profile.category_urls is None:
+            return []
+        return [
+            urljoin(self.url, str(href))
+            for href in self.profile.category_urls(self.doc)
+        ]
+
+    def next_page_url(self):
+        """次ページの絶対URLを抽出(次ページがない場合はNone)"""
+
+        href = first_value(self.profile.next_page_url(self.doc))
+        if not href:
+            return None
+        return urljoin(self.url, href)
@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor
+import threading
+
+from profiles import parse_detail_page, register_profile
+
+
+class ParseStage(object):
+    """
+    詳細ページのparse処理を、ネットワーク処理とは別のプロセスで実行するステージ
+
+    attribute:
+        self.executor(ProcessPoolExecutorオブジェクト):
+            parse処理を実行するプロセスプール
+            parse_detail_pageはモジュールのトップレベル関数のため、プロセス間で受け渡し可能
+            各プロセスの起動時に、サイトのプロファイルを登録(XPathのコンパイルは1回だけ)
+
+        self.max_pending:
+            parse待ち/parse中のレスポンスの上限数
+            上限に達した場合はsubmit()が待機することで、ワーカーのリクエストも止まり、
+            メモリ上に保持するレスポンスのbodyが一定数を超えないように制御(backpressure)
+
+    Note
+        submit()は結果ではなくFutureを返すため、呼び出し元はFutureを受け取った順
+        (ページ内の並び順)で結果を取り出すことで、parseの完了順に関わらず順番を維持
+    """
+
+    def __init__(self, processes, profile, max_pending=None):
+        self.profile_name = profile.name
+        self.executor = ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=register_profile,
+            initargs=(profile.spec,),
+        )
+        self.max_pending = max_pending or processes * 4
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+
+    def submit(self, url, body, is_alive=lambda: True):
+        """
+        レスポンスのbodyをプロセスプールに渡し、parse結果のFutureを返す
+
+        Note
+            空きがない場合は待機し、待機中にis_aliveがFalseを返した場合はNoneを返す
+        """
+
+        # 取消操作に素早く反応できるよう、短い間隔に区切って待機
+        while not self.slots.acquire(timeout=0.2):
+            if not is_alive():
+                return None
+
+        future = self.executor.submit(
+            parse_detail_page, url, body, self.profile_name)
+        # parseが完了したら(成功/失敗に関わらず)空きを1つ戻す
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def shutdown(self):
+        """未処理のparseを取消してプロセスプールを終了"""
+
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,100 @@
+import json
+
+from parsers import SiteProfile, has_class, table_value
+
+
+# 詳細ページの要素の位置は、以前のcssセレクター「article > div.row」等に合わせる
+CONTENTS = f'(//article/div[{has_class("row")}])[1]'
+
+# books.toscrape.com(デフォルトのプロファイル)
+BOOKS_TOSCRAPE = {
+    'name': 'books_toscrape',
+    'start_urls': [
+        'https://books.toscrape.com/'
+        'catalogue/category/books/fantasy_19/page-1.html',
+    ],
+    'detail_page_urls': '//h3/a/@href',
+    'next_page_url': f'(//li[{has_class("next")}]/a/@href)[1]',
+    # サイドバーのカテゴリ(全書籍の「Books」を除く各カテゴリ)
+    'category_urls': (
+        f'//div[{has_class("side_categories")}]/ul/li/ul/li/a/@href'),
+    'key': 'upc',
+    # 画像のダウンロード(media_dirを指定した場合)は表紙画像のURL
+    'media': 'image_url',
+    'fields': {
+        'title': f'string(({CONTENTS}//h1)[1])',
+        # 価格は数値とし、通貨は別の項目(通貨コード)に分ける
+        'price': {'xpath': table_value('excl'), 'convert': 'price'},
+        'currency': {'xpath': table_value('excl'), 'convert': 'currency'},
+        'star': {
+            'xpath': (
+                f'string(({CONTENTS}//div[{has_class("product_main")}]'
+                f'//p[{has_class("star-rating")}])[1]/@class)'),
+            'convert': 'star_rating',
+        },
+        'reviews': {'xpath': table_value('reviews'), 'convert': 'int'},
+        'stock': {'xpath': table_value('Availability'), 'convert': 'stock'},
+        'upc': table_value('UPC'),
+        # 画像は絶対URLに変換
+        'image_url': {
+            'xpath': (
+                f'string(({CONTENTS}//div[{has_class("item")}]/img)[1]'
+                '/@src)'),
+            'convert': 'url',
+        },
+    },
+}
+
+DEFAULT_PROFILE = BOOKS_TOSCRAPE['name']
+
+# プロファイル名ごとのSiteProfile(モジュール読み込み時に1回だけコンパイル)
+PROFILES = {}
+
+
+def register_profile(spec):
+    """プロファイルの定義(dict)をコンパイルして登録"""
+
+    profile = SiteProfile(spec)
+    PROFILES[profile.name] = profile
+    return profile
+
+
+def load_profile(path):
+    """jsonファイルに記述したプロファイルを読み込んで登録"""
+
+    with open(path, encoding='utf-8') as f:
+        return register_profile(json.load(f))
+
+
+def get_profile(profile=None):
+    """
+    プロファイル名、jsonファイルのパス、SiteProfileのいずれかからSiteProfileを返す
+
+    Note
+        Noneの場合はデフォルトのプロファイル
+    """
+
+    if isinstance(profile, SiteProfile):
+        return profile
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    if profile in PROFILES:
+        return PROFILES[profile]
+    if profile.endswith('.json'):
+        return load_profile(profile)
+    raise ValueError(f'Unknown site profile: {profile}')
+
+
+def parse_detail_page(url, body, profile_name=DEFAULT_PROFILE):
+    """
+    登録済みのプロファイルで詳細ページをparse
+
+    Note
+        モジュールのトップレベル関数のため、プロセスプールに渡すことが可能
+        子プロセスでは、register_profileをinitializerとしてプロファイルを登録
+    """
+
+    return PROFILES[profile_name].parse_detail_page(url, body)
+
+
+register_profile(BOOKS_TOSCRAPE)
@@ -0,0 +1,194 @@
+import asyncio
+import cProfile
+from functools import wraps
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+
+from parsers import parse_html
+
+
+# 計測するcrawlerの関数と、その処理の段階
+# (AsyncCrawlerのfetchはコルーチンのため、処理時間だけを計測)
+STAGE_METHODS = {
+    'try_request': 'fetch',
+    'fetch': 'fetch',
+    'scrape_detail_page_content': 'scrape',
+    'emit_records': 'write',
+    'output_file': 'write',
+}
+
+# 計測の詳細(Noneの場合は処理時間だけ)
+MODES = (None, 'cprofile', 'tracemalloc')
+
+
+class TimedProfile(object):
+    """
+    SiteProfileの詳細ページのparse処理を、parse(HTMLの解析)とextract(XPathの抽出)に分けて計測
+
+    Note
+        その他の属性/関数は、元のSiteProfileをそのまま参照
+    """
+
+    def __init__(self, profile, stage_profiler):
+        self.profile = profile
+        self.stage_profiler = stage_profiler
+
+    def parse_detail_page(self, url, body):
+        with self.stage_profiler.timed('parse'):
+            doc = parse_html(body)
+        with self.stage_profiler.timed('extract'):
+            return self.profile.extract(doc, url)
+
+    def __getattr__(self, name):
+        return getattr(self.profile, name)
+
+
+class StageProfiler(object):
+    """
+    crawlerの処理の段階(fetch/parse/extract/write)ごとの処理時間を計測
+
+    attribute:
+        self.mode:
+            None: 処理時間だけを計測
+            cprofile: 計測する関数の内部をcProfileで記録(スレッドごとに記録して集計)
+            tracemalloc: crawl全体のメモリ確保をtracemallocで記録
+
+        self.stages:
+            段階ごとの[呼び出し回数, 処理時間の合計(秒)]
+            複数のワーカーで並行して処理するため、合計は経過時間を超える場合がある
+
+    Note
+        attach()でcrawlerのインスタンスの関数を置き換えるため、crawlerのコードは変更しない
+        parse_processesを指定した場合、parse/extractは子プロセスで実行されるため計測しない
+    """
+
+    def __init__(self, mode=None):
+        if mode not in MODES:
+            raise ValueError(f'Unknown profiling mode: {mode}')
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.stages = {}
+        # cProfileの記録(スレッドごとに1つ)
+        self.local = threading.local()
+        self.profilers = []
+        self.snapshot = None
+        self.peak_memory = None
+
+    def attach(self, crawler):
+        """crawlerの各段階の関数を、計測する関数に置き換える"""
+
+        for name, stage in STAGE_METHODS.items():
+            method = getattr(crawler, name, None)
+            if method is not None:
+                setattr(crawler, name, self.wrap(stage, method))
+        crawler.profile = TimedProfile(crawler.profile, self)
+        return crawler
+
+    def wrap(self, stage, func):
+        """funcの処理時間を計測する関数を返す"""
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def timed_coroutine(*args, **kwargs):
+                with self.timed(stage):
+                    return await func(*args, **kwargs)
+            return timed_coroutine
+
+        @wraps(func)
+        def timed_function(*args, **kwargs):
+            with self.timed(stage):
+                return self.call(func, *args, **kwargs)
+        return timed_function
+
+    def call(self, func, *args, **kwargs):
+        """cprofileの場合は、呼び出したスレッドのcProfileで記録しながらfuncを実行"""
+
+        if self.mode != 'cprofile' or getattr(self.local, 'active', False):
+            return func(*args, **kwargs)
+
+        profiler = getattr(self.local, 'profiler', None)
+        if profiler is None:
+            profiler = self.local.profiler = cProfile.Profile()
+            with self.lock:
+                self.profilers.append(profiler)
+
+        self.local.active = True
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            self.local.active = False
+
+    def timed(self, stage):
+        return StageTimer(self, stage)
+
+    def add(self, stage, seconds):
+        with self.lock:
+            calls, total = self.stages.get(stage, (0, 0.0))
+            self.stages[stage] = (calls + 1, total + seconds)
+
+    def start(self):
+        """crawlの開始前に呼び出す(tracemallocの場合は記録を開始)"""
+
+        if self.mode == 'tracemalloc':
+            tracemalloc.start(10)
+
+    def stop(self):
+        """crawlの終了後に呼び出す(tracemallocの場合は記録を終了)"""
+
+        if self.mode == 'tracemalloc':
+            self.snapshot = tracemalloc.take_snapshot()
+            _, self.peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    def report(self, top=15):
+        """段階ごとの処理時間と、cProfile/tracemallocの上位top件を文字列で返す"""
+
+        lines = [
+            f'{"stage":<8} {"calls":>8} {"total":>10} {"mean":>10}',
+        ]
+        for stage, (calls, total) in self.stages.items():
+            lines.append(
+                f'{stage:<8} {calls:>8} {total:>9.3f}s '
+                f'{total / calls * 1000:>8.3f}ms')
+
+        if self.profilers:
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profilers[0], stream=stream)
+            for profiler in self.profilers[1:]:
+                stats.add(profiler)
+            stats.sort_stats('cumulative').print_stats(top)
+            lines.append(stream.getvalue())
+
+        if self.snapshot:
+            lines.append(
+                f'tracemalloc peak: {self.peak_memory / 1024 / 1024:.1f}MB')
+            for stat in self.snapshot.statistics('lineno')[:top]:
+                lines.append(str(stat))
+
+        return '\n'.join(lines)
+
+    def dump_stats(self, path):
+        """cProfileの記録をファイルに出力(snakeviz等で参照可能)"""
+
+        stats = pstats.Stats(self.profilers[0])
+        for profiler in self.profilers[1:]:
+            stats.add(profiler)
+        stats.dump_stats(path)
+
+
+class StageTimer(object):
+    """with文のブロックの処理時間を、StageProfilerの段階に加算"""
+
+    def __init__(self, stage_profiler, stage):
+        self.stage_profiler = stage_profiler
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stage_profiler.add(self.stage, time.perf_counter() - self.start)
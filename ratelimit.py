@@ -0,0 +1,243 @@
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from cachecontrol.adapter import CacheControlAdapter
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+
+from concurrency import is_overload_status
+
+
+class TokenBucket(object):
+    """
+    1ホスト分のトークンバケット
+
+    Note
+        トークンはrate(個/秒)で補充され、最大burst個まで貯まる
+        リクエストごとにトークンを1個消費し、不足している場合は補充されるまで待機
+        トークンは予約制(残数がマイナスになることを許容)のため、
+        複数のワーカーが同時に要求しても、送信時刻は1/rate秒間隔に分散される
+        rateがNone/0の場合はトークンを消費せず、Retry-Afterによる送信停止だけを反映
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # Retry-Afterにより、この時刻(time.monotonic基準)まで送信を停止
+        self.blocked_until = 0.0
+
+    def reserve(self, now):
+        """トークンを1個予約し、送信可能になるまでの秒数を返す"""
+
+        if not self.rate:
+            return max(0.0, self.blocked_until - now)
+
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+
+        delay = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(delay, self.blocked_until - now)
+
+
+class RateLimiter(object):
+    """
+    ホストごとのリクエスト頻度を、トークンバケットにより制限(複数のワーカーで共有)
+
+    attribute:
+        self.requests_per_second:
+            1ホストあたりの1秒間のリクエスト数の上限(None/0の場合は制限なし)
+            制限なしの場合も、Crawl-delayとRetry-Afterは反映
+
+        self.burst:
+            待機せずに連続して送信できるリクエスト数
+
+        self.jitter:
+            待機が必要な場合に、さらにランダムに加える最大秒数
+            (複数のワーカーの送信時刻が揃わないようにするため)
+
+        self.max_retry_after:
+            Retry-Afterにより送信を停止する秒数の上限(Transportのmax_backoffと同じ)
+
+    Note
+        robots.txtのCrawl-delay、429/503レスポンスのRetry-Afterも反映
+    """
+
+    def __init__(
+            self, requests_per_second=0.5, burst=1, jitter=0.5,
+            max_retry_after=60.0):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.jitter = jitter
+        self.max_retry_after = max_retry_after
+        self.lock = threading.Lock()
+        # ホスト名をkeyとしたトークンバケット
+        self.buckets = {}
+        # ホスト名をkeyとしたrobots.txtのCrawl-delay(秒)
+        self.crawl_delays = defaultdict(float)
+
+    def get_bucket(self, host):
+        """ホストのトークンバケットを取得(初回はCrawl-delayを反映して作成)"""
+
+        if host not in self.buckets:
+            rate = self.requests_per_second
+            burst = self.burst
+            crawl_delay = self.crawl_delays[host]
+            if crawl_delay:
+                rate = (
+                    1 / crawl_delay if not rate
+                    else min(rate, 1 / crawl_delay))
+                burst = 1
+            self.buckets[host] = TokenBucket(rate, burst)
+
+        return self.buckets[host]
+
+    def reserve(self, url):
+        """urlのホストに対してトークンを予約し、送信可能な時刻(time.monotonic基準)を返す"""
+
+        now = time.monotonic()
+        with self.lock:
+            delay = self.get_bucket(urlsplit(url).netloc).reserve(now)
+
+        if delay > 0 and self.jitter:
+            delay += random.uniform(0, self.jitter)
+        return now + delay
+
+    def acquire(self, url, is_alive=lambda: True):
+        """
+        送信可能な時刻まで待機してTrueを返す
+
+        Note
+            is_aliveがFalseを返した場合は待機を中断し、Falseを返す
+        """
+
+        slot = self.reserve(url)
+
+        # 取消操作に素早く反応できるよう、短い間隔に区切って待機
+        while is_alive():
+            remaining = slot - time.monotonic()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, 0.2))
+        return False
+
+    def set_crawl_delay(self, url, robots_txt, useragent='*'):
+        """robots.txtのCrawl-delayを、urlのホストに対する制限として反映"""
+
+        parser = RobotFileParser()
+        parser.parse(robots_txt.splitlines())
+        # parse()だけでは読み込み済みと判定されず、crawl_delay()がNoneを返すため
+        parser.modified()
+        crawl_delay = parser.crawl_delay(useragent)
+
+        if crawl_delay:
+            host = urlsplit(url).netloc
+            with self.lock:
+                self.crawl_delays[host] = float(crawl_delay)
+                # 作成済みのバケットは、次回のリクエスト時に作り直す
+                self.buckets.pop(host, None)
+
+        return crawl_delay
+
+    def update_from_response(self, url, status_code, headers):
+        """429/503レスポンスのRetry-Afterを、urlのホストに対する送信停止として反映"""
+
+        if status_code not in (429, 503):
+            return None
+
+        retry_after = self.parse_retry_after(headers.get('Retry-After'))
+        if retry_after is None:
+            return None
+        retry_after = min(retry_after, self.max_retry_after)
+
+        with self.lock:
+            bucket = self.get_bucket(urlsplit(url).netloc)
+            bucket.blocked_until = max(
+                bucket.blocked_until, time.monotonic() + retry_after)
+
+    def parse_retry_after(self, value):
+        """Retry-Afterの値(秒数 or HTTP日付)を秒数に変換"""
+
+        if not value:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    実際にネットワークへ送信するリクエストだけ、RateLimiterにより頻度を制限
+
+    Note
+        CacheControlAdapterと組み合わせた場合、キャッシュから返すレスポンスはこのsendを通らないため、
+        キャッシュヒット時は待機しない(詳細はRateLimitedCacheAdapterを参照)
+        concurrency(AdaptiveConcurrencyオブジェクト)を指定した場合は、
+        同時に送信するリクエスト数もその上限までに制限し、レイテンシと429/5xx/エラーを記録
+        pool_manager(urllib3のPoolManager)を指定した場合は、Adapterごとに作成せずに共有
+    """
+
+    def __init__(
+            self, *args, rate_limiter=None, is_alive=None, concurrency=None,
+            pool_manager=None, **kw):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.is_alive = is_alive or (lambda: True)
+        self.concurrency = concurrency
+        self.shared_pool_manager = pool_manager
+        super().__init__(*args, **kw)
+
+    def init_poolmanager(self, *args, **kw):
+        if self.shared_pool_manager is None:
+            super().init_poolmanager(*args, **kw)
+            return None
+        self.poolmanager = self.shared_pool_manager
+
+    def send(self, request, **kw):
+        # 送信数の上限に空きができてから、RateLimiterの送信時刻まで待機
+        # 待機中に取消を検知した場合は、送信せずに接続の失敗として扱う
+        if self.concurrency and not self.concurrency.acquire(self.is_alive):
+            raise ConnectionError('Cancelled before sending', request=request)
+        if not self.rate_limiter.acquire(request.url, self.is_alive):
+            if self.concurrency:
+                self.concurrency.release(None)
+            raise ConnectionError('Cancelled before sending', request=request)
+
+        started = time.monotonic()
+        # 接続の失敗/タイムアウト等の例外も、エラーとして記録
+        error = True
+        try:
+            resp = super().send(request, **kw)
+            error = is_overload_status(resp.status_code)
+        finally:
+            if self.concurrency:
+                self.concurrency.release(started, error)
+        self.rate_limiter.update_from_response(
+            request.url, resp.status_code, resp.headers)
+        return resp
+
+
+class RateLimitedCacheAdapter(CacheControlAdapter, RateLimitedAdapter):
+    """
+    CacheControlのキャッシュとRateLimiterを組み合わせたAdapter
+
+    Note
+        CacheControl(session, cache, adapter_class=...)で指定して使用
+        MROはCacheControlAdapter -> RateLimitedAdapter -> HTTPAdapterの順となり、
+        CacheControlAdapter.sendでキャッシュにない場合だけ、RateLimitedAdapter.sendが呼び出される
+    """
@@ -0,0 +1,149 @@
+from array import array
+
+
+# スキーマの型ごとの、arrayの型コード
+ARRAY_TYPECODES = {'int': 'q', 'float': 'd'}
+
+
+class Column(object):
+    """
+    scrapeデータの1項目分の値を、追記専用で保持する列
+
+    attribute:
+        self.values:
+            int/floatの列: array(1件あたり8bytes、値がNoneの場合は0を格納)
+            stringの列: 全件の値をutf-8で連結したbytearray(Arrowの文字列の列と同じ形式)
+            型の指定がない列: list
+
+        self.offsets:
+            stringの列で、各値のself.values内の終了位置(1件あたり8bytes)
+
+        self.valid:
+            型の指定がある列で、各値がNoneではないか(1件あたり1byte)
+
+    Note
+        型の合わない値を追記した場合は、型の指定がない列(list)に切り替えて保持
+    """
+
+    __slots__ = ('value_type', 'values', 'offsets', 'valid')
+
+    def __init__(self, value_type=None):
+        self.value_type = value_type
+        self.offsets = None
+        self.valid = None
+        if value_type == 'string':
+            self.values = bytearray()
+            self.offsets = array('q', [0])
+            self.valid = bytearray()
+        elif value_type in ARRAY_TYPECODES:
+            self.values = array(ARRAY_TYPECODES[value_type])
+            self.valid = bytearray()
+        else:
+            self.values = []
+
+    def append(self, value):
+        if self.valid is None:
+            self.values.append(value)
+            return None
+
+        try:
+            if self.offsets is None:
+                self.values.append(0 if value is None else value)
+            else:
+                if value is not None:
+                    self.values += value.encode('utf-8')
+                self.offsets.append(len(self.values))
+        except (AttributeError, TypeError, OverflowError):
+            self.values = self.to_list()
+            self.offsets = None
+            self.valid = None
+            self.values.append(value)
+            return None
+        self.valid.append(value is not None)
+
+    def __getitem__(self, index):
+        if self.valid is None:
+            return self.values[index]
+        if not self.valid[index]:
+            return None
+        if self.offsets is None:
+            return self.values[index]
+        return self.values[
+            self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+    def __len__(self):
+        if self.valid is None:
+            return len(self.values)
+        return len(self.valid)
+
+    def to_list(self):
+        """値のlist(Noneを含む)"""
+
+        if self.valid is None:
+            return list(self.values)
+        return [self[i] for i in range(len(self.valid))]
+
+
+class RecordColumns(object):
+    """
+    scrapeデータを項目ごとの列にまとめて保持する、追記専用のバッファ
+
+    attribute:
+        self.names:
+            項目名のタプル(スキーマの順番)
+
+        self.columns:
+            項目ごとのColumn
+
+    Note
+        scrapeデータ1件ごとのdictや、値ごとのstr/int/floatのオブジェクトを保持せず、
+        値だけを型ごとの連続したバッファに格納するため、
+        多数のデータをまとめて出力する場合のメモリ使用量を抑える
+        schemaがない場合は、最初のscrapeデータの項目を型の指定なしで使用
+        scrapeデータにない項目はNone、スキーマにない項目は保持しない
+    """
+
+    def __init__(self, schema=None):
+        self.names = None
+        self.columns = None
+        self.count = 0
+        if schema:
+            self.create_columns(schema)
+
+    def create_columns(self, schema):
+        self.names = tuple(name for name, _ in schema)
+        self.columns = [Column(value_type) for _, value_type in schema]
+
+    def append(self, record):
+        if self.columns is None:
+            self.create_columns([(name, None) for name in record])
+
+        for name, column in zip(self.names, self.columns):
+            column.append(record.get(name))
+        self.count += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return self.count
+
+    def rows(self):
+        """scrapeデータごとの値のタプル(項目はself.namesの順番)を返すジェネレータ"""
+
+        for i in range(self.count):
+            yield tuple(column[i] for column in self.columns)
+
+    def records(self):
+        """scrapeデータをdictに戻して1件ずつ返すジェネレータ"""
+
+        for row in self.rows():
+            yield dict(zip(self.names, row))
+
+    def to_pydict(self):
+        """項目名ごとの値のlistのdict(pyarrow.Table.from_pydict等で利用)"""
+
+        return {
+            name: column.to_list()
+            for name, column in zip(self.names or (), self.columns or ())}
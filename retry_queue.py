@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+
+
+# 失敗したページの種類
+LISTING_PAGE = 'listing'
+DETAIL_PAGE = 'detail'
+
+
+class RequestError(Exception):
+    """
+    リクエストの失敗(接続できない場合や、レスポンスのステータスコードがエラーの場合)
+
+    attribute:
+        self.url:
+            リクエストしたURL
+
+        self.status_code:
+            レスポンスのステータスコード(接続できなかった場合はNone)
+
+        self.retryable:
+            時間をおいて再試行すべきか
+            接続の失敗/タイムアウト、5xx/429の場合はTrue、404等のその他の4xxの場合はFalse
+    """
+
+    def __init__(self, url, status_code=None, reason=None, retryable=True):
+        self.url = url
+        self.status_code = status_code
+        self.retryable = retryable
+        if reason is None:
+            reason = f'Status code {status_code}'
+        super().__init__(f'[Request] {reason}')
+
+
+def check_status(url, status_code, retry_statuses):
+    """
+    ステータスコードがエラーの場合はRequestErrorをraise
+
+    Note
+        2xxと304(差分crawlの条件付きリクエスト)以外はエラー
+        retry_statuses(5xx/429等)に含まれる場合だけ、再試行の対象とする
+    """
+
+    if 200 <= status_code < 300 or status_code == 304:
+        return None
+    raise RequestError(
+        url, status_code, retryable=status_code in retry_statuses)
+
+
+def failed_pages_path(output_path):
+    """失敗したページの一覧(dead-letter)を出力するファイルパス"""
+
+    root, _ = os.path.splitext(output_path)
+    return f'{root}_failed.json'
+
+
+class RetryQueue(object):
+    """
+    失敗したページのURLを、時間をおいて再試行するまで保持
+
+    attribute:
+        self.max_attempts:
+            1ページあたりの試行回数の上限(最初のリクエストを含む)
+
+        self.delay:
+            最初の再試行までの待機時間(秒)、以降は再試行のたびに2倍
+
+        self.scheduled:
+            再試行を待つページ(URL、種類、試行回数、最後のエラー、再試行の時刻)のリスト
+
+        self.dead_letters:
+            再試行しても失敗した、または再試行の対象外のエラーで失敗したページのリスト
+
+    Note
+        複数のワーカーから登録されるため、ロックにより排他制御
+        再試行の時刻になったページは、crawlerが他のページと合わせて処理するため、
+        失敗したページがあってもcrawl全体の処理は止まらない
+    """
+
+    def __init__(self, max_attempts=3, delay=10.0):
+        self.max_attempts = max_attempts
+        self.delay = delay
+        self.lock = threading.Lock()
+        # URLごとの失敗した回数
+        self.attempts = {}
+        self.scheduled = []
+        self.dead_letters = []
+
+    @staticmethod
+    def describe(error):
+        """ログやdead-letterに記録するエラーの内容"""
+
+        if isinstance(error, RequestError):
+            return str(error)
+        return f'[Parse] {type(error).__name__}: {error}'
+
+    def push(self, url, kind, error):
+        """失敗したページを登録し、再試行する場合はTrue、断念した場合はFalseを返す"""
+
+        with self.lock:
+            attempts = self.attempts.get(url, 0) + 1
+            self.attempts[url] = attempts
+            entry = {
+                'url': url,
+                'kind': kind,
+                'attempts': attempts,
+                'status_code': getattr(error, 'status_code', None),
+                'error': self.describe(error),
+            }
+
+            if getattr(error, 'retryable', False) and \
+                    attempts < self.max_attempts:
+                entry['due'] = time.monotonic() + \
+                    self.delay * 2 ** (attempts - 1)
+                self.scheduled.append(entry)
+                return True
+
+            self.dead_letters.append(entry)
+            return False
+
+    def due(self, kind):
+        """再試行の時刻になったkindのページのURLを、登録順に取り出す"""
+
+        now = time.monotonic()
+        with self.lock:
+            urls = [
+                entry['url'] for entry in self.scheduled
+                if entry['kind'] == kind and entry['due'] <= now]
+            self.scheduled = [
+                entry for entry in self.scheduled
+                if not (entry['kind'] == kind and entry['due'] <= now)]
+        return urls
+
+    def next_due(self):
+        """次に再試行するページの時刻(time.monotonic()の値、ない場合はNone)"""
+
+        with self.lock:
+            return min(
+                (entry['due'] for entry in self.scheduled), default=None)
+
+    def abandon(self):
+        """取消等により再試行できなかったページを、失敗したページとして記録"""
+
+        with self.lock:
+            for entry in self.scheduled:
+                del entry['due']
+                self.dead_letters.append(entry)
+            self.scheduled = []
+
+    def write_report(self, path):
+        """失敗したページの一覧をjsonファイルに出力"""
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.dead_letters, f, ensure_ascii=False, indent=2)
+
+    def __len__(self):
+        return len(self.scheduled)
@@ -0,0 +1,233 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from cachecontrol.cache import BaseCache
+
+# zstdによる圧縮はzstandardがインストールされている場合のみ利用可能
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def encode_key(key):
+    """
+    キャッシュのkey(URL)をハッシュ値に変換
+
+    Note
+        FileCacheのファイル名と同じ形式のため、既存の.webcacheもそのまま取り込める
+    """
+
+    return hashlib.sha224(key.encode()).hexdigest()
+
+
+class SQLiteCache(BaseCache):
+    """
+    CacheControl用のキャッシュを、1つのSQLiteファイルにまとめて保存
+
+    attribute:
+        self.max_size:
+            保存するレスポンスの合計サイズ(圧縮後のbytes)の上限
+            上限を超えた場合は、最後に参照された日時が古いものから削除(LRU)
+
+        self.ttl:
+            保存してからの有効期間(秒)、Noneの場合は期間の制限なし
+            HTTPヘッダーによる有効期限とは別に、期間を過ぎたものは参照時に削除
+
+        self.compression:
+            レスポンスの圧縮形式('gzip', 'zstd', None)
+
+        self.accessed:
+            参照日時をテーブルへ未反映のkeyと、その参照日時
+            キャッシュヒットのたびにUPDATE/commitせず、保存/削除の時点か
+            self.flush_interval件ごとにまとめて反映(LRUの判定は反映後の参照日時)
+
+    Note
+        FileCacheのように1レスポンス1ファイルではなく、keyにインデックスを持つ1つのテーブルに保存
+        複数のワーカー(スレッド)から利用するため、接続は共有してロックで排他制御
+    """
+
+    def __init__(
+            self, path, max_size=200 * 1024 * 1024, ttl=None,
+            compression='gzip', flush_interval=100):
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstd compression requires zstandard')
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.compression = compression
+        self.flush_interval = flush_interval
+        self.accessed = {}
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                codec TEXT,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+        ''')
+        self.conn.commit()
+
+        # 保存済みのレスポンスの合計サイズ(削除の判定のため、メモリ上で管理)
+        self.total_size = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def get(self, key):
+        key = encode_key(key)
+        now = time.time()
+
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT value, codec, size, created FROM entries '
+                'WHERE key = ?',
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, codec, size, created = row
+            # 有効期間を過ぎたものは削除
+            if self.ttl is not None and now - created > self.ttl:
+                self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.conn.commit()
+                self.accessed.pop(key, None)
+                self.total_size -= size
+                return None
+
+            # LRUのため参照日時を記録(テーブルへはまとめて反映)
+            self.accessed[key] = now
+            if len(self.accessed) >= self.flush_interval:
+                self.flush_accessed()
+                self.conn.commit()
+
+        return self.decompress(value, codec)
+
+    def set(self, key, value, expires=None):
+        self.set_encoded(encode_key(key), value)
+
+    def set_encoded(self, key, value):
+        """ハッシュ値に変換済みのkeyでレスポンスを保存"""
+
+        codec, data = self.compress(value)
+        now = time.time()
+
+        with self.lock:
+            # 削除の判定の前に、未反映の参照日時を反映
+            self.accessed.pop(key, None)
+            self.flush_accessed()
+            row = self.conn.execute(
+                'SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            if row:
+                self.total_size -= row[0]
+
+            self.conn.execute(
+                'INSERT OR REPLACE INTO entries '
+                '(key, value, codec, size, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, data, codec, len(data), now, now),
+            )
+            self.total_size += len(data)
+
+            if self.total_size > self.max_size:
+                self.evict()
+            self.conn.commit()
+
+    def delete(self, key):
+        key = encode_key(key)
+
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self.conn.commit()
+            self.accessed.pop(key, None)
+            self.total_size -= row[0]
+
+    def flush_accessed(self):
+        """
+        未反映の参照日時をテーブルに反映
+
+        Note
+            呼び出し元でロックを取得し、commitする前提
+        """
+
+        if not self.accessed:
+            return None
+        self.conn.executemany(
+            'UPDATE entries SET accessed = ? WHERE key = ?',
+            [(accessed, key) for key, accessed in self.accessed.items()])
+        self.accessed.clear()
+
+    def evict(self):
+        """
+        最後に参照された日時が古いものから、合計サイズが上限の9割以下になるまで削除
+
+        Note
+            削除のたびに上限付近で削除を繰り返さないよう、1割の余裕を持たせる
+            呼び出し元でロックを取得している前提
+        """
+
+        target = self.max_size * 0.9
+        rows = self.conn.execute(
+            'SELECT key, size FROM entries ORDER BY accessed')
+
+        expired = []
+        for key, size in rows:
+            if self.total_size <= target:
+                break
+            expired.append((key,))
+            self.total_size -= size
+
+        self.conn.executemany('DELETE FROM entries WHERE key = ?', expired)
+
+    def compress(self, value):
+        """設定した形式でレスポンスを圧縮し、(圧縮形式, 圧縮後のbytes)を返す"""
+
+        if self.compression == 'gzip':
+            return 'gzip', zlib.compress(value)
+        if self.compression == 'zstd':
+            return 'zstd', zstandard.ZstdCompressor().compress(value)
+        return None, value
+
+    def decompress(self, value, codec):
+        """保存時の圧縮形式に応じてレスポンスを展開"""
+
+        if codec == 'gzip':
+            return zlib.decompress(value)
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ImportError('zstd compression requires zstandard')
+            return zstandard.ZstdDecompressor().decompress(value)
+        return value
+
+    def import_file_cache(self, directory):
+        """FileCacheのディレクトリ(.webcache等)のレスポンスを取り込み、件数を返す"""
+
+        count = 0
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                with open(os.path.join(root, file_name), 'rb') as f:
+                    # FileCacheのファイル名は、keyをencode_keyと同じ方法で変換したもの
+                    self.set_encoded(file_name, f.read())
+                count += 1
+        return count
+
+    def close(self):
+        with self.lock:
+            self.flush_accessed()
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,52 @@
+import os
+import signal
+import tempfile
+import time
+import unittest
+from concurrent.futures import BrokenExecutor
+
+from async_crawler import AsyncCrawler
+from benchmarks.local_site import LocalSiteServer, SyntheticSite
+from sqlite_cache import SQLiteCache
+
+
+class ParseWorkerKilledTest(unittest.TestCase):
+    """parse処理のプロセスが強制終了した場合、asyncioのcrawlerもcrawlを終了"""
+
+    def test_broken_process_pool_stops_crawl(self):
+        site = SyntheticSite(1, 10, 20)
+        with LocalSiteServer(site, latency=0.01) as server, \
+                tempfile.TemporaryDirectory() as work_dir:
+            crawler = AsyncCrawler(
+                site.start_url(server.base_url), max_workers=10,
+                requests_per_second=None, parse_processes=2,
+                cache=SQLiteCache(os.path.join(work_dir, 'cache.sqlite3')),
+                checkpoint_path=os.path.join(work_dir, 'checkpoint.sqlite3'),
+                incremental_path=os.path.join(
+                    work_dir, 'incremental.sqlite3'),
+            )
+            crawler.use_log_queue = False
+            crawler.output_path = os.path.join(work_dir, 'result.ndjson')
+            crawler.start_crawler_thread()
+
+            # parseが始まってから、プロセスプールのプロセスを1つ強制終了
+            deadline = time.monotonic() + 30
+            while time.monotonic() < deadline:
+                stage = getattr(crawler, 'parse_stage', None)
+                processes = stage and stage.executor._processes
+                writer = getattr(crawler, 'writer', None)
+                if processes and writer and writer.count:
+                    os.kill(next(iter(processes)), signal.SIGKILL)
+                    break
+                time.sleep(0.01)
+            crawler.crawler_thread.join(30)
+
+            self.assertFalse(crawler.crawler_thread.is_alive())
+            self.assertIsInstance(crawler.error, BrokenExecutor)
+            # 残りの詳細ページは、失敗したページとして扱わない
+            self.assertFalse(crawler.retry_queue.dead_letters)
+            self.assertLess(crawler.writer.count, site.book_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
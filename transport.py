@@ -0,0 +1,196 @@
+import time
+
+from urllib3 import PoolManager
+from urllib3.exceptions import HTTPError, MaxRetryError
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+
+class CancellableRetry(Retry):
+    """
+    再試行までの待機をmax_backoff秒までに制限し、待機中も取消を検知するurllib3のRetry
+
+    Note
+        urllib3のRetryはHTTPAdapter.send()の中でtime.sleep()するため、
+        Retry-Afterが長い場合は取消やGUIの終了まで待機し続ける
+        待機は短い間隔に区切り、is_aliveがFalseを返した場合は再試行せずに
+        MaxRetryError(requestsではConnectionError)として終了
+    """
+
+    def __init__(self, *args, max_backoff=60.0, is_alive=None, **kw):
+        self.max_backoff = max_backoff
+        self.is_alive = is_alive or (lambda: True)
+        super().__init__(*args, **kw)
+
+    def new(self, **kw):
+        # 再試行ごとに作成し直すRetryにも、上限と取消の検知を引き継ぐ
+        retry = super().new(**kw)
+        retry.max_backoff = self.max_backoff
+        retry.is_alive = self.is_alive
+        return retry
+
+    def sleep(self, response=None):
+        delay = None
+        if self.respect_retry_after_header and response:
+            delay = self.get_retry_after(response)
+        if delay is None:
+            delay = self.get_backoff_time()
+
+        deadline = time.monotonic() + min(delay, self.max_backoff)
+        # 取消操作に素早く反応できるよう、短い間隔に区切って待機
+        while self.is_alive():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(remaining, 0.2))
+
+        url = self.history[-1].url if self.history else None
+        raise MaxRetryError(None, url, HTTPError('Cancelled before retry'))
+
+
+class Transport(object):
+    """
+    HTTPの接続に関する設定(コネクションプール、タイムアウト、再試行)
+
+    attribute:
+        self.pool_maxsize:
+            ホストごとに保持するコネクション数の上限
+            Noneの場合は、crawlerのワーカー数+2(一覧ページの先行リクエスト等の分)
+            複数のcrawlerで共有する場合は、各crawlerの分の合計
+
+        self.pool_manager:
+            requestsのcrawlerが使用するurllib3のPoolManager(最初のcrawlerの作成時に作成)
+            同じTransportを渡したcrawler同士で共有し、確立したコネクションを相互に再利用
+
+        self.connect_timeout/self.read_timeout:
+            接続の確立/レスポンスの受信をそれぞれ待機する秒数
+
+        self.retries:
+            5xx/429のレスポンスや、接続の切断/タイムアウトの場合に再試行する回数
+
+        self.backoff_factor:
+            再試行までの待機時間の係数(backoff_factor * 2 ** (再試行の回数 - 1)秒)
+            429/503でRetry-Afterがある場合は、その秒数を優先
+
+        self.max_backoff:
+            再試行までの待機時間の上限(秒)、Retry-Afterの秒数もこの上限まで
+
+    Note
+        requestsのcrawlerでは、urllib3のRetryとしてHTTPAdapterに組み込む
+        asyncioのcrawlerでは、同じ設定でfetch()の中で再試行
+        asyncioのcrawlerのコネクションは、crawlerごとのイベントループに属するため共有しない
+    """
+
+    # 再試行するステータスコード
+    status_forcelist = (429, 500, 502, 503, 504)
+
+    def __init__(
+            self, pool_maxsize=None, connect_timeout=3.5, read_timeout=10.0,
+            retries=3, backoff_factor=0.5, max_backoff=60.0):
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.pool_manager = None
+
+    @property
+    def timeout(self):
+        """requestsに渡す(接続, 受信)のタイムアウト"""
+
+        return (self.connect_timeout, self.read_timeout)
+
+    @property
+    def headers(self):
+        """
+        sessionに設定するヘッダー
+
+        Note
+            圧縮はurllib3が展開できる形式を明示(brotliがインストールされている場合はbrも含む)
+        """
+
+        return {'Accept-Encoding': ACCEPT_ENCODING}
+
+    def retry(self, is_alive=None):
+        """HTTPAdapterに渡すurllib3のRetry(is_aliveがFalseを返した場合は待機を中断)"""
+
+        return CancellableRetry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.status_forcelist,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            # 再試行しても失敗した場合は、例外ではなく最後のレスポンスを返す
+            raise_on_status=False,
+            max_backoff=self.max_backoff,
+            is_alive=is_alive,
+        )
+
+    def shared_pool_manager(self, max_workers):
+        """
+        crawler間で共有するPoolManagerを返す(ワーカー数の分だけコネクション数の上限を追加)
+
+        Note
+            ホストごとのコネクションプールは最初のリクエストの時点で作成するため、
+            crawlを開始する前に全crawlerを作成すれば、上限は全crawlerの合計
+        """
+
+        maxsize = self.pool_maxsize or max_workers + 2
+        if self.pool_manager is None:
+            self.pool_manager = PoolManager(maxsize=maxsize)
+        elif not self.pool_maxsize:
+            self.pool_manager.connection_pool_kw['maxsize'] += maxsize
+        return self.pool_manager
+
+    def adapter_kwargs(self, max_workers, is_alive=None):
+        """HTTPAdapterのコネクションプール(共有)と再試行の設定"""
+
+        return {
+            'pool_manager': self.shared_pool_manager(max_workers),
+            'max_retries': self.retry(is_alive),
+        }
+
+    def backoff(self, attempt):
+        """attempt回目の再試行までの待機時間(asyncioのcrawler用)"""
+
+        return min(self.backoff_factor * 2 ** (attempt - 1), self.max_backoff)
+
+    def retry_delay(self, attempt, retry_after=None):
+        """
+        attempt回目の再試行までの待機時間(asyncioのcrawler用)
+
+        Note
+            Retry-Afterの秒数がある場合はそれを優先し、いずれもmax_backoffが上限
+        """
+
+        if retry_after is None:
+            return self.backoff(attempt)
+        return min(retry_after, self.max_backoff)
+
+
+def pool_stats(session):
+    """
+    sessionのコネクションプールの(新たに確立したコネクション数, 送信したリクエスト数)
+
+    Note
+        リクエスト数からコネクション数を引いた分が、確立済みのコネクションを再利用した回数
+        (TCP/TLSのハンドシェイクを省略できた回数)
+        PoolManagerを共有している場合は、共有している全crawlerの合計
+    """
+
+    connections = sent = 0
+    managers = {
+        id(adapter.poolmanager): adapter.poolmanager
+        for adapter in session.adapters.values()}
+    for manager in managers.values():
+        pools = manager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            sent += pool.num_requests
+    return connections, sent
@@ -0,0 +1,366 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+
+from records import RecordColumns
+
+
+class StreamWriter(object):
+    """
+    scrapeデータを1件ずつファイルに追記する出力処理の基底クラス
+
+    attribute:
+        self.count:
+            出力済みのscrapeデータ数
+
+        self.fsync_interval:
+            何件出力するごとにos.fsync()でディスクへの書込みを確定させるか
+            (アプリの強制終了等があっても、それまでのデータが失われないようにするため)
+
+        self.schema:
+            scrapeデータの項目名と型(string/int/float)のリスト(SiteProfile.schema)
+            Noneの場合は、最初のscrapeデータの項目から決める
+
+    Note
+        scrapeデータはメモリ上に保持しないため、crawlの規模に関わらずメモリ使用量は一定
+        withブロックで使用すると、ブロックを抜けたタイミングでファイルを閉じる
+    """
+
+    def __init__(self, path, fsync_interval=100, schema=None, overwrite=False):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.schema = schema
+        self.count = 0
+        self.file = open(path, 'wb')
+        self.open()
+
+    def open(self):
+        """ファイルを開いた直後の処理(サブクラスで必要に応じてオーバーライド)"""
+
+        pass
+
+    def write(self, record):
+        """scrapeデータ1件を追記"""
+
+        self.append(self.encode(record))
+        self.count += 1
+
+        self.file.flush()
+        if self.count % self.fsync_interval == 0:
+            os.fsync(self.file.fileno())
+
+    def write_many(self, records):
+        """複数のscrapeデータを順番に追記"""
+
+        for record in records:
+            self.write(record)
+
+    def encode(self, record):
+        """scrapeデータ1件をbytesに変換(非ascii文字はエスケープしない)"""
+
+        return json.dumps(record, ensure_ascii=False).encode('utf-8')
+
+    def append(self, data):
+        """変換済みのscrapeデータをファイルに書込み(サブクラスで定義)"""
+
+        raise NotImplementedError
+
+    def close(self):
+        """ディスクへの書込みを確定させてファイルを閉じる"""
+
+        if self.file.closed:
+            return None
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NdjsonWriter(StreamWriter):
+    """1行に1件のjsonを出力(NDJSON形式)"""
+
+    def append(self, data):
+        self.file.write(data + b'\n')
+
+
+class JsonArrayWriter(StreamWriter):
+    """
+    scrapeデータの配列をjson形式で出力
+
+    Note
+        1件追記するごとに配列の閉じ括弧「]」まで書込み、次の追記時はその直前から上書き
+        そのため、取消やエラーにより途中で終了した場合でも、ファイルは常に正しいjson形式
+    """
+
+    def open(self):
+        self.file.write(b'[]')
+
+    def append(self, data):
+        # 末尾の「]」を上書きして追記し、再び「]」で閉じる
+        self.file.seek(-1, os.SEEK_END)
+        separator = b',\n' if self.count else b''
+        self.file.write(separator + data + b']')
+
+
+class CsvWriter(StreamWriter):
+    """
+    1行に1件のscrapeデータをcsv形式で出力(1行目は項目名)
+
+    Note
+        Excelで文字化けしないよう、BOM付きのutf-8で出力
+        スキーマにない項目は出力せず、値がない項目は空欄
+    """
+
+    def open(self):
+        self.file.write('\ufeff'.encode('utf-8'))
+        self.fieldnames = None
+        if self.schema:
+            self.write_header([name for name, _ in self.schema])
+
+    def write_header(self, fieldnames):
+        self.fieldnames = fieldnames
+        self.file.write(self.format_row(fieldnames))
+
+    @staticmethod
+    def format_row(values):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerow(values)
+        return buffer.getvalue().encode('utf-8')
+
+    def encode(self, record):
+        if self.fieldnames is None:
+            self.write_header(list(record))
+        return self.format_row(
+            [record.get(name) for name in self.fieldnames])
+
+    def append(self, data):
+        self.file.write(data)
+
+
+class BatchWriter(object):
+    """
+    scrapeデータをbatch_size件ずつまとめて出力する処理の基底クラス(sqlite、parquet)
+
+    attribute:
+        self.count:
+            出力済み(出力待ちを含む)のscrapeデータ数
+
+        self.batch_size:
+            まとめて出力するscrapeデータ数
+
+    Note
+        write_many()は1ページ分のscrapeデータを渡されるため、件数が少なくても
+        batch_sizeに達するまでは出力しない(close()の呼び出し時に残りを出力)
+        出力待ちのscrapeデータは、dictではなく項目ごとの列(RecordColumns)で保持
+        StreamWriterと同じく、withブロックで使用可能
+    """
+
+    batch_size = 1000
+
+    def __init__(self, path, fsync_interval=100, schema=None, overwrite=False):
+        self.path = path
+        self.schema = schema
+        self.overwrite = overwrite
+        self.count = 0
+        self.batch = RecordColumns(schema)
+        self.closed = False
+        self.open()
+
+    def open(self):
+        pass
+
+    def write(self, record):
+        self.write_many([record])
+
+    def write_many(self, records):
+        for record in records:
+            self.batch.append(record)
+            self.count += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """出力待ちのscrapeデータをまとめて出力"""
+
+        if len(self.batch):
+            batch = self.batch
+            # スキーマがない場合は、最初のscrapeデータの項目を以降も使用
+            self.batch = RecordColumns(
+                self.schema or [(name, None) for name in batch.names])
+            self.write_batch(batch)
+
+    def write_batch(self, batch):
+        """RecordColumnsにまとめたscrapeデータを出力(サブクラスで定義)"""
+
+        raise NotImplementedError
+
+    def close(self):
+        if self.closed:
+            return None
+        self.closed = True
+        self.flush()
+        self.finish()
+
+    def finish(self):
+        """残りを出力した後の終了処理(サブクラスで定義)"""
+
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# スキーマの型ごとの、sqliteの列の型
+SQLITE_TYPES = {'string': 'TEXT', 'int': 'INTEGER', 'float': 'REAL'}
+
+
+class SQLiteWriter(BatchWriter):
+    """
+    scrapeデータをsqliteのrecordsテーブルに出力
+
+    Note
+        1ページ分のscrapeデータごとに、executemany()でまとめて挿入してcommit
+        (強制終了等があっても、commit済みのデータは失われない)
+        ファイルには他のテーブル等もあり得るため、既存のrecordsテーブルがある場合は
+        ValueErrorとし、overwriteがTrueの場合だけ作成し直して上書き
+    """
+
+    batch_size = 1
+    table = 'records'
+
+    def open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.columns = None
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (self.table,)).fetchone()
+        if exists and not self.overwrite:
+            self.conn.close()
+            raise ValueError(
+                f'Output file {self.path} already has a {self.table} table '
+                '(overwrite is not enabled)')
+        if self.schema:
+            self.create_table(self.schema)
+
+    def create_table(self, schema):
+        self.columns = [name for name, _ in schema]
+        definitions = ', '.join(
+            f'"{name}" {SQLITE_TYPES.get(value_type, "")}'.rstrip()
+            for name, value_type in schema)
+        with self.conn:
+            self.conn.execute(f'DROP TABLE IF EXISTS {self.table}')
+            self.conn.execute(f'CREATE TABLE {self.table} ({definitions})')
+
+    def write_batch(self, batch):
+        if self.columns is None:
+            # スキーマがない場合は、列の型を指定しない
+            self.create_table([(name, None) for name in batch.names])
+        placeholders = ', '.join('?' for _ in self.columns)
+        with self.conn:
+            self.conn.executemany(
+                f'INSERT INTO {self.table} VALUES ({placeholders})',
+                batch.rows())
+
+    def finish(self):
+        self.conn.close()
+
+
+class ParquetWriter(BatchWriter):
+    """
+    scrapeデータをparquet形式で出力(pyarrowが必要)
+
+    Note
+        batch_size件ごとに1つのrow groupとして書き込むため、メモリ上に保持するのは最大batch_size件
+        parquetはファイルの末尾にメタデータを書き込む形式のため、
+        強制終了等によりclose()されなかった場合、ファイルは読み込めない
+    """
+
+    batch_size = 10000
+
+    def open(self):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError(
+                'Output format parquet requires pyarrow '
+                '(pip install pyarrow)')
+
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.writer = None
+        self.arrow_schema = None
+        if self.schema:
+            types = {
+                'string': pyarrow.string(),
+                'int': pyarrow.int64(),
+                'float': pyarrow.float64(),
+            }
+            self.arrow_schema = pyarrow.schema([
+                (name, types[value_type])
+                for name, value_type in self.schema])
+
+    def write_batch(self, batch):
+        table = self.pa.Table.from_pydict(
+            batch.to_pydict(), schema=self.arrow_schema)
+        if self.writer is None:
+            # スキーマがない場合は、最初のrow groupの型を以降も使用
+            self.arrow_schema = table.schema
+            self.writer = self.pq.ParquetWriter(self.path, self.arrow_schema)
+        self.writer.write_table(table)
+
+    def finish(self):
+        if self.writer is None:
+            # scrapeデータがない場合も、読み込み可能な空のファイルを作成
+            if self.arrow_schema is None:
+                return None
+            self.writer = self.pq.ParquetWriter(self.path, self.arrow_schema)
+        self.writer.close()
+
+
+# 拡張子に応じた出力形式
+WRITERS = {
+    '.json': JsonArrayWriter,
+    '.ndjson': NdjsonWriter,
+    '.jsonl': NdjsonWriter,
+    '.csv': CsvWriter,
+    '.sqlite': SQLiteWriter,
+    '.sqlite3': SQLiteWriter,
+    '.db': SQLiteWriter,
+    '.parquet': ParquetWriter,
+}
+
+
+def open_writer(
+        path, output_format=None, fsync_interval=100, schema=None,
+        overwrite=False):
+    """
+    出力先のファイルパスの拡張子に応じて、出力処理のインスタンスを作成
+
+    Note
+        output_format('json', 'ndjson'等)を指定した場合は、拡張子に関わらずその形式で出力
+        schemaを指定した場合、csv/sqlite/parquetの列と型はその順番/型で出力
+        overwriteは、sqliteのファイルに既存のrecordsテーブルがある場合に上書きするか
+    """
+
+    if output_format:
+        ext = '.' + output_format.lower().lstrip('.')
+    else:
+        ext = os.path.splitext(path)[1].lower()
+    try:
+        writer_class = WRITERS[ext]
+    except KeyError:
+        raise ValueError(f'Unsupported output format: {ext}')
+
+    return writer_class(path, fsync_interval, schema, overwrite)